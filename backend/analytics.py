@@ -0,0 +1,291 @@
+"""
+Trend and forecast analytics for weight series.
+
+A series is loaded once into NumPy arrays of day ordinals and weights, and
+every statistic is an array expression over them:
+- EWMA smoothing with a half-life in days (irregular gaps are weighted by
+  elapsed time, not by entry count);
+- rolling 7/30-day averages;
+- weekly means and their week-over-week change;
+- a robust linear trend (Huber-weighted least squares) giving the weekly
+  rate and a projected date for reaching the goal weight;
+- plateau detection: a near-flat fit over the last few weeks.
+
+The coach-level variant loads all of a user's clients in one query, sorted
+by client, and computes the same figures for every client at once with
+np.add.reduceat over each client's slice of the concatenated arrays.
+"""
+import math
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import String, cast
+from models import db, Client, WeightEntry
+from serialization import fetch_raw
+
+DEFAULT_WINDOW_DAYS = 180
+MAX_WINDOW_DAYS = 3650
+DEFAULT_HALFLIFE_DAYS = 7.0
+ROLLING_WINDOWS = (7, 30)
+
+# Huber tuning constant and IRLS passes for the robust trend
+HUBER_K = 1.345
+ROBUST_ITERATIONS = 5
+
+# A plateau is a fit over the last PLATEAU_DAYS that moves less than this
+PLATEAU_DAYS = 21
+PLATEAU_MIN_ENTRIES = 5
+PLATEAU_RATE_PER_WEEK = 0.2
+
+# Don't project goal dates further out than this
+MAX_FORECAST_DAYS = 3 * 365
+
+
+def parse_args(args):
+    """Read days, halflife and goal from query args; raises ValueError with a message"""
+    try:
+        days = int(args.get('days', DEFAULT_WINDOW_DAYS))
+        halflife = float(args.get('halflife', DEFAULT_HALFLIFE_DAYS))
+        goal = float(args['goal']) if args.get('goal') else None
+    except ValueError:
+        raise ValueError('days, halflife and goal must be numbers')
+    if not 1 <= days <= MAX_WINDOW_DAYS:
+        raise ValueError(f'days must be between 1 and {MAX_WINDOW_DAYS}')
+    if not 0 < halflife <= MAX_WINDOW_DAYS:
+        raise ValueError('halflife must be a positive number of days')
+    return days, halflife, goal
+
+
+def window_start(days, today=None):
+    return (today or date.today()) - timedelta(days=days - 1)
+
+
+# date(1970, 1, 1).toordinal(), to turn datetime64 days into date ordinals
+EPOCH_ORDINAL = 719163
+
+
+def _entry_rows(*criteria):
+    # Dates come back as 'YYYY-MM-DD' strings and are parsed by numpy in one
+    # call, which is much cheaper than building a date object per row
+    return db.session.query(WeightEntry.client_id, cast(WeightEntry.date, String), WeightEntry.weight) \
+        .filter(*criteria)
+
+
+def _to_arrays(rows):
+    """(client_id, 'YYYY-MM-DD', weight) rows -> (ids, day ordinals, weights) arrays"""
+    if not rows:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+    return (np.array([row[0] for row in rows], dtype=np.int64),
+            np.array([row[1] for row in rows], dtype='datetime64[D]').astype(np.int64) + EPOCH_ORDINAL,
+            np.array([row[2] for row in rows], dtype=np.float64))
+
+
+def load_client(client_id, since):
+    """One client's entries from `since` on, sorted by date"""
+    query = _entry_rows(WeightEntry.client_id == client_id, WeightEntry.date >= since) \
+        .order_by(WeightEntry.date, WeightEntry.id)
+    return _to_arrays(fetch_raw(query))
+
+
+def load_user(user_id, since):
+    """Entries from `since` on for all of a user's clients, sorted by client then date"""
+    owned = db.session.query(Client.id).filter(Client.user_id == user_id, Client.deleted_at.is_(None))
+    query = _entry_rows(WeightEntry.client_id.in_(owned), WeightEntry.date >= since) \
+        .order_by(WeightEntry.client_id, WeightEntry.date, WeightEntry.id)
+    return _to_arrays(fetch_raw(query))
+
+
+def _group_starts(ids):
+    """Index where each client's run of rows starts (ids must be sorted)"""
+    if len(ids) == 0:
+        return np.empty(0, np.int64)
+    return np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+
+
+def _grouped_sum(values, starts):
+    return np.add.reduceat(values, starts) if len(starts) else np.empty(0)
+
+
+def _grouped_fit(t, y, w, group, starts):
+    """Weighted least squares y = a + b*t per group; returns (a, b), NaN where undetermined"""
+    s = _grouped_sum(w, starts)
+    sx = _grouped_sum(w * t, starts)
+    sy = _grouped_sum(w * y, starts)
+    sxx = _grouped_sum(w * t * t, starts)
+    sxy = _grouped_sum(w * t * y, starts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = s * sxx - sx * sx
+        slope = np.where(np.abs(denom) > 1e-9, (s * sxy - sx * sy) / denom, np.nan)
+        intercept = (sy - np.nan_to_num(slope) * sx) / s
+    return intercept, slope
+
+
+def _grouped_median(values, group, starts, counts):
+    order = np.lexsort((values, group))
+    ordered = values[order]
+    lower = ordered[starts + (counts - 1) // 2]
+    upper = ordered[starts + counts // 2]
+    return (lower + upper) / 2.0
+
+
+def robust_trend(t, y, group, starts, counts):
+    """Huber IRLS fit per group; t is days relative to each group's last entry"""
+    w = np.ones_like(y)
+    intercept, slope = _grouped_fit(t, y, w, group, starts)
+    cutoff = None
+    for _ in range(ROBUST_ITERATIONS):
+        residual = np.abs(y - (intercept[group] + np.nan_to_num(slope)[group] * t))
+        if cutoff is None:
+            # MAD of the initial residuals, consistent with the standard deviation
+            # for normal noise; fixed afterwards to avoid a sort per iteration
+            scale = 1.4826 * _grouped_median(residual, group, starts, counts)
+            cutoff = (HUBER_K * scale)[group]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.where((cutoff > 0) & (residual > cutoff), cutoff / residual, 1.0)
+        intercept, slope = _grouped_fit(t, y, w, group, starts)
+    return intercept, slope
+
+
+def compute(ids, x, y, halflife=DEFAULT_HALFLIFE_DAYS, goals=None):
+    """
+    Per-client figures for sorted (ids, x, y) arrays.
+
+    Returns a dict of equal-length arrays, one element per client present in
+    `ids`. `goals` optionally maps client id to goal weight.
+    """
+    starts = _group_starts(ids)
+    counts = np.diff(np.r_[starts, len(ids)])
+    group = np.repeat(np.arange(len(starts)), counts)
+    last = starts + counts - 1
+
+    # Days before each client's latest entry (0 at the latest, negative before)
+    t = (x - x[last][group]).astype(np.float64)
+
+    decay = math.log(2) / halflife
+    ewma_weights = np.exp(decay * t)
+    result = {
+        'client_id': ids[starts],
+        'entries': counts,
+        'latest_day': x[last],
+        'latest_weight': y[last],
+        'ewma': _grouped_sum(ewma_weights * y, starts) / _grouped_sum(ewma_weights, starts),
+    }
+
+    for days in ROLLING_WINDOWS:
+        inside = (t > -days).astype(np.float64)
+        result[f'average_{days}d'] = _grouped_sum(inside * y, starts) / _grouped_sum(inside, starts)
+
+    intercept, slope = robust_trend(t, y, group, starts, counts)
+    result['trend_weight'] = intercept
+    result['weekly_rate'] = slope * 7
+
+    # Plain fit over the recent window for plateau detection
+    recent = (t > -PLATEAU_DAYS).astype(np.float64)
+    recent_count = _grouped_sum(recent, starts)
+    recent_span = -np.minimum.reduceat(np.where(recent > 0, t, 0.0), starts) if len(starts) else np.empty(0)
+    _, recent_slope = _grouped_fit(t, y, recent, group, starts)
+    with np.errstate(invalid='ignore'):
+        result['plateau'] = ((recent_count >= PLATEAU_MIN_ENTRIES) & (recent_span >= PLATEAU_DAYS // 2)
+                             & (np.abs(recent_slope * 7) < PLATEAU_RATE_PER_WEEK))
+
+    goals = goals or {}
+    goal = np.array([goals.get(client_id) for client_id in result['client_id'].tolist()], dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        remaining = goal - intercept
+        days_to_goal = remaining / slope
+        # Reached once the trend has crossed the goal since the start of the window
+        reached = (np.abs(remaining) < 0.05) | ((goal - y[starts]) * remaining < 0)
+        reachable = (days_to_goal > 0) & (days_to_goal <= MAX_FORECAST_DAYS)
+        goal_day = np.where(reached, x[last], np.where(reachable, x[last] + np.ceil(days_to_goal), np.nan))
+    result['goal_weight'] = goal
+    result['goal_reached'] = reached
+    result['goal_day'] = goal_day
+    return result
+
+
+def _number(value, digits=3):
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else round(value, digits)
+
+
+def _day(value):
+    value = float(value)
+    return None if math.isnan(value) else date.fromordinal(int(value)).isoformat()
+
+
+def summaries(result):
+    """Turn compute() output into one JSON-ready dict per client"""
+    rows = zip(*(result[key].tolist() for key in (
+        'client_id', 'entries', 'latest_day', 'latest_weight', 'ewma', 'average_7d', 'average_30d',
+        'trend_weight', 'weekly_rate', 'plateau', 'goal_weight', 'goal_reached', 'goal_day')))
+    return [
+        {
+            'client_id': client_id,
+            'entries': entries,
+            'latest_date': _day(latest_day),
+            'latest_weight': _number(latest_weight),
+            'ewma': _number(ewma),
+            'average_7d': _number(average_7d),
+            'average_30d': _number(average_30d),
+            'trend_weight': _number(trend_weight),
+            'weekly_rate': _number(weekly_rate),
+            'plateau': bool(plateau),
+            'goal_weight': _number(goal_weight),
+            'goal_reached': bool(goal_reached),
+            'projected_goal_date': _day(goal_day)
+        }
+        for (client_id, entries, latest_day, latest_weight, ewma, average_7d, average_30d,
+             trend_weight, weekly_rate, plateau, goal_weight, goal_reached, goal_day) in rows
+    ]
+
+
+def empty_summary(client_id, goal_weight=None):
+    """Summary for a client with no entries in the window"""
+    return {
+        'client_id': client_id, 'entries': 0, 'latest_date': None, 'latest_weight': None, 'ewma': None,
+        'average_7d': None, 'average_30d': None, 'trend_weight': None, 'weekly_rate': None,
+        'plateau': False, 'goal_weight': goal_weight, 'goal_reached': False, 'projected_goal_date': None
+    }
+
+
+def client_series(x, y, halflife=DEFAULT_HALFLIFE_DAYS):
+    """Point-by-point EWMA and rolling averages, plus weekly means, for one client's arrays"""
+    if len(x) == 0:
+        return [], []
+
+    decay = math.log(2) / halflife
+    # Run the recurrence point by point: the state so far decays by the days
+    # since the previous entry and the new one joins with weight 1. Weights
+    # stay relative to the current day, so a short half-life over a long
+    # window can't underflow the early ones into 0/0.
+    factors = np.exp(-decay * np.diff(x).astype(np.float64)).tolist()
+    ewma = np.empty(len(x))
+    total, norm = 0.0, 0.0
+    for i, weight in enumerate(y.tolist()):
+        factor = factors[i - 1] if i else 0.0
+        total = factor * total + weight
+        norm = factor * norm + 1.0
+        ewma[i] = total / norm
+
+    prefix = np.r_[0.0, np.cumsum(y)]
+    index = np.arange(1, len(x) + 1)
+    rolling = {}
+    for days in ROLLING_WINDOWS:
+        first = np.searchsorted(x, x - days + 1, side='left')
+        rolling[days] = (prefix[index] - prefix[first]) / (index - first)
+
+    points = [
+        {'date': _day(day), 'weight': _number(weight), 'ewma': _number(smooth),
+         'average_7d': _number(avg7), 'average_30d': _number(avg30)}
+        for day, weight, smooth, avg7, avg30 in zip(
+            x.tolist(), y.tolist(), ewma.tolist(), rolling[7].tolist(), rolling[30].tolist())
+    ]
+
+    # Weeks start on Monday; date.toordinal() is 1 for Monday 0001-01-01
+    weeks, week_index = np.unique((x - 1) // 7, return_inverse=True)
+    means = np.bincount(week_index, weights=y) / np.bincount(week_index)
+    changes = np.r_[np.nan, np.diff(means)]
+    weekly = [
+        {'week_start': _day(week * 7 + 1), 'mean': _number(mean), 'change': _number(change)}
+        for week, mean, change in zip(weeks.tolist(), means.tolist(), changes.tolist())
+    ]
+    return points, weekly
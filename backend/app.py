@@ -3,8 +3,19 @@ from flask_cors import CORS
 from flask_login import LoginManager
 from config import Config
 from models import db, User
+import identity_cache
+import series_cache
+import sparklines
+import coalesce
+import serialization
+import instrumentation
+import sqlite_profile
+import migrations
+import daily_entries
 from routes.client import client_bp
 from routes.weight import weight_bp
+from routes.export import export_bp
+from routes.sync import sync_bp
 import os
 
 def create_app():
@@ -12,8 +23,17 @@ def create_app():
     app.config.from_object(Config)
 
     # Use a more permissive CORS configuration for testing
-    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True,
+         expose_headers=['ETag', 'Last-Modified'])
+    sqlite_profile.configure(app)
     db.init_app(app)
+    sqlite_profile.install(app, db)
+    identity_cache.init_app(app)
+    series_cache.init_app(app)
+    sparklines.init_app(app)
+    # Registered before compression so its after_request sees the final body size
+    instrumentation.init_app(app)
+    serialization.init_app(app)
 
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -27,21 +47,42 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return identity_cache.load_user(int(user_id))
 
     # Register blueprints
     app.register_blueprint(client_bp, url_prefix='/api/clients')
     app.register_blueprint(weight_bp, url_prefix='/api/weight')
+    app.register_blueprint(export_bp, url_prefix='/api/export')
+    app.register_blueprint(sync_bp, url_prefix='/api/sync')
 
     # Import and register auth blueprint
     from routes.auth import auth_bp
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
 
+    # Register CLI commands
+    app.cli.add_command(migrations.db_upgrade_command)
+    app.cli.add_command(migrations.db_status_command)
+    from client_stats import rebuild_client_stats_command
+    app.cli.add_command(rebuild_client_stats_command)
+    from export import export_data_command
+    app.cli.add_command(export_data_command)
+    from purge import purge_deleted_clients_command
+    app.cli.add_command(purge_deleted_clients_command)
+    app.cli.add_command(daily_entries.dedup_weight_entries_command)
+    from changelog import compact_change_log_command
+    app.cli.add_command(compact_change_log_command)
+
     # Add a health check endpoint
     @app.route('/health', methods=['GET'])
     def health_check():
         return jsonify({"status": "healthy", "environment": os.environ.get('FLASK_ENV', 'development')})
 
+    # Hit/miss counters for this worker's identity caches
+    @app.route('/health/cache', methods=['GET'])
+    def cache_stats():
+        return jsonify({**identity_cache.stats(), 'series': series_cache.cache.stats(),
+                        'sparklines': sparklines.cache.stats(), 'coalesce': coalesce.stats()})
+
     # Add test routes that don't require authentication
     @app.route('/api/test/clients', methods=['GET'])
     def test_get_clients():
@@ -128,15 +169,9 @@ def create_app():
         app.logger.error(f"Internal Server Error: {str(e)}")
         return jsonify({"error": "Internal Server Error", "message": "A database error occurred. Please try again later."}), 500
 
-    # Create database tables
-    with app.app_context():
-        try:
-            db.create_all()
-            app.logger.info("Database tables created successfully")
-        except Exception as e:
-            app.logger.error(f"Error creating database tables: {str(e)}")
-            # Don't raise the exception, let the app continue to start
-            # This allows the health check endpoint to work even if the DB is down
+    # Check the schema version instead of running create_all() in every worker
+    migrations.init_app(app)
+    daily_entries.init_app(app)
 
     return app
 
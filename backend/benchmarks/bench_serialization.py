@@ -0,0 +1,61 @@
+"""
+Benchmark the weight history listing for one client with 100k entries.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_serialization [--entries 100000] [--repeat 5]
+
+Reports the median time of GET /api/weight/client/<id> plus the response
+size, with and without gzip.
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import BENCH_USERNAME, BENCH_PASSWORD, add_database_argument, make_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_database_argument(parser)
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    from models import db, Client, User, WeightEntry
+
+    with app.app_context():
+        user = User(username=BENCH_USERNAME, email='bench@example.com')
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+        client = Client(name='Bench Client', email='client@example.com', user_id=user.id)
+        db.session.add(client)
+        db.session.commit()
+        start = date(2000, 1, 1)
+        db.session.execute(WeightEntry.__table__.insert(), [
+            {'client_id': client.id, 'weight': 80 + (i % 50) / 10, 'date': start + timedelta(days=i)}
+            for i in range(args.entries)
+        ])
+        db.session.commit()
+        client_id = client.id
+
+    http = app.test_client()
+    base_url = 'https://localhost'
+    http.post('/api/auth/login', json={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}, base_url=base_url)
+
+    for label, headers in (('identity', {}), ('gzip', {'Accept-Encoding': 'gzip'})):
+        timings = []
+        size = 0
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = http.get(f'/api/weight/client/{client_id}', headers=headers, base_url=base_url)
+            timings.append(time.perf_counter() - started)
+            size = len(response.data)
+        print(f"{label:9s} entries={args.entries} median={statistics.median(timings) * 1000:.1f}ms "
+              f"min={min(timings) * 1000:.1f}ms bytes={size}")
+
+
+if __name__ == '__main__':
+    main()
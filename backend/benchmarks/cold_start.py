@@ -0,0 +1,70 @@
+"""
+Cold-start timing: how long a fresh worker process takes from `import app`
+to answering its first request.
+
+Each run starts a new interpreter (like a gunicorn worker after a deploy or
+an autoscaling event) against an already-migrated database and reports the
+time spent importing, in create_app() and serving the first request.
+
+Usage (from the backend directory):
+    python -m benchmarks.cold_start --runs 10
+    python -m benchmarks.cold_start --database-url postgresql://localhost/weight_bench
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from benchmarks.common import BACKEND_DIR, add_database_argument, make_app, summarize
+from benchmarks.datagen import generate
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {backend!r})
+from config import Config
+Config.SQLALCHEMY_DATABASE_URI = {url!r}
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/clients', base_url='https://localhost')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(json.dumps({{'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - created, 'total': served - started}}))
+"""
+
+
+def probe(database_url):
+    code = PROBE.format(backend=BACKEND_DIR, url=database_url)
+    output = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time worker cold starts from import to first response.')
+    add_database_argument(parser)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    generate(app, users=1, clients_per_user=10, entries_per_client=10)
+    database_url = app.config['SQLALCHEMY_DATABASE_URI']
+
+    timings = {}
+    for _ in range(args.runs):
+        for phase, value in probe(database_url).items():
+            timings.setdefault(phase, []).append(value)
+
+    print(f"{args.runs} cold starts on {database_url}")
+    print(f"{'phase':15s} {'p50 ms':>9s} {'p95 ms':>9s} {'max ms':>9s}")
+    for phase, values in timings.items():
+        stats = summarize(values)
+        print(f"{phase:15s} {stats['p50']:9.1f} {stats['p95']:9.1f} {stats['max']:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Shared helpers for the benchmark scripts: building an app against a chosen
+database and timing summaries.
+"""
+import atexit
+import math
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# The account the client routes use while login is disabled for them
+BENCH_USERNAME = 'testuser'
+BENCH_PASSWORD = 'password123'
+
+
+def add_database_argument(parser):
+    parser.add_argument('--database-url', default=None,
+                        help='SQLAlchemy URL to benchmark against, e.g. postgresql://localhost/weight_bench '
+                             '(default: a throwaway SQLite file)')
+
+
+def make_app(database_url=None):
+    """Create the Flask app against `database_url`, or a temporary SQLite file"""
+    from config import Config
+
+    if database_url is None:
+        path = tempfile.mktemp(prefix='weight-bench-', suffix='.db')
+        atexit.register(lambda: os.path.exists(path) and os.remove(path))
+        database_url = 'sqlite:///' + path
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    Config.SQLALCHEMY_DATABASE_URI = database_url
+    if database_url.startswith('postgresql'):
+        Config.SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    # Keep setup fast: hashing inline and cheap
+    Config.HASH_POOL_WORKERS = 0
+    Config.PASSWORD_HASH_ITERATIONS = 1000
+
+    from app import create_app
+    return create_app()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(timings):
+    """Latency summary in milliseconds for a list of durations in seconds"""
+    values = sorted(t * 1000 for t in timings)
+    return {
+        'count': len(values),
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(values[-1], 3) if values else 0.0
+    }
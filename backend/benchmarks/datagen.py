@@ -0,0 +1,124 @@
+"""
+Synthetic dataset generator for benchmarks.
+
+Creates users, clients per user and weight entries per client with realistic
+histories: mostly daily weigh-ins with occasional skipped days and multi-week
+breaks, and weights that follow a slow trend plus day-to-day noise.
+
+Usage (from the backend directory):
+    python -m benchmarks.datagen --users 5 --clients-per-user 100 --entries-per-client 1000
+    python -m benchmarks.datagen --database-url postgresql://localhost/weight_bench ...
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import BENCH_USERNAME, BENCH_PASSWORD, add_database_argument, make_app
+
+INSERT_CHUNK = 5000
+
+
+def entry_dates(rng, count, end):
+    """Return `count` ascending weigh-in dates ending near `end`"""
+    gaps = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.75:
+            gaps.append(1)
+        elif roll < 0.97:
+            gaps.append(rng.randint(2, 4))
+        else:
+            # Holidays, illness, lapsed clients
+            gaps.append(rng.randint(7, 30))
+    day = end - timedelta(days=sum(gaps))
+    dates = []
+    for gap in gaps:
+        day += timedelta(days=gap)
+        dates.append(day)
+    return dates
+
+
+def entry_weights(rng, count):
+    start = rng.uniform(60, 130)
+    # kg per weigh-in: most clients lose, some gain or hold
+    trend = rng.choice([-0.05, -0.03, -0.01, 0.0, 0.02])
+    weights = []
+    current = start
+    for _ in range(count):
+        current += trend + rng.gauss(0, 0.3)
+        weights.append(round(max(current, 35.0), 1))
+    return weights
+
+
+def generate(app, users=1, clients_per_user=10, entries_per_client=100, seed=42, end=None):
+    """Populate the app's database and return {'users': [...], 'clients': n, 'entries': n}"""
+    from models import db, User, Client, WeightEntry
+    from client_stats import rebuild_all
+
+    rng = random.Random(seed)
+    end = end or date.today()
+    created = {'users': [], 'clients': 0, 'entries': 0}
+
+    with app.app_context():
+        for u in range(users):
+            username = BENCH_USERNAME if u == 0 else f'bench{u}'
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                user = User(username=username, email=f'{username}@example.com')
+                user.set_password(BENCH_PASSWORD)
+                db.session.add(user)
+                db.session.commit()
+            created['users'].append(username)
+
+            client_rows = [
+                {'name': f'Client {u}-{c}', 'email': f'client-{u}-{c}-{seed}@example.com', 'user_id': user.id}
+                for c in range(clients_per_user)
+            ]
+            db.session.execute(Client.__table__.insert(), client_rows)
+            db.session.commit()
+            client_ids = [
+                row.id for row in db.session.query(Client.id)
+                .filter(Client.user_id == user.id, Client.email.like(f'client-{u}-%-{seed}@example.com'))
+            ]
+            created['clients'] += len(client_ids)
+
+            batch = []
+            for client_id in client_ids:
+                count = max(1, int(rng.gauss(entries_per_client, entries_per_client * 0.1)))
+                for entry_date, weight in zip(entry_dates(rng, count, end), entry_weights(rng, count)):
+                    batch.append({'client_id': client_id, 'date': entry_date, 'weight': weight})
+                    if len(batch) >= INSERT_CHUNK:
+                        db.session.execute(WeightEntry.__table__.insert(), batch)
+                        db.session.commit()
+                        created['entries'] += len(batch)
+                        batch = []
+            if batch:
+                db.session.execute(WeightEntry.__table__.insert(), batch)
+                db.session.commit()
+                created['entries'] += len(batch)
+
+        # Aggregates are normally maintained by the routes
+        rebuild_all()
+
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic weight-tracker dataset.')
+    add_database_argument(parser)
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--clients-per-user', type=int, default=10)
+    parser.add_argument('--entries-per-client', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    started = time.perf_counter()
+    created = generate(app, args.users, args.clients_per_user, args.entries_per_client, args.seed)
+    print(f"Created {len(created['users'])} users, {created['clients']} clients, {created['entries']} entries "
+          f"in {time.perf_counter() - started:.1f}s on {app.config['SQLALCHEMY_DATABASE_URI']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Multi-process HTTP load driver for a running server (e.g. local gunicorn).
+
+Each process logs in as the benchmark user, then replays a weighted mix of
+read and write requests for a fixed duration. Latencies from all processes
+are merged into p50/p95/p99 and overall throughput.
+
+Usage (from the backend directory):
+    # SQLite: seed the app's own database file, then start gunicorn on it
+    python -m benchmarks.datagen --database-url sqlite:///weight_tracker.db --clients-per-user 200
+    gunicorn -c gunicorn.conf.py "app:create_app()"
+
+    # PostgreSQL: seed the same database the server uses
+    python -m benchmarks.datagen --database-url postgresql://localhost/weight_bench --clients-per-user 200
+    DATABASE_URL=postgresql://localhost/weight_bench gunicorn -c gunicorn.conf.py "app:create_app()"
+
+    python -m benchmarks.load --url http://localhost:10000 --processes 8 --duration 30
+"""
+import argparse
+import gzip
+import json
+import multiprocessing
+import random
+import time
+import urllib.error
+import urllib.request
+from http.cookies import SimpleCookie
+
+from benchmarks.common import BENCH_USERNAME, BENCH_PASSWORD, summarize
+
+# (weight, name, method, path template, body)
+DEFAULT_MIX = [
+    (30, 'weight history', 'GET', '/api/weight/client/{client_id}', None),
+    (20, 'series', 'GET', '/api/weight/client/{client_id}/series?points=200', None),
+    (15, 'summary', 'GET', '/api/weight/client/{client_id}/summary', None),
+    (15, 'client list', 'GET', '/api/clients?include=stats&per_page=50', None),
+    (10, 'client', 'GET', '/api/clients/{client_id}', None),
+    (10, 'add entry', 'POST', '/api/weight', {'client_id': '{client_id}', 'weight': 80.0}),
+]
+
+
+class Session:
+    """Minimal cookie-carrying HTTP client (the session cookie is Secure, so we send it by hand)"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = {}
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        req.add_header('Accept-Encoding', 'gzip')
+        if self.cookies:
+            req.add_header('Cookie', '; '.join(f'{k}={v}' for k, v in self.cookies.items()))
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                payload = response.read()
+                status = response.status
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            payload, status, headers = e.read(), e.code, e.headers
+        if headers.get('Content-Encoding') == 'gzip':
+            payload = gzip.decompress(payload)
+        for header in headers.get_all('Set-Cookie') or []:
+            cookie = SimpleCookie()
+            cookie.load(header)
+            self.cookies.update({k: morsel.value for k, morsel in cookie.items()})
+        return status, payload
+
+
+def worker(base_url, duration, seed, queue):
+    try:
+        _drive(base_url, duration, seed, queue)
+    except Exception as e:
+        queue.put({'error': f'{type(e).__name__}: {e}'})
+
+
+def _drive(base_url, duration, seed, queue):
+    rng = random.Random(seed)
+    session = Session(base_url)
+    session.request('POST', '/api/auth/login', {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+    status, payload = session.request('GET', '/api/clients')
+    client_ids = [client['id'] for client in json.loads(payload)] if status == 200 else []
+    if not client_ids:
+        queue.put({'error': f'no clients visible to {BENCH_USERNAME} (status {status}); run benchmarks.datagen first'})
+        return
+
+    weights = [item[0] for item in DEFAULT_MIX]
+    timings = {}
+    errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        _, name, method, template, body = rng.choices(DEFAULT_MIX, weights=weights)[0]
+        client_id = rng.choice(client_ids)
+        if body is not None:
+            body = {k: (client_id if v == '{client_id}' else v) for k, v in body.items()}
+        started = time.perf_counter()
+        status, _ = session.request(method, template.format(client_id=client_id), body)
+        elapsed = time.perf_counter() - started
+        if status >= 400:
+            errors += 1
+        timings.setdefault(name, []).append(elapsed)
+    queue.put({'timings': timings, 'errors': errors})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive concurrent HTTP load against a running server.')
+    parser.add_argument('--url', default='http://localhost:10000')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(args.url, args.duration, seed, queue))
+             for seed in range(args.processes)]
+    started = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    reports = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    wall = time.perf_counter() - started
+
+    failures = [report['error'] for report in reports if 'error' in report]
+    if failures:
+        raise SystemExit(failures[0])
+
+    merged = {}
+    errors = 0
+    for report in reports:
+        errors += report['errors']
+        for name, values in report['timings'].items():
+            merged.setdefault(name, []).extend(values)
+    everything = [t for values in merged.values() for t in values]
+
+    results = {
+        'overall': dict(summarize(everything), throughput_rps=round(len(everything) / wall, 1), errors=errors),
+        'routes': {name: summarize(values) for name, values in sorted(merged.items())}
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    overall = results['overall']
+    print(f"{len(everything)} requests in {wall:.1f}s from {args.processes} processes: "
+          f"{overall['throughput_rps']} req/s, {errors} errors")
+    print(f"{'route':20s} {'count':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for name, stats in list(results['routes'].items()) + [('overall', overall)]:
+        print(f"{name:20s} {stats['count']:7d} {stats['p50']:9.2f} {stats['p95']:9.2f} {stats['p99']:9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Per-route micro-benchmarks through the Flask test client.
+
+Seeds a synthetic dataset, then calls every route in routes/ a number of
+times and prints p50/p95/p99 latency per route. Results can be saved and
+compared against a baseline to catch regressions before deploy.
+
+Usage (from the backend directory):
+    python -m benchmarks.micro --clients 50 --entries 2000 --repeat 30
+    python -m benchmarks.micro --save baseline.json
+    python -m benchmarks.micro --compare baseline.json --threshold 1.25
+    python -m benchmarks.micro --database-url postgresql://localhost/weight_bench
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.common import BENCH_USERNAME, BENCH_PASSWORD, add_database_argument, make_app, summarize
+from benchmarks.datagen import generate
+
+BASE_URL = 'https://localhost'
+
+
+def build_cases(client_id, entry_ids):
+    """(name, method, path, kwargs) for every route; writes use rotating ids"""
+    bulk_body = 'client_id,weight,date\n' + ''.join(
+        f'{client_id},{80 + i % 10},2001-01-{1 + i % 28:02d}\n' for i in range(1000)
+    )
+    entry_iter = iter(entry_ids)
+    return [
+        ('GET /api/clients', 'get', lambda: '/api/clients', {}),
+        ('GET /api/clients?include=stats', 'get', lambda: '/api/clients?include=stats&per_page=100', {}),
+        ('GET /api/clients/<id>', 'get', lambda: f'/api/clients/{client_id}', {}),
+        ('GET /api/weight/client/<id>', 'get', lambda: f'/api/weight/client/{client_id}', {}),
+        ('GET /api/weight/client/<id>?limit=200', 'get', lambda: f'/api/weight/client/{client_id}?limit=200', {}),
+        ('GET /api/weight/client/<id>/series', 'get', lambda: f'/api/weight/client/{client_id}/series?points=200', {}),
+        ('GET /api/weight/client/<id>/series?minmax', 'get',
+         lambda: f'/api/weight/client/{client_id}/series?points=52&method=minmax', {}),
+        ('GET /api/weight/client/<id>/summary', 'get', lambda: f'/api/weight/client/{client_id}/summary', {}),
+        ('POST /api/weight', 'post', lambda: '/api/weight',
+         {'json': {'client_id': client_id, 'weight': 75.5, 'date': '2001-02-03'}}),
+        ('PUT /api/weight/<id>', 'put', lambda: f'/api/weight/{next(entry_iter)}', {'json': {'weight': 76.0}}),
+        ('DELETE /api/weight/<id>', 'delete', lambda: f'/api/weight/{next(entry_iter)}', {}),
+        ('POST /api/weight/bulk (1k rows)', 'post', lambda: '/api/weight/bulk',
+         {'data': bulk_body, 'content_type': 'text/csv'}),
+        ('GET /api/export', 'get', lambda: '/api/export?format=ndjson', {}),
+        ('POST /api/auth/login', 'post', lambda: '/api/auth/login',
+         {'json': {'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}}),
+    ]
+
+
+def run(app, repeat, warmup=2):
+    from models import db, Client, User, WeightEntry
+
+    with app.app_context():
+        user = User.query.filter_by(username=BENCH_USERNAME).first()
+        client_id = db.session.query(Client.id).filter(Client.user_id == user.id).order_by(Client.id).first()[0]
+        entry_ids = [row[0] for row in db.session.query(WeightEntry.id)
+                     .filter(WeightEntry.client_id != client_id).limit(2 * (repeat + warmup))]
+
+    http = app.test_client()
+    http.post('/api/auth/login', json={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}, base_url=BASE_URL)
+
+    results = {}
+    for name, method, path, kwargs in build_cases(client_id, entry_ids):
+        timings = []
+        for i in range(repeat + warmup):
+            started = time.perf_counter()
+            response = getattr(http, method)(path(), base_url=BASE_URL, **kwargs)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name} returned {response.status_code}: {response.get_data(as_text=True)[:200]}')
+            if i >= warmup:
+                timings.append(elapsed)
+        results[name] = summarize(timings)
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"{'route':48s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}" + ('   vs baseline p50' if baseline else ''))
+    for name, stats in results.items():
+        line = f"{name:48s} {stats['p50']:9.2f} {stats['p95']:9.2f} {stats['p99']:9.2f}"
+        if baseline and name in baseline:
+            line += f"   x{stats['p50'] / max(baseline[name]['p50'], 1e-9):.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmark every API route.')
+    add_database_argument(parser)
+    parser.add_argument('--clients', type=int, default=50, help='clients for the benchmark user')
+    parser.add_argument('--entries', type=int, default=1000, help='entries per client')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--save', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON from --save to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='fail when a route p50 exceeds baseline p50 by this factor')
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    generate(app, users=1, clients_per_user=args.clients, entries_per_client=args.entries)
+    results = run(app, args.repeat)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        regressions = [name for name, stats in results.items()
+                       if name in baseline and stats['p50'] > baseline[name]['p50'] * args.threshold]
+        if regressions:
+            print(f"Regressions over x{args.threshold}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
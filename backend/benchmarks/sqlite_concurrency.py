@@ -0,0 +1,163 @@
+"""
+Concurrent read/write throughput on the SQLite fallback database, with the
+tuned profile (WAL, pragmas, pools, read/write split) and without it.
+
+Seeds one database, copies it per mode, then starts several processes (like
+gunicorn workers) with a few threads each. Every thread replays a mix of
+weight history/summary reads and single-entry writes through the Flask test
+client for a fixed duration. Reports ops/s, latency and how many requests
+failed with "database is locked".
+
+Usage (from the backend directory):
+    python -m benchmarks.sqlite_concurrency --processes 2 --threads 4 --duration 15
+    python -m benchmarks.sqlite_concurrency --modes tuned --write-ratio 0.3
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from benchmarks.common import BENCH_USERNAME, BENCH_PASSWORD, make_app, summarize
+from benchmarks.datagen import generate
+
+BASE_URL = 'https://localhost'
+MODES = ('legacy', 'tuned')
+
+
+def _thread(app, client_ids, write_ratio, deadline, seed, out):
+    rng = random.Random(seed)
+    http = app.test_client()
+    http.post('/api/auth/login', json={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}, base_url=BASE_URL)
+    reads, writes, errors, locked = [], [], 0, 0
+    while time.monotonic() < deadline:
+        client_id = rng.choice(client_ids)
+        started = time.perf_counter()
+        if rng.random() < write_ratio:
+            response = http.post('/api/weight', json={'client_id': client_id, 'weight': 80.0}, base_url=BASE_URL)
+            bucket = writes
+        elif rng.random() < 0.5:
+            response = http.get(f'/api/weight/client/{client_id}', base_url=BASE_URL)
+            bucket = reads
+        else:
+            response = http.get(f'/api/weight/client/{client_id}/summary', base_url=BASE_URL)
+            bucket = reads
+        body = response.get_data()
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors += 1
+            if b'locked' in body:
+                locked += 1
+        else:
+            bucket.append(elapsed)
+    out.append((reads, writes, errors, locked))
+
+
+def worker(mode, path, threads, write_ratio, duration, seed, queue):
+    from config import Config
+
+    Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+    Config.SQLALCHEMY_ENGINE_OPTIONS = {}
+    Config.SQLALCHEMY_BINDS = {}
+    Config.SQLITE_TUNED = mode == 'tuned'
+    Config.HASH_POOL_WORKERS = 0
+    Config.PASSWORD_HASH_ITERATIONS = 1000
+    from app import create_app
+    from models import db, Client
+
+    app = create_app()
+    with app.app_context():
+        client_ids = [row[0] for row in db.session.query(Client.id)]
+
+    out = []
+    deadline = time.monotonic() + duration
+    pool = [threading.Thread(target=_thread, args=(app, client_ids, write_ratio, deadline, seed * 100 + i, out))
+            for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    queue.put(out)
+
+
+def run_mode(mode, path, args):
+    # Fresh interpreters, like separate gunicorn workers, instead of forks of the seeding process
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    procs = [context.Process(target=worker, args=(mode, path, args.threads, args.write_ratio,
+                                                          args.duration, seed, queue))
+             for seed in range(args.processes)]
+    started = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    reports = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    wall = time.perf_counter() - started
+
+    reads, writes, errors, locked = [], [], 0, 0
+    for report in reports:
+        for r, w, e, l in report:
+            reads.extend(r)
+            writes.extend(w)
+            errors += e
+            locked += l
+    return {
+        'ops_per_s': round((len(reads) + len(writes)) / args.duration, 1),
+        'reads': summarize(reads),
+        'writes': summarize(writes),
+        'errors': errors,
+        'locked': locked,
+        'wall': round(wall, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare SQLite read/write concurrency with and without the tuned profile.')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per process')
+    parser.add_argument('--duration', type=float, default=15.0, help='seconds per mode')
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--entries', type=int, default=1000, help='entries per client')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    app = make_app()
+    generate(app, users=1, clients_per_user=args.clients, entries_per_client=args.entries)
+    from models import db
+    with app.app_context():
+        source = db.engine.url.database
+        for engine in db.engines.values():
+            engine.dispose()
+
+    workdir = tempfile.mkdtemp(prefix='weight-sqlite-bench-')
+    try:
+        results = {}
+        for mode in args.modes:
+            path = os.path.join(workdir, f'{mode}.db')
+            shutil.copy(source, path)
+            if mode == 'legacy':
+                # Undo the WAL switch made while seeding so the baseline uses the rollback journal
+                conn = sqlite3.connect(path)
+                conn.execute('PRAGMA journal_mode=DELETE')
+                conn.close()
+            results[mode] = run_mode(mode, path, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.duration:.0f}s per mode, "
+          f"{args.write_ratio:.0%} writes")
+    print(f"{'mode':8s} {'ops/s':>8s} {'read p50':>9s} {'read p99':>9s} {'write p50':>10s} {'write p99':>10s} "
+          f"{'errors':>7s} {'locked':>7s}")
+    for mode, r in results.items():
+        print(f"{mode:8s} {r['ops_per_s']:8.1f} {r['reads']['p50']:9.2f} {r['reads']['p99']:9.2f} "
+              f"{r['writes']['p50']:10.2f} {r['writes']['p99']:10.2f} {r['errors']:7d} {r['locked']:7d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""
+Sustained single-entry insert throughput with and without write-behind.
+
+Starts several processes (like gunicorn workers) with a few threads each;
+every thread posts single weight entries through the Flask test client for a
+fixed duration. Modes:
+- sync: one transaction per POST (the default);
+- write-behind: rows are queued and written in grouped inserts, 202 replies;
+- write-behind-wait: the same, but each reply waits for its group's commit.
+
+After each mode the database row count is checked against the acknowledged
+posts, so lost or duplicated rows show up as an error.
+
+Usage (from the backend directory):
+    python -m benchmarks.write_behind --processes 2 --threads 4 --duration 10
+    python -m benchmarks.write_behind --modes sync write-behind --interval-ms 20
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from benchmarks.common import BENCH_USERNAME, BENCH_PASSWORD, make_app, summarize
+from benchmarks.datagen import generate
+
+BASE_URL = 'https://localhost'
+MODES = ('sync', 'write-behind', 'write-behind-wait')
+
+
+def _thread(app, client_ids, deadline, seed, out):
+    rng = random.Random(seed)
+    http = app.test_client()
+    # Logins from every thread at once can time out on the write lock; keep trying
+    while http.post('/api/auth/login', json={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD},
+                    base_url=BASE_URL).status_code != 200:
+        time.sleep(0.1)
+    latencies, errors = [], 0
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        response = http.post('/api/weight', json={'client_id': rng.choice(client_ids), 'weight': 80.0},
+                             base_url=BASE_URL)
+        response.get_data()
+        if response.status_code >= 400:
+            errors += 1
+        else:
+            latencies.append(time.perf_counter() - started)
+    out.append((latencies, errors))
+
+
+def worker(mode, path, args, seed, queue):
+    from config import Config
+
+    Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+    Config.SQLALCHEMY_ENGINE_OPTIONS = {}
+    Config.SQLALCHEMY_BINDS = {}
+    Config.HASH_POOL_WORKERS = 0
+    Config.PASSWORD_HASH_ITERATIONS = 1000
+    Config.WRITE_BEHIND = mode != 'sync'
+    Config.WRITE_BEHIND_WAIT = mode == 'write-behind-wait'
+    Config.WRITE_BEHIND_INTERVAL_MS = args.interval_ms
+    Config.WRITE_BEHIND_MAX_ROWS = args.max_rows
+    from app import create_app
+    from models import db, Client
+    import write_behind
+
+    app = create_app()
+    with app.app_context():
+        client_ids = [row[0] for row in db.session.query(Client.id)]
+
+    out = []
+    deadline = time.monotonic() + args.duration
+    pool = [threading.Thread(target=_thread, args=(app, client_ids, deadline, seed * 100 + i, out))
+            for i in range(args.threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    # What gunicorn's worker_exit hook does
+    write_behind.shutdown()
+    queue.put((out, write_behind.writer.stats()))
+
+
+def count_entries(path):
+    import sqlite3
+
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM weight_entry').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def run_mode(mode, path, args):
+    before = count_entries(path)
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    procs = [context.Process(target=worker, args=(mode, path, args, seed, queue)) for seed in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    reports = [queue.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    latencies, errors, batches = [], 0, 0
+    for out, stats in reports:
+        batches += stats['batches']
+        for thread_latencies, thread_errors in out:
+            latencies.extend(thread_latencies)
+            errors += thread_errors
+    written = count_entries(path) - before
+    return {
+        'rows_per_s': round(written / args.duration, 1),
+        'latency': summarize(latencies),
+        'acknowledged': len(latencies),
+        'written': written,
+        'errors': errors,
+        'batches': batches
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare single-entry insert throughput with and without write-behind.')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4, help='threads per process')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode')
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--interval-ms', type=int, default=50)
+    parser.add_argument('--max-rows', type=int, default=500)
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+
+    app = make_app()
+    generate(app, users=1, clients_per_user=args.clients, entries_per_client=10)
+    from models import db
+    with app.app_context():
+        source = db.engine.url.database
+        for engine in db.engines.values():
+            engine.dispose()
+
+    workdir = tempfile.mkdtemp(prefix='weight-write-behind-bench-')
+    try:
+        results = {}
+        for mode in args.modes:
+            path = os.path.join(workdir, f'{mode}.db')
+            shutil.copy(source, path)
+            results[mode] = run_mode(mode, path, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.duration:.0f}s per mode, "
+          f"flush every {args.interval_ms} ms or {args.max_rows} rows")
+    print(f"{'mode':18s} {'rows/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'acked':>7s} {'written':>8s} "
+          f"{'errors':>7s} {'batches':>8s}")
+    for mode, r in results.items():
+        print(f"{mode:18s} {r['rows_per_s']:8.1f} {r['latency']['p50']:8.2f} {r['latency']['p99']:8.2f} "
+              f"{r['acknowledged']:7d} {r['written']:8d} {r['errors']:7d} {r['batches']:8d}")
+
+
+if __name__ == '__main__':
+    main()
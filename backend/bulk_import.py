@@ -0,0 +1,229 @@
+"""
+Streaming bulk import of weight entries.
+
+Rows are read from the request body as they arrive (CSV with a header row, or
+NDJSON with one object per line), validated one at a time and written in
+multi-row INSERTs, one transaction per chunk. Memory use depends on the chunk
+size, not on the size of the upload.
+"""
+import csv
+import json
+from datetime import datetime
+from collections import defaultdict
+from models import db, Client, WeightEntry
+from client_stats import apply_bulk_added, rebuild_client
+from daily_entries import upsert_rows
+from identity_cache import owner_of, client_deleted
+from versions import bump_client
+from changelog import record_many, ENTRY
+
+READ_SIZE = 64 * 1024
+MAX_REPORTED_ERRORS = 1000
+
+CSV_TYPES = ('text/csv', 'application/csv')
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines')
+
+
+def detect_format(content_type, requested=None):
+    """Work out the upload format from ?format= or the Content-Type header"""
+    if requested:
+        requested = requested.lower()
+        if requested in ('csv', 'ndjson'):
+            return requested
+        return None
+    mimetype = (content_type or '').split(';')[0].strip().lower()
+    if mimetype in CSV_TYPES:
+        return 'csv'
+    if mimetype in NDJSON_TYPES:
+        return 'ndjson'
+    return None
+
+
+def iter_lines(stream):
+    """Yield decoded lines from a binary stream without reading it all at once"""
+    pending = b''
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.decode('utf-8-sig') + '\n'
+    if pending:
+        yield pending.decode('utf-8-sig')
+
+
+def iter_csv_rows(lines):
+    """Yield (row_number, dict) pairs from CSV lines with a header row"""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_ndjson_rows(lines):
+    """Yield (row_number, dict) pairs from NDJSON lines, skipping blank lines"""
+    for line_num, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_num, None
+            continue
+        yield line_num, row
+
+
+def parse_row(row, default_date):
+    """Validate a raw row and return the column values to insert"""
+    if not isinstance(row, dict):
+        raise ValueError('Row is not a valid JSON object')
+
+    client_id = row.get('client_id')
+    weight = row.get('weight')
+    if client_id in (None, '') or weight in (None, ''):
+        raise ValueError('Weight and client_id are required')
+
+    try:
+        client_id = int(client_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid client_id')
+
+    try:
+        weight = float(weight)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid weight')
+
+    date = default_date
+    if row.get('date'):
+        try:
+            date = datetime.strptime(str(row['date']).strip(), '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError('Invalid date format. Use YYYY-MM-DD')
+
+    return {'client_id': client_id, 'weight': weight, 'date': date}
+
+
+def write_rows(user_id, rows, upsert=False):
+    """
+    Write validated rows for one user's clients with one multi-row statement,
+    fold them into the stats, change log and data versions (does not commit).
+    Returns the entry id written for each row.
+    """
+    if upsert:
+        entry_ids = upsert_rows(rows)
+    else:
+        entry_ids = db.session.execute(
+            WeightEntry.__table__.insert().returning(WeightEntry.__table__.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+    record_many(user_id, ENTRY, sorted(set(entry_ids)))
+    by_client = defaultdict(list)
+    for values in rows:
+        by_client[values['client_id']].append((values['date'], values['weight']))
+    for client_id, client_rows in by_client.items():
+        if upsert:
+            # Replaced weights can't be folded in incrementally
+            rebuild_client(client_id)
+        else:
+            apply_bulk_added(client_id, client_rows)
+        bump_client(client_id, user_id)
+    return entry_ids
+
+
+class BulkImporter:
+    """Validates rows for one user and flushes them to the database in chunks"""
+
+    def __init__(self, user_id, chunk_size=5000, upsert=False):
+        self.user_id = user_id
+        self.chunk_size = chunk_size
+        # One-entry-per-day mode: rows replace the day's existing entry
+        self.upsert = upsert
+        self.default_date = datetime.now().date()
+        self.owned = {}
+        self.batch = []
+        self.batch_rows = []
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.errors_truncated = False
+
+    def owns(self, client_id):
+        """Check client ownership, querying once per distinct client_id"""
+        if client_id not in self.owned:
+            self.owned[client_id] = owner_of(client_id) == self.user_id
+        return self.owned[client_id]
+
+    def report(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+        else:
+            self.errors_truncated = True
+
+    def add(self, row_number, row):
+        try:
+            values = parse_row(row, self.default_date)
+        except ValueError as e:
+            self.report(row_number, str(e))
+            return
+
+        if not self.owns(values['client_id']):
+            self.report(row_number, 'Client not found or unauthorized')
+            return
+
+        self.batch.append(values)
+        self.batch_rows.append(row_number)
+        if len(self.batch) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Write the pending chunk in one multi-row INSERT and commit it"""
+        if not self.batch:
+            return
+        pending = list(zip(self.batch_rows, self.batch))
+        try:
+            # A client deleted since its first row was checked must not get more; one
+            # query per chunk, inside its transaction
+            client_ids = {values['client_id'] for values in self.batch}
+            live = {row[0] for row in db.session.query(Client.id).filter(
+                Client.id.in_(client_ids), Client.user_id == self.user_id, Client.deleted_at.is_(None))}
+            for client_id in client_ids - live:
+                self.owned[client_id] = False
+                client_deleted(client_id)
+            for row_number, values in pending:
+                if not self.owned[values['client_id']]:
+                    self.report(row_number, 'Client not found or unauthorized')
+            pending = [(row_number, values) for row_number, values in pending if self.owned[values['client_id']]]
+            if pending:
+                entry_ids = write_rows(self.user_id, [values for _, values in pending], self.upsert)
+                db.session.commit()
+                self.inserted += len(set(entry_ids))
+        except Exception as e:
+            db.session.rollback()
+            for row_number, _ in pending:
+                self.report(row_number, f'Failed to write chunk: {str(e)}')
+        self.batch = []
+        self.batch_rows = []
+
+    def run(self, rows):
+        for row_number, row in rows:
+            self.add(row_number, row)
+        self.flush()
+        return self.summary()
+
+    def summary(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.errors_truncated
+        }
+
+
+def import_stream(stream, fmt, user_id, chunk_size=5000, upsert=False):
+    """Import every row in a CSV or NDJSON stream for the given user"""
+    lines = iter_lines(stream)
+    rows = iter_csv_rows(lines) if fmt == 'csv' else iter_ndjson_rows(lines)
+    return BulkImporter(user_id, chunk_size=chunk_size, upsert=upsert).run(rows)
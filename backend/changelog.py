@@ -0,0 +1,124 @@
+"""
+Change log behind GET /api/sync.
+
+Every route that writes a client or a weight entry also adds a change_log
+row (entity, id, 'upsert' or 'delete') in the same transaction. A row's id
+is the sync cursor: an offline client sends the last cursor it saw and gets
+back only the entities changed after it, read in their current state, plus
+ids of deleted ones. Deleting a client implies deleting its entries; they
+are not logged one by one.
+
+Writers take a per-user advisory lock on Postgres, so one user's change ids
+commit in id order and a reader can never step past an id that commits
+later. SQLite writers are serialised already.
+
+`flask --app app compact-change-log` keeps the table small:
+- rows older than SYNC_COMPACT_AFTER_DAYS that a later row of the same
+  entity supersedes are dropped, which every cursor can survive;
+- rows older than SYNC_RETENTION_DAYS are dropped outright. The highest id
+  dropped is kept as a watermark, and cursors behind it are told to reset
+  (reload in full, then sync from the returned cursor).
+"""
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select, text
+from models import db, ChangeLog, DataVersion
+
+CLIENT = 'client'
+ENTRY = 'entry'
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+# DataVersion row holding the highest change id removed by retention
+WATERMARK_SCOPE = 'sync'
+WATERMARK_KEY = 0
+
+
+def _lock(user_id):
+    """Serialise this user's change-log writers until commit (Postgres only; re-taking it is cheap)"""
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': user_id})
+
+
+def record(user_id, entity, entity_id, op=UPSERT):
+    """Log one write in the current transaction"""
+    record_many(user_id, entity, [entity_id], op)
+
+
+def record_many(user_id, entity, entity_ids, op=UPSERT):
+    """Log writes to many entities of one kind in the current transaction"""
+    if not entity_ids:
+        return
+    _lock(user_id)
+    now = datetime.utcnow()
+    db.session.execute(ChangeLog.__table__.insert(), [
+        {'user_id': user_id, 'entity': entity, 'entity_id': entity_id, 'op': op, 'created_at': now}
+        for entity_id in entity_ids
+    ])
+
+
+def head(user_id):
+    """The cursor for 'everything up to now'"""
+    head_id = db.session.query(func.max(ChangeLog.id)).filter(ChangeLog.user_id == user_id).scalar()
+    return max(head_id or 0, watermark())
+
+
+def watermark():
+    return db.session.query(DataVersion.version) \
+        .filter_by(scope=WATERMARK_SCOPE, key=WATERMARK_KEY).scalar() or 0
+
+
+def read_page(user_id, since, limit):
+    """
+    Changes after `since`, at most `limit` log rows, collapsed to the latest op
+    per entity. Returns ({(entity, entity_id): op}, next cursor, has_more).
+    """
+    rows = db.session.query(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.op) \
+        .filter(ChangeLog.user_id == user_id, ChangeLog.id > since) \
+        .order_by(ChangeLog.id).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = {}
+    for _, entity, entity_id, op in rows:
+        latest[(entity, entity_id)] = op
+    return latest, rows[-1].id if rows else since, has_more
+
+
+def compact(compact_before, retain_after):
+    """Drop superseded rows older than compact_before and all rows older than retain_after"""
+    ranked = select(
+        ChangeLog.id.label('id'),
+        ChangeLog.created_at.label('created_at'),
+        func.row_number().over(
+            partition_by=(ChangeLog.user_id, ChangeLog.entity, ChangeLog.entity_id), order_by=ChangeLog.id.desc()
+        ).label('rn')
+    ).subquery()
+    superseded = select(ranked.c.id).where(ranked.c.rn > 1, ranked.c.created_at < compact_before)
+    collapsed = db.session.execute(delete(ChangeLog).where(ChangeLog.id.in_(superseded))).rowcount
+
+    expired_max = db.session.query(func.max(ChangeLog.id)).filter(ChangeLog.created_at < retain_after).scalar()
+    expired = 0
+    if expired_max is not None:
+        expired = db.session.execute(delete(ChangeLog).where(ChangeLog.id <= expired_max)).rowcount
+        mark = db.session.get(DataVersion, (WATERMARK_SCOPE, WATERMARK_KEY))
+        if mark is None:
+            db.session.add(DataVersion(scope=WATERMARK_SCOPE, key=WATERMARK_KEY, version=expired_max,
+                                       updated_at=datetime.utcnow()))
+        else:
+            mark.version = max(mark.version, expired_max)
+            mark.updated_at = datetime.utcnow()
+    db.session.commit()
+    return collapsed, expired
+
+
+@click.command('compact-change-log')
+@with_appcontext
+def compact_change_log_command():
+    """Collapse and expire old sync change-log rows"""
+    config = current_app.config
+    now = datetime.utcnow()
+    collapsed, expired = compact(now - timedelta(days=config.get('SYNC_COMPACT_AFTER_DAYS', 7)),
+                                 now - timedelta(days=config.get('SYNC_RETENTION_DAYS', 90)))
+    click.echo(f'Removed {collapsed} superseded and {expired} expired change-log rows')
@@ -0,0 +1,249 @@
+"""
+Client search behind GET /api/clients/search.
+
+Each whitespace-separated term of the query has to appear somewhere in the
+client's name or email (so prefixes and infixes both match). Results whose
+name starts with the query come first, then the best ranked.
+
+- SQLite: an FTS5 table with the trigram tokenizer over client.name and
+  client.email, kept in step with the client table by triggers, so adds,
+  tombstones and purges need no code of their own. Ranked with bm25, name
+  weighted over email.
+- Postgres: pg_trgm GIN indexes on lower(name) and lower(email), which
+  serve the LIKE '%term%' filters; ranked by trigram similarity.
+
+Trigram indexes can't look up terms shorter than three characters; those
+are matched as word prefixes against the user's clients directly. Only the
+first SEARCH_CANDIDATES matches are ranked, which keeps a one-letter or
+"gmail" query as cheap as a specific one.
+
+When nothing matches, the query is retried as a fuzzy search so a typo
+still finds the client, scored by how much of the query's trigrams a run of
+words in the name or email shares: pg_trgm's word_similarity (<%) on
+Postgres; on SQLite the clients sharing any trigram with the query,
+re-scored in Python the same way.
+
+Without FTS5 or pg_trgm (the migration logs why) search falls back to
+plain LIKE scans.
+"""
+import re
+from sqlalchemy import Column, Integer, MetaData, String, Table, case, func, literal, literal_column, or_, select, text, union_all
+from sqlalchemy.exc import DBAPIError
+from models import db, Client
+
+FTS_TABLE = 'client_fts'
+# Postgres: GIN trigram indexes serving the LIKE filters
+TRGM_INDEXES = {
+    'ix_client_name_trgm': 'lower(name)',
+    'ix_client_email_trgm': 'lower(email)'
+}
+# Share of trigrams a fuzzy match must have in common with the query (pg_trgm's default for %)
+SIMILARITY_THRESHOLD = 0.3
+# Matches ranked per search; more than this are cut in index order (refine the query to see others)
+SEARCH_CANDIDATES = 1000
+# SQLite fuzzy search re-scores at most this many candidates
+FUZZY_CANDIDATES = 200
+
+client_fts = Table(FTS_TABLE, MetaData(), Column('rowid', Integer), Column('name', String), Column('email', String))
+
+SQLITE_SETUP = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"name, email, content='client', content_rowid='id', tokenize='trigram')",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON client BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON client BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, email ON client BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO {FTS_TABLE}(rowid, name, email) VALUES (new.id, new.name, new.email);
+    END""",
+    # Index the clients that existed before the table
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+)
+
+# Engine -> 'fts5', 'trgm' or 'like', detected on first search
+_backends = {}
+
+
+def create_index(conn, log=print):
+    """Create the search index for the connection's dialect; returns False if it isn't available"""
+    try:
+        with conn.begin_nested():
+            if conn.dialect.name == 'sqlite':
+                for statement in SQLITE_SETUP:
+                    conn.execute(text(statement))
+            elif conn.dialect.name == 'postgresql':
+                conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                for name, expression in TRGM_INDEXES.items():
+                    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON client USING gin ({expression} gin_trgm_ops)'))
+            else:
+                return False
+        return True
+    except DBAPIError as e:
+        # e.g. SQLite built without FTS5, or no permission to create the extension
+        log(f'Client search index not created, search will scan: {str(e.orig)}')
+        return False
+
+
+def backend():
+    engine = db.engine
+    if engine not in _backends:
+        with engine.connect() as conn:
+            if conn.dialect.name == 'sqlite':
+                found = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"),
+                                     {'name': FTS_TABLE}).first()
+                _backends[engine] = 'fts5' if found else 'like'
+            elif conn.dialect.name == 'postgresql':
+                found = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+                _backends[engine] = 'trgm' if found else 'like'
+            else:
+                _backends[engine] = 'like'
+    return _backends[engine]
+
+
+def normalize(query):
+    return ' '.join(query.lower().split())
+
+
+def trigrams(value):
+    """pg_trgm's trigram set: lowercase alphanumeric words padded with two spaces in front and one behind"""
+    grams = set()
+    for word in re.findall(r'[^\W_]+', value.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """pg_trgm's similarity(): shared trigrams over all distinct trigrams of both"""
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def word_similarity(query, value):
+    """Best similarity between the query and a run of as many consecutive words of value"""
+    words = re.findall(r'[^\W_]+', value.lower())
+    size = max(len(query.split()), 1)
+    runs = [' '.join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))]
+    return max(similarity(query, run) for run in runs)
+
+
+def _score(query, row):
+    return max(word_similarity(query, row.name), word_similarity(query, row.email))
+
+
+def _quote(term):
+    # An FTS5 string: the term as a substring, with no query syntax of its own
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _folded(column):
+    # SQLite's LIKE already ignores (ASCII) case; Postgres matches on the lower() its indexes are built on
+    return func.lower(column) if db.engine.dialect.name == 'postgresql' else column
+
+
+def _word_prefix(term):
+    """Term is a prefix of a word in the name, or of the email"""
+    pattern = _escape_like(term)
+    return or_(_folded(Client.name).like(f'{pattern}%', escape='\\'),
+               _folded(Client.name).like(f'% {pattern}%', escape='\\'),
+               _folded(Client.email).like(f'{pattern}%', escape='\\'))
+
+
+def _substring(term):
+    pattern = f'%{_escape_like(term)}%'
+    return or_(_folded(Client.name).like(pattern, escape='\\'),
+               _folded(Client.email).like(pattern, escape='\\'))
+
+
+def _name_prefix_first(query):
+    return case((_folded(Client.name).like(f'{_escape_like(query)}%', escape='\\'), 0), else_=1)
+
+
+def _owned(columns, user_id):
+    return db.session.query(*columns).filter(Client.user_id == user_id, Client.deleted_at.is_(None))
+
+
+def _matching(columns, user_id, query, engine_backend):
+    """Query of the user's clients where every term is in the name or email, best first"""
+    terms = query.split()
+    long_terms = [term for term in terms if len(term) >= 3]
+    short_terms = [term for term in terms if len(term) < 3]
+    score = None
+    candidates = select(Client.id.label('id')).where(Client.user_id == user_id, Client.deleted_at.is_(None))
+
+    if engine_backend == 'fts5' and long_terms:
+        score = func.bm25(literal_column(FTS_TABLE), 10.0, 1.0)
+        # Drive the join from the MATCH, not the user_id index: "+ 0" keeps SQLite from using that
+        # index, which would run the full-text lookup once per client
+        candidates = select(Client.id.label('id'), score.label('score')) \
+            .join(client_fts, client_fts.c.rowid == Client.id) \
+            .where(Client.user_id + 0 == user_id, Client.deleted_at.is_(None),
+                   literal_column(FTS_TABLE).op('MATCH')(' '.join(_quote(term) for term in long_terms)))
+    else:
+        candidates = candidates.where(*[_substring(term) for term in long_terms])
+        if engine_backend == 'trgm':
+            score = func.greatest(func.similarity(func.lower(Client.name), query),
+                                  func.similarity(func.lower(Client.email), query))
+            candidates = candidates.add_columns((-score).label('score'))
+    # Ranking every match of a very common term costs more than it tells; rank the first ones found
+    candidates = candidates.where(*[_word_prefix(term) for term in short_terms]) \
+        .limit(SEARCH_CANDIDATES).subquery()
+
+    order = [_name_prefix_first(query)] + ([candidates.c.score] if score is not None else [])
+    return db.session.query(*columns).join(candidates, candidates.c.id == Client.id) \
+        .order_by(*order, Client.name, Client.id)
+
+
+def _fuzzy(columns, user_id, query, engine_backend, offset, limit):
+    """Page of clients similar to the query, as (rows, has_more)"""
+    if engine_backend == 'trgm':
+        score = func.greatest(func.word_similarity(query, func.lower(Client.name)),
+                              func.word_similarity(query, func.lower(Client.email)))
+        # <% compares against pg_trgm.word_similarity_threshold (0.6 by default); use ours for this transaction
+        db.session.execute(select(func.set_config('pg_trgm.word_similarity_threshold', str(SIMILARITY_THRESHOLD), True)))
+        rows = _owned(columns, user_id) \
+            .filter(or_(literal(query).op('<%')(func.lower(Client.name)),
+                        literal(query).op('<%')(func.lower(Client.email)))) \
+            .order_by(score.desc(), Client.id).offset(offset).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+
+    grams = sorted({term[i:i + 3] for term in query.split() for i in range(len(term) - 2)})
+    if engine_backend != 'fts5' or not grams:
+        return [], False
+    # Candidates are the clients sharing the most trigrams with the query (names about as long as the
+    # query first among equals), then scored like pg_trgm
+    hits = union_all(*[
+        select(client_fts.c.rowid).where(literal_column(FTS_TABLE).op('MATCH')(_quote(gram))) for gram in grams
+    ]).subquery()
+    shared = select(hits.c.rowid, func.count().label('shared')).group_by(hits.c.rowid).subquery()
+    candidates = _owned(columns, user_id).join(shared, shared.c.rowid == Client.id) \
+        .order_by(shared.c.shared.desc(), func.abs(func.length(Client.name) - len(query)), Client.id) \
+        .limit(FUZZY_CANDIDATES).all()
+    scored = [(_score(query, row), row) for row in candidates]
+    scored = sorted((item for item in scored if item[0] >= SIMILARITY_THRESHOLD), key=lambda item: (-item[0], item[1].id))
+    return [row for _, row in scored[offset:offset + limit]], len(scored) > offset + limit
+
+
+def search(columns, user_id, query, page, per_page):
+    """One page of the user's clients matching the query: (rows, has_more, fuzzy)"""
+    query = normalize(query)
+    engine_backend = backend()
+    offset = (page - 1) * per_page
+    matching = _matching(columns, user_id, query, engine_backend)
+    rows = matching.offset(offset).limit(per_page + 1).all()
+    if rows:
+        return rows[:per_page], len(rows) > per_page, False
+    if page > 1 and matching.first() is not None:
+        # Past the last page of exact matches
+        return [], False, False
+    rows, has_more = _fuzzy(columns, user_id, query, engine_backend, offset, per_page)
+    return rows, has_more, bool(rows)
@@ -0,0 +1,327 @@
+"""
+Incremental maintenance of the per-client ClientStats aggregates.
+
+The weight routes call these helpers after flushing their change and before
+committing, so the aggregate row is written in the same transaction as the
+entry. Inserts only touch the stored counters, except that a weigh-in after
+the last one looks up the dates it moves out of the rolling windows. The
+cases that cannot be derived from the counters (removing the current
+first/last weigh-in or min/max) fall back to small indexed queries on
+(client_id, date).
+"""
+import click
+from collections import deque
+from datetime import timedelta
+from flask.cli import with_appcontext
+from sqlalchemy import and_, case, func
+from models import db, ClientStats, WeightEntry
+
+WINDOWS = (7, 30)
+REBUILD_CHUNK_SIZE = 1000
+
+
+def _reset(stats):
+    stats.entry_count = 0
+    stats.weight_sum = 0.0
+    stats.first_date = stats.first_weight = None
+    stats.last_date = stats.last_weight = None
+    stats.min_weight = stats.max_weight = None
+    for days in WINDOWS:
+        setattr(stats, f'window_{days}_sum', 0.0)
+        setattr(stats, f'window_{days}_count', 0)
+
+
+def _in_window(stats, days, entry_date):
+    return stats.last_date is not None and stats.last_date - timedelta(days=days) < entry_date <= stats.last_date
+
+
+def _entries(client_id):
+    return db.session.query(WeightEntry.date, WeightEntry.weight).filter(WeightEntry.client_id == client_id)
+
+
+def refresh_endpoints(stats):
+    """Reload first/last weigh-in from the (client_id, date) index"""
+    first = _entries(stats.client_id).order_by(WeightEntry.date, WeightEntry.id).first()
+    last = _entries(stats.client_id).order_by(WeightEntry.date.desc(), WeightEntry.id.desc()).first()
+    stats.first_date, stats.first_weight = first if first else (None, None)
+    stats.last_date, stats.last_weight = last if last else (None, None)
+
+
+def refresh_extremes(stats):
+    """Recompute min/max weight; only needed when the current extreme is removed"""
+    stats.min_weight, stats.max_weight = db.session.query(
+        func.min(WeightEntry.weight), func.max(WeightEntry.weight)
+    ).filter(WeightEntry.client_id == stats.client_id).one()
+
+
+def refresh_windows(stats):
+    """Recompute the rolling-window sums with a bounded date-range query"""
+    for days in WINDOWS:
+        total, count = 0.0, 0
+        if stats.last_date is not None:
+            total, count = db.session.query(
+                func.coalesce(func.sum(WeightEntry.weight), 0.0), func.count(WeightEntry.id)
+            ).filter(
+                WeightEntry.client_id == stats.client_id,
+                WeightEntry.date > stats.last_date - timedelta(days=days),
+                WeightEntry.date <= stats.last_date
+            ).one()
+        setattr(stats, f'window_{days}_sum', float(total))
+        setattr(stats, f'window_{days}_count', count)
+
+
+def get_stats(client_id):
+    """
+    Return the ClientStats row for a client. A client without one (created
+    before the table, and not backfilled with rebuild-client-stats yet) gets
+    an unsaved row computed from its entries, so reads never write.
+    """
+    stats = db.session.get(ClientStats, client_id)
+    if stats is None:
+        built = list(_build(_rows_query().filter(WeightEntry.client_id == client_id)))
+        stats = built[0] if built else _Accumulator(client_id).finish()
+    return stats
+
+
+def _add_to_windows(stats, entry_date, weight, sign=1):
+    for days in WINDOWS:
+        if _in_window(stats, days, entry_date):
+            setattr(stats, f'window_{days}_sum', getattr(stats, f'window_{days}_sum') + sign * weight)
+            setattr(stats, f'window_{days}_count', getattr(stats, f'window_{days}_count') + sign)
+
+
+def _slide_windows(stats, new_date, new_weight):
+    """Re-anchor the windows on a weigh-in after the last one: drop the dates that fell out, add the new entry"""
+    old_last = stats.last_date
+    dropped = {}
+    partial = [days for days in WINDOWS if new_date - timedelta(days=days) < old_last]
+    if partial:
+        # Only the days between the old and the new window start, from the (client_id, date) index
+        ranges = {days: and_(WeightEntry.date > old_last - timedelta(days=days),
+                             WeightEntry.date <= new_date - timedelta(days=days)) for days in partial}
+        columns = []
+        for days in partial:
+            columns += [func.coalesce(func.sum(case((ranges[days], WeightEntry.weight), else_=0.0)), 0.0),
+                        func.count(case((ranges[days], 1)))]
+        # The entry is already flushed; don't flush the half-updated aggregate row first
+        with db.session.no_autoflush:
+            row = db.session.query(*columns).filter(
+                WeightEntry.client_id == stats.client_id,
+                WeightEntry.date > old_last - timedelta(days=max(partial)),
+                WeightEntry.date <= new_date - timedelta(days=min(partial))
+            ).one()
+        for i, days in enumerate(partial):
+            dropped[days] = (float(row[2 * i]), row[2 * i + 1])
+    for days in WINDOWS:
+        if days in partial:
+            total = getattr(stats, f'window_{days}_sum') - dropped[days][0] + new_weight
+            count = getattr(stats, f'window_{days}_count') - dropped[days][1] + 1
+        else:
+            # The whole old window is out of range; only the new entry is left
+            total, count = new_weight, 1
+        setattr(stats, f'window_{days}_sum', total)
+        setattr(stats, f'window_{days}_count', count)
+    stats.last_date, stats.last_weight = new_date, new_weight
+
+
+def apply_change(client_id, removed=None, added=None):
+    """
+    Update a client's aggregates for one entry change.
+
+    `removed` and `added` are (date, weight) tuples for the old and new state of
+    the entry; an insert passes only `added`, a delete only `removed` and an
+    update both. Call after db.session.flush() so fallback queries see the change.
+
+    Inserts are folded in from the stored values. Queries run only when the
+    row held as first/last weigh-in or min/max is removed (or an update
+    lands on an endpoint's date), and to find the dates a newer weigh-in
+    moves out of the rolling windows.
+    """
+    stats = db.session.get(ClientStats, client_id)
+    if stats is None:
+        # No aggregate yet: build it from the already-flushed rows
+        return rebuild_client(client_id)
+
+    old_last_date = stats.last_date
+    endpoints_stale = extremes_stale = False
+
+    if removed:
+        removed_date, removed_weight = removed
+        stats.entry_count -= 1
+        stats.weight_sum -= removed_weight
+        if removed in ((stats.first_date, stats.first_weight), (stats.last_date, stats.last_weight)):
+            endpoints_stale = True
+        if removed_weight in (stats.min_weight, stats.max_weight):
+            extremes_stale = True
+        _add_to_windows(stats, removed_date, removed_weight, sign=-1)
+
+    if stats.entry_count <= 0 and not added:
+        _reset(stats)
+        return stats
+
+    if added:
+        added_date, added_weight = added
+        stats.entry_count += 1
+        stats.weight_sum += added_weight
+        if stats.min_weight is None or added_weight < stats.min_weight:
+            stats.min_weight = added_weight
+        if stats.max_weight is None or added_weight > stats.max_weight:
+            stats.max_weight = added_weight
+
+        if stats.last_date is None:
+            # First entry of the client
+            stats.first_date, stats.first_weight = added
+            stats.last_date, stats.last_weight = added
+            _add_to_windows(stats, added_date, added_weight)
+            old_last_date = stats.last_date
+        elif removed and added_date in (stats.first_date, stats.last_date):
+            # An updated row keeps its id, so whether it now sorts before or after
+            # the other entries of that date needs the index
+            endpoints_stale = True
+            _add_to_windows(stats, added_date, added_weight)
+        elif endpoints_stale:
+            _add_to_windows(stats, added_date, added_weight)
+        else:
+            # A new row has the highest id, so it sorts last among entries of its date
+            if added_date < stats.first_date:
+                stats.first_date, stats.first_weight = added
+            if added_date > stats.last_date:
+                _slide_windows(stats, added_date, added_weight)
+                old_last_date = stats.last_date
+            else:
+                if added_date == stats.last_date:
+                    stats.last_weight = added_weight
+                _add_to_windows(stats, added_date, added_weight)
+
+    if endpoints_stale:
+        refresh_endpoints(stats)
+    if extremes_stale:
+        refresh_extremes(stats)
+    if stats.last_date != old_last_date:
+        # The windows are anchored on the last weigh-in, so they moved with it
+        refresh_windows(stats)
+
+    return stats
+
+
+def apply_bulk_added(client_id, rows):
+    """Fold a batch of inserted (date, weight) rows into a client's aggregates"""
+    stats = db.session.get(ClientStats, client_id)
+    if stats is None:
+        return rebuild_client(client_id)
+
+    weights = [weight for _, weight in rows]
+    stats.entry_count += len(weights)
+    stats.weight_sum += sum(weights)
+    stats.min_weight = min(weights + ([stats.min_weight] if stats.min_weight is not None else []))
+    stats.max_weight = max(weights + ([stats.max_weight] if stats.max_weight is not None else []))
+    refresh_endpoints(stats)
+    refresh_windows(stats)
+    return stats
+
+
+class _Accumulator:
+    """Builds one client's aggregates from its rows in (date, id) order"""
+
+    def __init__(self, client_id):
+        self.stats = ClientStats(client_id=client_id)
+        _reset(self.stats)
+        self.recent = deque()
+
+    def add(self, entry_date, weight):
+        stats = self.stats
+        if stats.entry_count == 0:
+            stats.first_date, stats.first_weight = entry_date, weight
+            stats.min_weight = stats.max_weight = weight
+        stats.entry_count += 1
+        stats.weight_sum += weight
+        stats.last_date, stats.last_weight = entry_date, weight
+        stats.min_weight = min(stats.min_weight, weight)
+        stats.max_weight = max(stats.max_weight, weight)
+        # Only the trailing longest window is ever needed
+        self.recent.append((entry_date, weight))
+        while self.recent[0][0] <= entry_date - timedelta(days=max(WINDOWS)):
+            self.recent.popleft()
+
+    def finish(self):
+        stats = self.stats
+        for days in WINDOWS:
+            values = [w for d, w in self.recent if _in_window(stats, days, d)]
+            setattr(stats, f'window_{days}_sum', float(sum(values)))
+            setattr(stats, f'window_{days}_count', len(values))
+        return stats
+
+
+def _build(query):
+    """Stream (client_id, date, weight) rows and yield finished ClientStats objects"""
+    current = None
+    for client_id, entry_date, weight in query.yield_per(REBUILD_CHUNK_SIZE):
+        if current is None or current.stats.client_id != client_id:
+            if current is not None:
+                yield current.finish()
+            current = _Accumulator(client_id)
+        current.add(entry_date, weight)
+    if current is not None:
+        yield current.finish()
+
+
+def _rows_query():
+    return db.session.query(WeightEntry.client_id, WeightEntry.date, WeightEntry.weight) \
+        .order_by(WeightEntry.client_id, WeightEntry.date, WeightEntry.id)
+
+
+def rebuild_client(client_id):
+    """Recompute one client's aggregates from scratch (does not commit)"""
+    stats = db.session.get(ClientStats, client_id)
+    if stats is None:
+        stats = ClientStats(client_id=client_id)
+        db.session.add(stats)
+    built = list(_build(_rows_query().filter(WeightEntry.client_id == client_id)))
+    if built:
+        for column in ClientStats.__table__.columns.keys():
+            if column not in ('client_id', 'updated_at'):
+                setattr(stats, column, getattr(built[0], column))
+    else:
+        _reset(stats)
+    return stats
+
+
+def rebuild_all():
+    """Backfill ClientStats for every client in one streaming pass"""
+    from models import Client
+
+    db.session.query(ClientStats).delete()
+    rows = []
+    total = 0
+    seen = set()
+    for stats in _build(_rows_query()):
+        seen.add(stats.client_id)
+        rows.append({c: getattr(stats, c) for c in ClientStats.__table__.columns.keys() if c != 'updated_at'})
+        if len(rows) >= REBUILD_CHUNK_SIZE:
+            db.session.execute(ClientStats.__table__.insert(), rows)
+            total += len(rows)
+            rows = []
+
+    # Clients without any entries still get an (empty) aggregate row
+    for (client_id,) in db.session.query(Client.id):
+        if client_id not in seen:
+            empty = _Accumulator(client_id).finish()
+            rows.append({c: getattr(empty, c) for c in ClientStats.__table__.columns.keys() if c != 'updated_at'})
+            if len(rows) >= REBUILD_CHUNK_SIZE:
+                db.session.execute(ClientStats.__table__.insert(), rows)
+                total += len(rows)
+                rows = []
+
+    if rows:
+        db.session.execute(ClientStats.__table__.insert(), rows)
+        total += len(rows)
+    db.session.commit()
+    return total
+
+
+@click.command('rebuild-client-stats')
+@with_appcontext
+def rebuild_client_stats_command():
+    """Backfill the per-client aggregate table from weight_entry."""
+    total = rebuild_all()
+    click.echo(f"Rebuilt stats for {total} clients")
@@ -0,0 +1,165 @@
+"""
+Single-flight coalescing of identical concurrent reads.
+
+Routes decorated with @coalesced share work between requests that arrive
+while an identical one is still running in the same worker (duplicate
+fetches from a remounting page, the same dashboard open on two devices).
+The first request runs the view; the others wait for it and answer with a
+copy of its status, headers and serialized body, without a query of their
+own. Compression and the other after_request hooks still run per request.
+
+Requests are identical when they have the same data owner, path, query
+parameters (in any order) and conditional headers. Nothing is kept once the
+first request finishes: this only merges requests that overlap in time, and
+the version counters stay the only cache.
+
+A commit that bumps a user's version counter (see versions.py) drops that
+user's pending keys, so a request arriving after a write never joins a
+computation that started before it. Requests already waiting still get the
+result they asked for before the write, as they would have without
+coalescing.
+
+Waiting needs a threaded worker (gunicorn.conf.py uses gthread). If the
+first request fails or takes longer than COALESCE_WAIT_TIMEOUT, the waiting
+ones run the view themselves.
+"""
+import threading
+from functools import wraps
+from flask import current_app, request
+from flask_login import current_user
+from sqlalchemy import event
+from models import db
+
+# session.info key of the users whose counters the current transaction bumped
+_TOUCHED = 'coalesce_users'
+
+
+class _Flight:
+    __slots__ = ('done', 'result')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlight:
+    """In-flight computations by key, shared by the threads of one worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+        self.fallbacks = 0
+        self.invalidated = 0
+
+    def run(self, key, compute, timeout):
+        """
+        compute() returns (response, shareable copy or None). The first caller
+        of a key gets its own response; the others get the copy, or run
+        compute() themselves if there is none.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if leader:
+            try:
+                response, flight.result = compute()
+                return response
+            finally:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+                flight.done.set()
+
+        if flight.done.wait(timeout) and flight.result is not None:
+            return flight.result
+        self.fallbacks += 1
+        return compute()[0]
+
+    def invalidate(self, owner):
+        """Let the owner's next requests start afresh instead of joining pending ones"""
+        with self._lock:
+            stale = [key for key in self._flights if key[0] == owner]
+            for key in stale:
+                del self._flights[key]
+            self.invalidated += len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'followers': self.followers,
+                'fallbacks': self.fallbacks,
+                'invalidated': self.invalidated
+            }
+
+
+flights = SingleFlight()
+
+
+def touch(owner):
+    """The current transaction changes the owner's data; drop their pending keys when it commits"""
+    db.session.info.setdefault(_TOUCHED, set()).add(owner)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+    # Also sent when a savepoint is released, before anything is visible to other requests
+    if session.in_nested_transaction():
+        return
+    for owner in session.info.pop(_TOUCHED, ()):
+        flights.invalidate(owner)
+
+
+def _key(owner):
+    args = tuple(sorted(request.args.items(multi=True)))
+    return (owner, request.path, args,
+            request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since'))
+
+
+def _copy(response):
+    """(body, status, headers) of a complete response, or None if it can't be replayed"""
+    if response.is_streamed or response.direct_passthrough or response.status_code >= 500:
+        return None
+    return response.get_data(), response.status, list(response.headers.items())
+
+
+def coalesced(owner=None):
+    """
+    Share one run of the view between identical concurrent requests. owner()
+    returns the id of the user whose data the view reads (the logged-in user
+    by default).
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config.get('COALESCE_READS'):
+                return view(*args, **kwargs)
+
+            def compute():
+                response = current_app.make_response(view(*args, **kwargs))
+                return response, _copy(response)
+
+            key = _key(owner() if owner else current_user.id)
+            response = flights.run(key, compute, current_app.config.get('COALESCE_WAIT_TIMEOUT', 10))
+            if isinstance(response, tuple):
+                body, status, headers = response
+                return current_app.response_class(body, status=status, headers=headers)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    return flights.stats()
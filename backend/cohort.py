@@ -0,0 +1,194 @@
+"""
+Cohort analytics across all of a coach's clients, computed in the database.
+
+Three statements answer the whole dashboard whatever the number of clients:
+- movers: each client's first and last weigh-in inside the window (two
+  row_number() windows over weight_entry, folded by GROUP BY), ranked by
+  change with rank() so only the top gainers and losers come back;
+- bands: percentiles of the clients' weekly rate of change, taken with
+  cume_dist() over the same per-client rows;
+- inactive: clients whose latest weigh-in (MAX(date), or none) is older
+  than the threshold.
+
+Per-client scans run on the (client_id, date) index of weight_entry and the
+owner filter on the client.user_id index. The SQL sticks to window functions
+that SQLite (3.25+) and Postgres both implement; the only dialect-specific
+piece is turning a date into a day number, see day_number below.
+"""
+from datetime import date, timedelta
+from sqlalchemy import Integer, and_, case, func, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from models import db, Client, WeightEntry
+
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 3650
+DEFAULT_INACTIVE_DAYS = 14
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 100
+MAX_INACTIVE = 500
+
+# Percentile bands of the weekly rate, as (name, fraction)
+PERCENTILES = (('p10', 0.1), ('p25', 0.25), ('p50', 0.5), ('p75', 0.75), ('p90', 0.9))
+
+# Weekly rates from spans shorter than this are too noisy to rank
+MIN_RATE_SPAN_DAYS = 7
+
+
+class day_number(FunctionElement):
+    """Days since 1970-01-01 for a DATE expression"""
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(day_number)
+def _day_number_default(element, compiler, **kw):
+    return f"({compiler.process(element.clauses, **kw)} - DATE '1970-01-01')"
+
+
+@compiles(day_number, 'sqlite')
+def _day_number_sqlite(element, compiler, **kw):
+    return f"CAST(julianday({compiler.process(element.clauses, **kw)}) - 2440587.5 AS INTEGER)"
+
+
+def parse_args(args):
+    """Read days, inactive_days and limit from query args; raises ValueError with a message"""
+    try:
+        days = int(args.get('days', DEFAULT_WINDOW_DAYS))
+        inactive_days = int(args.get('inactive_days', DEFAULT_INACTIVE_DAYS))
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError('days, inactive_days and limit must be integers')
+    if not 1 <= days <= MAX_WINDOW_DAYS:
+        raise ValueError(f'days must be between 1 and {MAX_WINDOW_DAYS}')
+    if not 1 <= inactive_days <= MAX_WINDOW_DAYS:
+        raise ValueError(f'inactive_days must be between 1 and {MAX_WINDOW_DAYS}')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT}')
+    return days, inactive_days, limit
+
+
+def _owned(user_id):
+    return db.session.query(Client.id).filter(Client.user_id == user_id, Client.deleted_at.is_(None))
+
+
+def client_changes(user_id, since):
+    """Subquery: one row per client with entries since `since` - first/last weight, span and rate"""
+    ordered = db.session.query(
+        WeightEntry.client_id.label('client_id'),
+        WeightEntry.date.label('date'),
+        WeightEntry.weight.label('weight'),
+        func.row_number().over(
+            partition_by=WeightEntry.client_id, order_by=(WeightEntry.date, WeightEntry.id)
+        ).label('rn_first'),
+        func.row_number().over(
+            partition_by=WeightEntry.client_id, order_by=(WeightEntry.date.desc(), WeightEntry.id.desc())
+        ).label('rn_last')
+    ).filter(WeightEntry.client_id.in_(_owned(user_id)), WeightEntry.date >= since).subquery()
+
+    first_weight = func.max(case((ordered.c.rn_first == 1, ordered.c.weight)))
+    last_weight = func.max(case((ordered.c.rn_last == 1, ordered.c.weight)))
+    span = day_number(func.max(ordered.c.date)) - day_number(func.min(ordered.c.date))
+    return db.session.query(
+        ordered.c.client_id.label('client_id'),
+        func.count().label('entries'),
+        func.min(ordered.c.date).label('first_date'),
+        func.max(ordered.c.date).label('last_date'),
+        first_weight.label('first_weight'),
+        last_weight.label('last_weight'),
+        (last_weight - first_weight).label('change'),
+        case((span >= MIN_RATE_SPAN_DAYS, (last_weight - first_weight) * 7.0 / span)).label('weekly_rate')
+    ).group_by(ordered.c.client_id).having(func.count() >= 2).subquery()
+
+
+def movers(user_id, since, limit):
+    """Top `limit` gainers and losers over the window, each with their rank"""
+    changes = client_changes(user_id, since)
+    ranked = db.session.query(
+        changes,
+        Client.name.label('name'),
+        func.rank().over(order_by=changes.c.change.desc()).label('gain_rank'),
+        func.rank().over(order_by=changes.c.change).label('loss_rank')
+    ).join(Client, Client.id == changes.c.client_id).subquery()
+
+    rows = db.session.query(ranked).filter(or_(
+        and_(ranked.c.gain_rank <= limit, ranked.c.change > 0),
+        and_(ranked.c.loss_rank <= limit, ranked.c.change < 0)
+    )).all()
+
+    gainers = sorted((row for row in rows if row.change > 0), key=lambda row: (row.gain_rank, row.client_id))
+    losers = sorted((row for row in rows if row.change < 0), key=lambda row: (row.loss_rank, row.client_id))
+    return [_mover(row, row.gain_rank) for row in gainers][:limit], \
+        [_mover(row, row.loss_rank) for row in losers][:limit]
+
+
+def _mover(row, rank):
+    return {
+        'rank': rank,
+        'client_id': row.client_id,
+        'name': row.name,
+        'entries': row.entries,
+        'first_date': _iso(row.first_date),
+        'last_date': _iso(row.last_date),
+        'first_weight': round(row.first_weight, 3),
+        'last_weight': round(row.last_weight, 3),
+        'change': round(row.change, 3),
+        'weekly_rate': round(row.weekly_rate, 3) if row.weekly_rate is not None else None
+    }
+
+
+def weekly_rate_bands(user_id, since):
+    """Nearest-rank percentiles of the clients' weekly rate, plus how many clients they cover"""
+    changes = client_changes(user_id, since)
+    distributed = db.session.query(
+        changes.c.weekly_rate.label('rate'),
+        func.cume_dist().over(order_by=changes.c.weekly_rate).label('position')
+    ).filter(changes.c.weekly_rate.isnot(None)).subquery()
+
+    row = db.session.query(
+        func.count().label('clients'),
+        func.min(distributed.c.rate).label('min'),
+        func.max(distributed.c.rate).label('max'),
+        *[func.min(case((distributed.c.position >= fraction, distributed.c.rate))).label(name)
+          for name, fraction in PERCENTILES]
+    ).one()
+
+    bands = {name: round(getattr(row, name), 3) if row.clients else None
+             for name in ['min'] + [name for name, _ in PERCENTILES] + ['max']}
+    return dict(bands, clients=row.clients)
+
+
+def inactive(user_id, inactive_days, today=None):
+    """Clients with no weigh-in in the last `inactive_days` days (or none at all), longest silent first"""
+    cutoff = (today or date.today()) - timedelta(days=inactive_days)
+    last_date = func.max(WeightEntry.date)
+    rows = db.session.query(
+        Client.id, Client.name, last_date.label('last_date'),
+        func.count().over().label('total')
+    ).outerjoin(WeightEntry, WeightEntry.client_id == Client.id) \
+        .filter(Client.user_id == user_id, Client.deleted_at.is_(None)) \
+        .group_by(Client.id, Client.name) \
+        .having(or_(last_date.is_(None), last_date < cutoff)) \
+        .order_by(last_date.isnot(None), last_date, Client.id) \
+        .limit(MAX_INACTIVE).all()
+
+    today = today or date.today()
+    clients = [
+        {
+            'client_id': row.id,
+            'name': row.name,
+            'last_date': _iso(row.last_date),
+            'days_since': (today - _as_date(row.last_date)).days if row.last_date else None
+        }
+        for row in rows
+    ]
+    return clients, rows[0].total if rows else 0
+
+
+def _as_date(value):
+    # Aggregates over a Date column come back as strings on SQLite
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _iso(value):
+    return _as_date(value).isoformat() if value else None
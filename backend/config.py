@@ -45,6 +45,10 @@ class Config:
         SQLALCHEMY_ENGINE_OPTIONS = {}
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Apply pending schema migrations at boot. Off by default when DATABASE_URL is
+    # set: production runs 'flask --app app db-upgrade' once per deploy instead.
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '0' if os.environ.get('DATABASE_URL') else '1') == '1'
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'development-secret-key-for-testing-only'
 
     # Flask-Login configuration
@@ -57,5 +61,82 @@ class Config:
     SESSION_COOKIE_HTTPONLY = True  # Prevent JavaScript access to session cookie
     SESSION_COOKIE_SAMESITE = 'None'  # Allow cross-site cookies
 
+    # Bulk import: rows written per multi-row INSERT / transaction
+    BULK_IMPORT_CHUNK_SIZE = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', 5000))
+
+    # Per-worker caches for users and client ownership
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    OWNER_CACHE_SIZE = int(os.environ.get('OWNER_CACHE_SIZE', 10000))
+
+    # Client deletion: histories up to this many entries are deleted inside the
+    # request, larger ones are tombstoned and purged in the background in chunks
+    PURGE_SYNC_MAX_ENTRIES = int(os.environ.get('PURGE_SYNC_MAX_ENTRIES', 10000))
+    PURGE_CHUNK_SIZE = int(os.environ.get('PURGE_CHUNK_SIZE', 5000))
+
+    # At most one weight entry per client per day: POST /api/weight and bulk
+    # imports upsert on (client_id, date). Needs the unique index created by
+    # 'flask dedup-weight-entries --unique-index'
+    ONE_ENTRY_PER_DAY = os.environ.get('ONE_ENTRY_PER_DAY', '0') == '1'
+
+    # Idempotency-Key header: how long stored responses are replayed (seconds)
+    # and how often (in reservations) expired keys are swept
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400))
+    IDEMPOTENCY_SWEEP_EVERY = int(os.environ.get('IDEMPOTENCY_SWEEP_EVERY', 100))
+
+    # Sync change log: superseded rows older than this are collapsed, and all
+    # rows older than the retention are dropped (older cursors must reload)
+    SYNC_COMPACT_AFTER_DAYS = int(os.environ.get('SYNC_COMPACT_AFTER_DAYS', 7))
+    SYNC_RETENTION_DAYS = int(os.environ.get('SYNC_RETENTION_DAYS', 90))
+
+    # Write-behind for POST /api/weight: rows are queued per worker and written
+    # in grouped inserts every WRITE_BEHIND_INTERVAL_MS or WRITE_BEHIND_MAX_ROWS
+    # rows. With WRITE_BEHIND_WAIT (or ?wait=1) replies wait for the commit
+    WRITE_BEHIND = os.environ.get('WRITE_BEHIND', '0') == '1'
+    WRITE_BEHIND_MAX_ROWS = int(os.environ.get('WRITE_BEHIND_MAX_ROWS', 500))
+    WRITE_BEHIND_INTERVAL_MS = int(os.environ.get('WRITE_BEHIND_INTERVAL_MS', 50))
+    WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_QUEUE_SIZE', 10000))
+    WRITE_BEHIND_WAIT = os.environ.get('WRITE_BEHIND_WAIT', '0') == '1'
+    WRITE_BEHIND_WAIT_TIMEOUT = float(os.environ.get('WRITE_BEHIND_WAIT_TIMEOUT', 10))
+
+    # Per-worker array cache of clients' weight series, bounded in bytes (0 disables it)
+    SERIES_CACHE_MAX_BYTES = int(os.environ.get('SERIES_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+    # Rendered SVG sparklines: per-worker memory LRU in bytes (0 disables it) and an optional shared directory
+    SPARKLINE_CACHE_MAX_BYTES = int(os.environ.get('SPARKLINE_CACHE_MAX_BYTES', 4 * 1024 * 1024))
+    SPARKLINE_CACHE_DIR = os.environ.get('SPARKLINE_CACHE_DIR') or None
+
+    # Identical read requests running at the same time in a worker share one
+    # computation; waiting requests give up after COALESCE_WAIT_TIMEOUT seconds
+    COALESCE_READS = os.environ.get('COALESCE_READS', '1') == '1'
+    COALESCE_WAIT_TIMEOUT = float(os.environ.get('COALESCE_WAIT_TIMEOUT', 10))
+
+    # Password hashing: pbkdf2 cost and the per-worker hashing pool
+    PASSWORD_HASH_ITERATIONS = int(os.environ.get('PASSWORD_HASH_ITERATIONS', 600000))
+    HASH_POOL_WORKERS = int(os.environ.get('HASH_POOL_WORKERS', 2))
+    HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', 8))
+    HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 10))
+
+    # Compress JSON/CSV responses larger than this many bytes (gzip, or brotli if installed)
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+
+    # Instrumentation: log requests slower than this (ms) with their SQL; unset to disable
+    SLOW_REQUEST_MS = int(os.environ['SLOW_REQUEST_MS']) if os.environ.get('SLOW_REQUEST_MS') else None
+    # Requests sent with 'X-Profile: <token>' get a sampling profile logged; unset to disable
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    PROFILE_INTERVAL_MS = int(os.environ.get('PROFILE_INTERVAL_MS', 5))
+
+    # SQLite profile (file-backed SQLite only): WAL, tuned pragmas, bounded pools
+    # and a separate read-only pool for GET routes. SQLITE_TUNED=0 restores the
+    # plain single-connection-per-thread setup.
+    SQLITE_TUNED = os.environ.get('SQLITE_TUNED', '1') != '0'
+    SQLITE_WRITE_POOL_SIZE = int(os.environ.get('SQLITE_WRITE_POOL_SIZE', 4))
+    SQLITE_READ_POOL_SIZE = int(os.environ.get('SQLITE_READ_POOL_SIZE', 8))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+
     # For testing purposes, disable CSRF protection
     WTF_CSRF_ENABLED = False
@@ -0,0 +1,148 @@
+"""
+One-entry-per-day mode: at most one weight entry per client per date.
+
+With ONE_ENTRY_PER_DAY on, POST /api/weight and bulk imports write with
+INSERT ... ON CONFLICT (client_id, date) DO UPDATE, so a retried or repeated
+weigh-in replaces that day's entry instead of adding a duplicate. The
+conflict target needs a unique index on (client_id, date), which existing
+data may violate, so it is not part of the migrations. Clean up and create
+it with:
+
+    flask --app app dedup-weight-entries --dry-run
+    flask --app app dedup-weight-entries --unique-index
+
+before turning the mode on. The dedup keeps the most recently written entry
+of each (client_id, date) group (or the first with --keep first).
+"""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Client, WeightEntry
+from client_stats import rebuild_client
+from versions import bump_client
+import changelog
+
+UNIQUE_INDEX = 'ux_weight_entry_client_id_date'
+
+
+def enabled():
+    return bool(current_app.config.get('ONE_ENTRY_PER_DAY'))
+
+
+def has_unique_index(conn):
+    return any(index['name'] == UNIQUE_INDEX for index in inspect(conn).get_indexes('weight_entry'))
+
+
+def create_unique_index(conn):
+    conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {UNIQUE_INDEX} ON weight_entry (client_id, date)'))
+
+
+def upsert_statement():
+    """INSERT into weight_entry that replaces the weight of an existing (client_id, date) row"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(WeightEntry.__table__)
+    return stmt.on_conflict_do_update(index_elements=['client_id', 'date'], set_={'weight': stmt.excluded.weight})
+
+
+def upsert_entry(client_id, user_id, entry_date, weight):
+    """
+    Write the client's entry for the day; returns (entry id, previous weight or
+    None if it was new), or None if the client is deleted or not the user's
+    """
+    # Checks the client inside the transaction, and serialises writers per client
+    # on Postgres (SQLite's write transaction already does)
+    owned = db.session.query(Client.id) \
+        .filter(Client.id == client_id, Client.user_id == user_id, Client.deleted_at.is_(None)) \
+        .with_for_update().scalar()
+    if owned is None:
+        return None
+    previous = db.session.query(WeightEntry.weight) \
+        .filter(WeightEntry.client_id == client_id, WeightEntry.date == entry_date).scalar()
+    entry_id = db.session.execute(
+        upsert_statement().values(client_id=client_id, date=entry_date, weight=weight)
+        .returning(WeightEntry.__table__.c.id)
+    ).scalar_one()
+    return entry_id, previous
+
+
+def upsert_rows(rows):
+    """Upsert a batch of weight_entry value dicts (the last row wins within the batch); returns each row's entry id"""
+    latest = {(row['client_id'], row['date']): row for row in rows}
+    # One statement can't update the same row twice, hence the de-duplication above
+    entry_ids = db.session.execute(
+        upsert_statement().returning(WeightEntry.__table__.c.id, sort_by_parameter_order=True),
+        list(latest.values())
+    ).scalars().all()
+    by_key = dict(zip(latest, entry_ids))
+    return [by_key[(row['client_id'], row['date'])] for row in rows]
+
+
+def duplicate_ids(keep='latest'):
+    """Select of entry ids that share (client_id, date) with the entry being kept"""
+    order = WeightEntry.id.desc() if keep == 'latest' else WeightEntry.id
+    ranked = select(
+        WeightEntry.id.label('id'),
+        func.row_number().over(partition_by=(WeightEntry.client_id, WeightEntry.date), order_by=order).label('rn')
+    ).subquery()
+    return select(ranked.c.id).where(ranked.c.rn > 1)
+
+
+@click.command('dedup-weight-entries')
+@click.option('--keep', type=click.Choice(['latest', 'first']), default='latest',
+              help='Which entry of a same-day group survives (by insertion order)')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+@click.option('--unique-index', is_flag=True, help='Then create the unique (client_id, date) index')
+@with_appcontext
+def dedup_weight_entries_command(keep, dry_run, unique_index):
+    """Remove duplicate same-day weight entries"""
+    duplicates = duplicate_ids(keep).subquery()
+    affected = db.session.query(WeightEntry.client_id, Client.user_id, func.count()) \
+        .join(Client, Client.id == WeightEntry.client_id) \
+        .filter(WeightEntry.id.in_(select(duplicates.c.id))) \
+        .group_by(WeightEntry.client_id, Client.user_id).all()
+    total = sum(count for _, _, count in affected)
+    click.echo(f'{total} duplicate entries across {len(affected)} clients')
+    if dry_run:
+        return
+
+    if affected:
+        removed = db.session.query(Client.user_id, WeightEntry.id) \
+            .join(Client, Client.id == WeightEntry.client_id) \
+            .filter(WeightEntry.id.in_(select(duplicates.c.id))).all()
+        by_user = {}
+        for user_id, entry_id in removed:
+            by_user.setdefault(user_id, []).append(entry_id)
+        for user_id, entry_ids in by_user.items():
+            if user_id is not None:
+                changelog.record_many(user_id, changelog.ENTRY, entry_ids, changelog.DELETE)
+        db.session.execute(delete(WeightEntry).where(WeightEntry.id.in_(select(duplicates.c.id))))
+        for client_id, user_id, _ in affected:
+            rebuild_client(client_id)
+            bump_client(client_id, user_id)
+        db.session.commit()
+        click.echo(f'Removed {total} entries')
+
+    if unique_index:
+        # End the session's transaction first; on SQLite it holds the write lock the index needs
+        db.session.commit()
+        with db.engine.begin() as conn:
+            create_unique_index(conn)
+        click.echo(f'Created unique index {UNIQUE_INDEX}')
+
+
+def init_app(app):
+    """Warn at boot if the mode is on but the unique index it relies on is missing"""
+    if not app.config.get('ONE_ENTRY_PER_DAY'):
+        return
+    with app.app_context():
+        try:
+            with db.engine.connect() as conn:
+                if not has_unique_index(conn):
+                    app.logger.error(f"ONE_ENTRY_PER_DAY is on but index {UNIQUE_INDEX} is missing; "
+                                     f"run 'flask --app app dedup-weight-entries --unique-index'")
+        except Exception as e:
+            app.logger.error(f"Error checking for index {UNIQUE_INDEX}: {str(e)}")
+        finally:
+            db.engine.dispose()
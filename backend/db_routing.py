@@ -0,0 +1,39 @@
+"""
+Read/write routing for the SQLAlchemy session.
+
+Routes decorated with @read_only send their SELECTs to the 'read' bind when
+one is configured (see sqlite_profile.py). Flushes and INSERT/UPDATE/DELETE
+statements always go to the primary engine, and once a request has written
+it stays on the primary so it reads its own changes.
+"""
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql import Select
+
+READ_BIND = 'read'
+
+
+class RoutingSession(Session):
+    """Session that serves reads from the 'read' bind inside @read_only routes"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('read_only'):
+            if self._flushing or (clause is not None and not isinstance(clause, Select)):
+                g.read_only = False
+            else:
+                engine = self._db.engines.get(READ_BIND)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Mark a view as read-mostly so its queries may use the read pool"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,83 @@
+"""
+Downsampling of weight series for charts.
+
+Both methods take x as day ordinals and y as weights (sorted by x) and return
+at most `n_out` points, so chart payloads stay the same size however long a
+client's history gets.
+"""
+import numpy as np
+
+KG_TO_LBS_FACTOR = 2.20462
+
+
+def cached_series_arrays(series, lo, hi):
+    """Day-ordinal and weight arrays for entries [lo, hi) of a series_cache.ClientSeries"""
+    # Views over the cached arrays, copied once by the slice/astype
+    x = np.frombuffer(series.days, dtype=np.int32)[lo:hi].astype(np.int64)
+    y = np.frombuffer(series.weights, dtype=np.float64)[lo:hi].copy()
+    return x, y
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: pick the indices of n_out representative points"""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    # Average point of every bucket, used as the third triangle vertex
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[n - 1])
+    avg_y = np.append(sums_y / counts, y[n - 1])
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        bx = x[start:end]
+        by = y[start:end]
+        # Twice the triangle area for every candidate in the bucket at once
+        areas = np.abs((x[a] - avg_x[i + 1]) * (by - y[a]) - (x[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    return selected
+
+
+def bucket_min_mean_max(x, y, n_buckets, x_start=None, x_end=None):
+    """Split [x_start, x_end] into equal time buckets and return per-bucket stats"""
+    if len(x) == 0:
+        empty = np.array([])
+        return empty, empty, empty, empty, empty
+
+    x_start = x[0] if x_start is None else x_start
+    x_end = x[-1] if x_end is None else x_end
+    span = max(x_end - x_start + 1, 1)
+    n_buckets = max(min(n_buckets, span), 1)
+
+    bucket = ((x - x_start) * n_buckets // span).astype(np.int64)
+    bucket = np.clip(bucket, 0, n_buckets - 1)
+
+    # x is sorted, so bucket ids are non-decreasing and each bucket is contiguous
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, len(x)])
+    mins = np.minimum.reduceat(y, starts)
+    maxs = np.maximum.reduceat(y, starts)
+    means = np.add.reduceat(y, starts) / counts
+    bucket_start_x = x_start + (bucket[starts] * span) // n_buckets
+
+    return bucket_start_x, mins, means, maxs, counts
+
+
+def to_unit(values, unit):
+    """Convert kg values to the requested unit, rounded like the frontend does"""
+    if unit == 'lbs':
+        return np.round(values * KG_TO_LBS_FACTOR, 1)
+    return np.round(values, 2)
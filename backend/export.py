@@ -0,0 +1,105 @@
+"""
+Streaming export of a user's clients and weight entries.
+
+Rows are read with yield_per (a server-side cursor on PostgreSQL) and written
+out as CSV or NDJSON in fixed-size chunks, optionally gzip-compressed on the
+fly, so memory stays flat however many rows are exported.
+"""
+import csv
+import io
+import json
+import zlib
+import click
+from flask.cli import with_appcontext
+from models import db, Client, User, WeightEntry
+
+FETCH_SIZE = 2000
+CHUNK_SIZE = 64 * 1024
+
+EXPORT_COLUMNS = ('client_id', 'client_name', 'client_email', 'entry_id', 'date', 'weight')
+
+
+def iter_export_rows(user_id):
+    """Yield one tuple per weight entry (or per client without entries), client by client"""
+    query = db.session.query(
+        Client.id, Client.name, Client.email, WeightEntry.id, WeightEntry.date, WeightEntry.weight
+    ).outerjoin(WeightEntry, WeightEntry.client_id == Client.id) \
+        .filter(Client.user_id == user_id, Client.deleted_at.is_(None)) \
+        .order_by(Client.id, WeightEntry.date, WeightEntry.id)
+
+    for row in query.yield_per(FETCH_SIZE):
+        yield tuple(row)
+
+
+def _chunked(pieces):
+    """Join small string pieces into ~CHUNK_SIZE byte chunks"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _csv_lines(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    for client_id, name, email, entry_id, date, weight in rows:
+        writer.writerow((client_id, name, email, entry_id, date.isoformat() if date else '', weight))
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate()
+    yield out.getvalue()
+
+
+def _ndjson_lines(rows):
+    for client_id, name, email, entry_id, date, weight in rows:
+        yield json.dumps({
+            'client_id': client_id,
+            'client_name': name,
+            'client_email': email,
+            'entry_id': entry_id,
+            'date': date.isoformat() if date else None,
+            'weight': weight
+        }) + '\n'
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into a single gzip stream"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def generate_export(user_id, fmt='csv', compress=False):
+    """Return an iterator of byte chunks for the whole export"""
+    rows = iter_export_rows(user_id)
+    lines = _csv_lines(rows) if fmt == 'csv' else _ndjson_lines(rows)
+    chunks = _chunked(lines)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+@click.command('export-data')
+@click.option('--username', required=True, help='Export the clients owned by this user.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+@click.option('--output', type=click.Path(dir_okay=False), default='-', help='Output file (default: stdout).')
+@with_appcontext
+def export_data_command(username, fmt, compress, output):
+    """Stream every client and weight entry of a user to a file."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user named {username}")
+
+    with click.open_file(output, 'wb') as out:
+        for chunk in generate_export(user.id, fmt, compress):
+            out.write(chunk)
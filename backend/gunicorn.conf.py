@@ -1,3 +1,18 @@
+import os
+
 bind = "0.0.0.0:10000"
 workers = 2
+# Threaded workers keep serving other requests while a login waits on the password hashing pool,
+# and let identical concurrent reads in a worker wait on one computation (see coalesce.py)
+worker_class = "gthread"
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
 timeout = 120
+# Import the app once in the master and fork workers from it, so a new or
+# restarted worker doesn't pay for imports and the schema check again
+preload_app = True
+
+
+def worker_exit(server, worker):
+    # Write out weight entries still queued by write-behind mode before the worker goes
+    import write_behind
+    write_behind.shutdown()
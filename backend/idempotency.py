@@ -0,0 +1,129 @@
+"""
+Idempotency-Key support for write routes.
+
+A client that may retry a write (smart-scale integrations, mobile apps on
+flaky connections) sends the same `Idempotency-Key` header with every
+attempt. The first attempt reserves the key in the idempotency_key table
+before the view runs and stores the response afterwards; retries get that
+stored response back, marked with `Idempotent-Replayed: true`, without a
+second write.
+
+- A retry that arrives while the original is still running gets 409.
+- Reusing a key for a different request (method, path or body) gets 422.
+- Keys are scoped per user and expire after IDEMPOTENCY_KEY_TTL seconds.
+  Expired rows are swept every IDEMPOTENCY_SWEEP_EVERY reservations.
+- Responses with a 5xx status are not stored, so those can be retried.
+"""
+import hashlib
+import itertools
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import Response, current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+from models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+RESERVE_ATTEMPTS = 3
+
+_reservations = itertools.count(1)
+
+
+class ReservationConflict(Exception):
+    """The key kept changing hands while this request tried to reserve it"""
+
+
+def _fingerprint():
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _expired_before():
+    return datetime.utcnow() - timedelta(seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400))
+
+
+def sweep():
+    """Delete expired keys (does not commit); returns how many went"""
+    return db.session.query(IdempotencyKey).filter(IdempotencyKey.created_at < _expired_before()) \
+        .delete(synchronize_session=False)
+
+
+def _reserve(user_id, key, fingerprint):
+    """
+    Insert the in-flight row; returns None on success or the existing row.
+    Raises ReservationConflict if the key can't be reserved or read back.
+    """
+    if next(_reservations) % current_app.config.get('IDEMPOTENCY_SWEEP_EVERY', 100) == 0:
+        sweep()
+    for _ in range(RESERVE_ATTEMPTS):
+        existing = db.session.get(IdempotencyKey, (user_id, key))
+        if existing is not None and existing.created_at < _expired_before():
+            db.session.delete(existing)
+            existing = None
+        if existing is not None:
+            return existing
+
+        db.session.add(IdempotencyKey(user_id=user_id, key=key, fingerprint=fingerprint))
+        try:
+            db.session.commit()
+            return None
+        except IntegrityError:
+            # A concurrent attempt with the same key got there first. Read its row
+            # again; if that is gone too (expired and swept), try the insert again
+            db.session.rollback()
+    raise ReservationConflict()
+
+
+def _replay(existing, fingerprint):
+    if existing.fingerprint != fingerprint:
+        return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+    if existing.status_code is None:
+        return jsonify({'error': 'A request with this idempotency key is still in progress'}), 409
+    response = Response(existing.response, status=existing.status_code, mimetype='application/json')
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _finish(user_id, key, response):
+    if response.status_code >= 500:
+        db.session.query(IdempotencyKey).filter_by(user_id=user_id, key=key).delete(synchronize_session=False)
+    else:
+        db.session.query(IdempotencyKey).filter_by(user_id=user_id, key=key).update(
+            {'status_code': response.status_code, 'response': response.get_data(as_text=True)},
+            synchronize_session=False)
+    db.session.commit()
+
+
+def idempotent(view):
+    """Answer retries carrying the same Idempotency-Key from the stored first response"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = current_user.id
+        fingerprint = _fingerprint()
+        try:
+            existing = _reserve(user_id, key, fingerprint)
+        except ReservationConflict:
+            return jsonify({'error': 'A request with this idempotency key is still in progress'}), 409
+        if existing is not None:
+            return _replay(existing, fingerprint)
+
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _finish(user_id, key, Response(status=500))
+            raise
+        _finish(user_id, key, response)
+        return response
+
+    return wrapper
@@ -0,0 +1,168 @@
+"""
+Per-worker caches for user records and client ownership.
+
+Every authenticated request loads the current user and most weight routes
+check who owns a client. Both change rarely, so each gunicorn worker keeps a
+bounded LRU with a TTL for them. Entries are invalidated explicitly when
+clients are created or deleted; the TTL bounds how long another worker can
+serve a stale mapping.
+
+Write routes use the cache too. A stale mapping can't let a write through:
+the statements that write check that the client is live and owned inside
+their own transaction (see routes/weight.py), without a query of their own.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from models import db, User, Client
+
+_MISSING = object()
+
+# Returned by owner_of() when the client does not exist
+NOT_FOUND = object()
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries expire after `ttl` seconds"""
+
+    def __init__(self, name, maxsize=1024, ttl=60):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+user_cache = TTLCache('users')
+username_cache = TTLCache('usernames')
+owner_cache = TTLCache('client_owners', maxsize=10000)
+
+CACHES = (user_cache, username_cache, owner_cache)
+
+
+def init_app(app):
+    """Apply cache sizes and TTLs from the app config"""
+    ttl = app.config.get('IDENTITY_CACHE_TTL', 60)
+    user_cache.maxsize = username_cache.maxsize = app.config.get('USER_CACHE_SIZE', 1024)
+    owner_cache.maxsize = app.config.get('OWNER_CACHE_SIZE', 10000)
+    for cache in CACHES:
+        cache.ttl = ttl
+
+
+def _snapshot(user):
+    return {column: getattr(user, column) for column in User.__table__.columns.keys()}
+
+
+def _attach(snapshot):
+    """Rebuild a User from cached column values and attach it without a query"""
+    existing = db.session.identity_map.get(identity_key(User, snapshot['id']))
+    if existing is not None:
+        return existing
+    user = User(**snapshot)
+    make_transient_to_detached(user)
+    db.session.add(user)
+    return user
+
+
+def remember_user(user):
+    user_cache.set(user.id, _snapshot(user))
+    username_cache.set(user.username, user.id)
+
+
+def forget_user(user):
+    user_cache.invalidate(user.id)
+    username_cache.invalidate(user.username)
+
+
+def load_user(user_id):
+    """Return the User with this id, hitting the database only on a cache miss"""
+    snapshot = user_cache.get(user_id)
+    if snapshot is not None:
+        return _attach(snapshot)
+    user = db.session.get(User, user_id)
+    if user is not None:
+        remember_user(user)
+    return user
+
+
+def get_user_by_username(username):
+    """Return the User with this username, or None, using the cache when possible"""
+    user_id = username_cache.get(username)
+    if user_id is not None:
+        return load_user(user_id)
+    user = User.query.filter_by(username=username).first()
+    if user is not None:
+        remember_user(user)
+    return user
+
+
+def owner_of(client_id):
+    """Return the owning user_id of a client, or NOT_FOUND if it doesn't exist"""
+    owner = owner_cache.get(client_id, _MISSING)
+    if owner is not _MISSING:
+        return owner
+    row = db.session.query(Client.user_id).filter(Client.id == client_id, Client.deleted_at.is_(None)).first()
+    if row is None:
+        # Not cached: the id may be reused by a client created later
+        return NOT_FOUND
+    owner_cache.set(client_id, row.user_id)
+    return row.user_id
+
+
+def client_created(client):
+    owner_cache.set(client.id, client.user_id)
+
+
+def client_deleted(client_id):
+    owner_cache.invalidate(client_id)
+
+
+def stats():
+    return {cache.name: cache.stats() for cache in CACHES}
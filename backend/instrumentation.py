@@ -0,0 +1,208 @@
+"""
+Request instrumentation and a Prometheus-style /metrics endpoint.
+
+For every request we record wall time, the number of SQL statements and
+their total time (via SQLAlchemy cursor events), response size and status,
+grouped by endpoint. Metrics are per worker process; scrape each worker or
+aggregate in Prometheus.
+
+Opt-in extras:
+- SLOW_REQUEST_MS: log requests slower than this, with the SQL they ran.
+- PROFILE_TOKEN: a request sent with `X-Profile: <token>` is sampled by a
+  background thread and its hottest stacks are logged.
+"""
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+MAX_LOGGED_STATEMENTS = 50
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a label tuple"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            counts = self._counts[labels]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._sums[labels] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, counts in sorted(self._counts.items()):
+                label_text = ','.join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+                cumulative += counts[-1]
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {cumulative}')
+                lines.append(f'{self.name}_sum{{{label_text}}} {self._sums[labels]:.6f}')
+                lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+LABELS = ('endpoint', 'method', 'status')
+
+request_duration = Histogram('http_request_duration_seconds', 'Wall time per request', LABELS, DURATION_BUCKETS)
+sql_statements = Histogram('http_request_sql_statements', 'SQL statements per request', LABELS, QUERY_COUNT_BUCKETS)
+sql_duration = Histogram('http_request_sql_duration_seconds', 'Total SQL time per request', LABELS, DURATION_BUCKETS)
+response_size = Histogram('http_response_size_bytes', 'Response body size', LABELS, SIZE_BUCKETS)
+
+HISTOGRAMS = (request_duration, sql_statements, sql_duration, response_size)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own execution context: a statement that raises never
+    # reaches after_cursor_execute, and must not shift the timing of later ones
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    if not has_request_context() or 'sql_count' not in g:
+        return
+    g.sql_count += 1
+    g.sql_time += elapsed
+    if g.sql_statements is not None and len(g.sql_statements) < MAX_LOGGED_STATEMENTS:
+        g.sql_statements.append((elapsed, statement))
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every `interval` seconds from a helper thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+def init_app(app):
+    """Install the request hooks and the /metrics route"""
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.sql_statements = [] if app.config.get('SLOW_REQUEST_MS') else None
+
+        token = app.config.get('PROFILE_TOKEN')
+        if token and request.headers.get('X-Profile') == token:
+            interval = app.config.get('PROFILE_INTERVAL_MS', 5) / 1000.0
+            g.profiler = SamplingProfiler(threading.get_ident(), interval).start()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_started
+        labels = (request.url_rule.rule if request.url_rule else 'unmatched', request.method, str(response.status_code))
+
+        request_duration.observe(labels, elapsed)
+        sql_statements.observe(labels, g.sql_count)
+        sql_duration.observe(labels, g.sql_time)
+        if not response.is_streamed:
+            response_size.observe(labels, response.calculate_content_length() or 0)
+
+        response.headers['Server-Timing'] = f'app;dur={elapsed * 1000:.1f}, db;dur={g.sql_time * 1000:.1f}'
+
+        slow_ms = app.config.get('SLOW_REQUEST_MS')
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            statements = '\n'.join(f'  [{t * 1000:.1f} ms] {s}' for t, s in (g.sql_statements or []))
+            app.logger.warning(
+                f"Slow request {request.method} {request.full_path} took {elapsed * 1000:.0f} ms "
+                f"({g.sql_count} SQL statements, {g.sql_time * 1000:.0f} ms in SQL):\n{statements}"
+            )
+
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            samples = profiler.stop()
+            top = '\n'.join(f'  {count:5d} {stack}' for stack, count in samples.most_common(20))
+            app.logger.warning(f"Profile of {request.method} {request.full_path} "
+                               f"({sum(samples.values())} samples):\n{top}")
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        import coalesce
+        import identity_cache
+        import series_cache
+        import sparklines
+        import write_behind
+
+        lines = []
+        for histogram in HISTOGRAMS:
+            lines.extend(histogram.render())
+        lines.append('# TYPE identity_cache_requests_total counter')
+        for name, stats in identity_cache.stats().items():
+            lines.append(f'identity_cache_requests_total{{cache="{name}",result="hit"}} {stats["hits"]}')
+            lines.append(f'identity_cache_requests_total{{cache="{name}",result="miss"}} {stats["misses"]}')
+        series = series_cache.cache.stats()
+        lines.append('# TYPE series_cache_requests_total counter')
+        lines.append(f'series_cache_requests_total{{result="hit"}} {series["hits"]}')
+        lines.append(f'series_cache_requests_total{{result="miss"}} {series["misses"]}')
+        lines.append('# TYPE series_cache_bytes gauge')
+        lines.append(f'series_cache_bytes {series["bytes"]}')
+        images = sparklines.cache.stats()
+        lines.append('# TYPE sparkline_cache_requests_total counter')
+        for result, key in (('hit', 'hits'), ('disk_hit', 'disk_hits'), ('miss', 'misses')):
+            lines.append(f'sparkline_cache_requests_total{{result="{result}"}} {images[key]}')
+        flights = coalesce.stats()
+        lines.append('# TYPE coalesced_requests_total counter')
+        for role, key in (('leader', 'leaders'), ('follower', 'followers'), ('fallback', 'fallbacks')):
+            lines.append(f'coalesced_requests_total{{role="{role}"}} {flights[key]}')
+        queued = write_behind.writer.stats()
+        lines.append('# TYPE write_behind_queued gauge')
+        lines.append(f'write_behind_queued {queued["queued"]}')
+        lines.append('# TYPE write_behind_rows_total counter')
+        for result in ('written', 'failed', 'rejected'):
+            lines.append(f'write_behind_rows_total{{result="{result}"}} {queued[result]}')
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,201 @@
+"""
+Versioned schema migrations.
+
+Each migration is a numbered, idempotent step registered with @migration.
+Applied versions are recorded in the schema_migrations table, so
+`flask --app app db-upgrade` (run once per deploy) only runs new steps and
+each step is safe to re-run against a database that was created or patched
+by hand.
+
+At boot, create_app() only reads the latest applied version (one query)
+and warns when the schema is behind. With AUTO_MIGRATE on (the default for
+the SQLite fallback) it applies pending steps instead, so local setups keep
+working without the deploy step.
+"""
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from models import db, User, Client, WeightEntry, ClientStats, DataVersion, IdempotencyKey, ChangeLog
+import client_search
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('name', String(128), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register fn(conn) as schema step `version`; steps must be idempotent"""
+
+    def register(fn):
+        if any(existing[0] == version for existing in MIGRATIONS):
+            raise ValueError(f'Duplicate migration version {version}')
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def has_column(conn, table, column):
+    return column in [col['name'] for col in inspect(conn).get_columns(table)]
+
+
+def create_tables(conn, *models):
+    for model in models:
+        model.__table__.create(conn, checkfirst=True)
+
+
+def create_index(conn, model, name):
+    index = next(index for index in model.__table__.indexes if index.name == name)
+    index.create(conn, checkfirst=True)
+
+
+@migration(1, 'initial tables')
+def create_initial_tables(conn):
+    create_tables(conn, User, Client, WeightEntry)
+
+
+@migration(2, 'client.user_id')
+def add_client_user_id(conn):
+    # Replaces add_user_id_column.py
+    if not has_column(conn, 'client', 'user_id'):
+        conn.execute(text('ALTER TABLE client ADD COLUMN user_id INTEGER REFERENCES "user"(id)'))
+
+
+@migration(3, 'weight_entry (client_id, date) index')
+def add_weight_entry_client_date_index(conn):
+    # Replaces add_weight_entry_index.py
+    create_index(conn, WeightEntry, 'ix_weight_entry_client_id_date')
+
+
+@migration(4, 'client_stats table')
+def create_client_stats(conn):
+    create_tables(conn, ClientStats)
+
+
+@migration(5, 'data_version table')
+def create_data_version(conn):
+    create_tables(conn, DataVersion)
+
+
+@migration(6, 'client.goal_weight')
+def add_client_goal_weight(conn):
+    if not has_column(conn, 'client', 'goal_weight'):
+        conn.execute(text('ALTER TABLE client ADD COLUMN goal_weight FLOAT'))
+
+
+@migration(7, 'client (user_id) index')
+def add_client_user_id_index(conn):
+    create_index(conn, Client, 'ix_client_user_id')
+
+
+@migration(8, 'client.deleted_at')
+def add_client_deleted_at(conn):
+    if not has_column(conn, 'client', 'deleted_at'):
+        # DATETIME on SQLite, TIMESTAMP WITHOUT TIME ZONE on Postgres
+        column_type = DateTime().compile(dialect=conn.dialect)
+        conn.execute(text(f'ALTER TABLE client ADD COLUMN deleted_at {column_type}'))
+
+
+@migration(9, 'idempotency_key table')
+def create_idempotency_key(conn):
+    create_tables(conn, IdempotencyKey)
+
+
+@migration(10, 'change_log table')
+def create_change_log(conn):
+    create_tables(conn, ChangeLog)
+
+
+@migration(11, 'client search index')
+def create_client_search_index(conn):
+    # FTS5 on SQLite, pg_trgm on Postgres; search falls back to scans if neither is available
+    client_search.create_index(conn)
+
+
+def current_version(engine=None):
+    """Latest applied version, or None when the migrations table doesn't exist yet"""
+    engine = engine or db.engine
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return None
+
+
+def upgrade(engine=None, target=None, echo=print):
+    """Apply pending migrations up to `target` (default: all); returns the versions applied"""
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        # One transaction per step; re-check inside it in case another process got there first
+        with engine.begin() as conn:
+            done = conn.execute(select(schema_migrations.c.version)
+                                .where(schema_migrations.c.version == version)).first()
+            if done:
+                continue
+            echo(f'Applying migration {version}: {name}')
+            fn(conn)
+            conn.execute(schema_migrations.insert().values(version=version, name=name,
+                                                           applied_at=datetime.utcnow()))
+        applied.append(version)
+    return applied
+
+
+def init_app(app):
+    """Check the schema version at boot and apply pending steps if AUTO_MIGRATE is on"""
+    with app.app_context():
+        try:
+            version = current_version()
+            if version != latest_version():
+                if app.config.get('AUTO_MIGRATE'):
+                    upgrade(echo=app.logger.info)
+                else:
+                    app.logger.warning(f"Database schema is at version {version}, code expects "
+                                       f"{latest_version()}; run 'flask --app app db-upgrade'")
+        except Exception as e:
+            # Don't raise, so the health check endpoint works even if the DB is down
+            app.logger.error(f"Error checking database schema: {str(e)}")
+        finally:
+            # Workers forked from a preloaded app must not share this connection
+            for engine in db.engines.values():
+                engine.dispose()
+
+
+@click.command('db-upgrade')
+@click.option('--target', type=int, default=None, help='Stop after this version')
+@with_appcontext
+def db_upgrade_command(target):
+    """Apply pending schema migrations"""
+    applied = upgrade(target=target, echo=click.echo)
+    if applied:
+        click.echo(f'Applied {len(applied)} migration(s); schema is at version {current_version()}')
+    else:
+        click.echo(f'Schema is current (version {current_version()})')
+
+
+@click.command('db-status')
+@with_appcontext
+def db_status_command():
+    """Show applied and pending schema migrations"""
+    version = current_version()
+    click.echo(f'Schema version: {version if version is not None else "none (not initialised)"}')
+    for number, name, _ in MIGRATIONS:
+        state = 'applied' if version is not None and number <= version else 'pending'
+        click.echo(f'  {number:4d} {name} [{state}]')
@@ -1,9 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -13,10 +13,13 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        # In the hashing pool, like the auth routes (may raise HashingBusy)
+        from password_hashing import hash_password
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        from password_hashing import verify_password
+        return verify_password(self.password_hash, password)
 
     def to_dict(self):
         return {
@@ -27,19 +30,30 @@ class User(UserMixin, db.Model):
         }
 
 class Client(db.Model):
+    __table_args__ = (
+        # Serves the per-coach client lists and cohort queries
+        db.Index('ix_client_user_id', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Allow null for existing data
+    goal_weight = db.Column(db.Float, nullable=True)
+    # Set when the client is deleted but its history is still being purged (see purge.py)
+    deleted_at = db.Column(db.DateTime, nullable=True)
+    # Routes delete clients with set-based statements (purge.py) rather than through these cascades
     weight_entries = db.relationship('WeightEntry', backref='client', lazy=True, cascade='all, delete-orphan')
+    stats = db.relationship('ClientStats', backref='client', uselist=False, lazy=True, cascade='all, delete-orphan')
 
     def to_dict(self):
         result = {
             'id': self.id,
             'name': self.name,
             'email': self.email,
-            'created_at': self.created_at.isoformat()
+            'created_at': self.created_at.isoformat(),
+            'goal_weight': self.goal_weight
         }
         # Only include user_id if the column exists and has a value
         try:
@@ -50,10 +64,15 @@ class Client(db.Model):
         return result
 
 class WeightEntry(db.Model):
+    __table_args__ = (
+        # Serves per-client history reads ordered/filtered by date
+        db.Index('ix_weight_entry_client_id_date', 'client_id', 'date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     weight = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date)
-    client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id', ondelete='CASCADE'), nullable=False)
 
     def to_dict(self):
         return {
@@ -62,3 +81,72 @@ class WeightEntry(db.Model):
             'date': self.date.isoformat(),
             'client_id': self.client_id
         }
+
+class ClientStats(db.Model):
+    """Per-client aggregates kept up to date by the weight routes (see client_stats.py)"""
+    client_id = db.Column(db.Integer, db.ForeignKey('client.id', ondelete='CASCADE'), primary_key=True)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    weight_sum = db.Column(db.Float, nullable=False, default=0.0)
+    first_date = db.Column(db.Date)
+    first_weight = db.Column(db.Float)
+    last_date = db.Column(db.Date)
+    last_weight = db.Column(db.Float)
+    min_weight = db.Column(db.Float)
+    max_weight = db.Column(db.Float)
+    # Rolling windows ending at last_date: (last_date - N days, last_date]
+    window_7_sum = db.Column(db.Float, nullable=False, default=0.0)
+    window_7_count = db.Column(db.Integer, nullable=False, default=0)
+    window_30_sum = db.Column(db.Float, nullable=False, default=0.0)
+    window_30_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        has_entries = self.entry_count > 0
+        return {
+            'client_id': self.client_id,
+            'entry_count': self.entry_count,
+            'starting_weight': self.first_weight,
+            'starting_date': self.first_date.isoformat() if self.first_date else None,
+            'current_weight': self.last_weight,
+            'current_date': self.last_date.isoformat() if self.last_date else None,
+            'total_change': round(self.last_weight - self.first_weight, 2) if has_entries else None,
+            'min_weight': self.min_weight,
+            'max_weight': self.max_weight,
+            'average_weight': round(self.weight_sum / self.entry_count, 2) if has_entries else None,
+            'average_7d': round(self.window_7_sum / self.window_7_count, 2) if self.window_7_count else None,
+            'average_30d': round(self.window_30_sum / self.window_30_count, 2) if self.window_30_count else None
+        }
+
+class DataVersion(db.Model):
+    """Change counter per user or client, used for ETag/Last-Modified validators"""
+    scope = db.Column(db.String(16), primary_key=True)  # 'user' or 'client'
+    key = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """Stored outcome of a write sent with an Idempotency-Key header (see idempotency.py)"""
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    # Hash of method, path and body; a reused key with a different request is rejected
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # Both NULL while the original request is still running
+    status_code = db.Column(db.Integer)
+    response = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class ChangeLog(db.Model):
+    """One row per client/entry write, read by GET /api/sync (see changelog.py)"""
+    __table_args__ = (
+        # Serves the per-user 'changes after cursor' reads
+        db.Index('ix_change_log_user_id_id', 'user_id', 'id'),
+        # Ids are sync cursors, so SQLite must never reuse them
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    entity = db.Column(db.String(16), nullable=False)  # 'client' or 'entry'
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)  # 'upsert' or 'delete'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
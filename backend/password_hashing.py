@@ -0,0 +1,108 @@
+"""
+Password hashing off the request thread.
+
+pbkdf2 is deliberately slow, so a burst of logins can hold every worker
+thread for hundreds of milliseconds each. Hashing runs in a small process
+pool instead. At most HASH_QUEUE_LIMIT hashes can be queued or running per
+worker; past that, callers get HashingBusy straight away and the route
+answers 503 instead of piling up behind the CPU-bound work. If a pool
+process dies (say, OOM-killed) the pool is replaced on the next call, and
+the request that hit the broken one gets HashingBusy too.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DEFAULT_ITERATIONS = 600000
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+def password_method():
+    """The werkzeug method string for the configured hash cost"""
+    try:
+        iterations = current_app.config.get('PASSWORD_HASH_ITERATIONS', DEFAULT_ITERATIONS)
+    except RuntimeError:
+        iterations = DEFAULT_ITERATIONS
+    return f'pbkdf2:sha256:{iterations}'
+
+
+def needs_rehash(password_hash):
+    """True if the stored hash was made with a different method or cost"""
+    return not password_hash or password_hash.split('$', 1)[0] != password_method()
+
+
+def _pool():
+    """Create the pool lazily so each gunicorn worker gets its own after fork"""
+    global _executor, _slots
+    with _lock:
+        config = current_app.config
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(config.get('HASH_QUEUE_LIMIT', 8))
+        workers = config.get('HASH_POOL_WORKERS', 2)
+        if _executor is None and workers > 0:
+            # spawn, not fork: forking a threaded worker can deadlock the child
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor, _slots
+
+
+def _discard(executor):
+    """Drop a pool that lost a process; the next call builds a new one"""
+    global _executor
+    with _lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(func, *args):
+    executor, slots = _pool()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy('Password hashing queue is full')
+
+    if executor is None:
+        try:
+            return func(*args)
+        finally:
+            slots.release()
+
+    try:
+        future = executor.submit(func, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _discard(executor)
+        raise HashingBusy('Password hashing pool was restarted')
+    except Exception:
+        slots.release()
+        raise
+    # The slot is held until the hash finishes, even if the caller gives up waiting
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=current_app.config.get('HASH_TIMEOUT', 10))
+    except FuturesTimeout:
+        raise HashingBusy('Password hashing timed out')
+    except BrokenProcessPool:
+        _discard(executor)
+        raise HashingBusy('Password hashing pool was restarted')
+
+
+def hash_password(password):
+    """Hash a password with the configured cost in the hashing pool"""
+    return _run(generate_password_hash, password, password_method())
+
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash in the hashing pool"""
+    if not password_hash:
+        return False
+    return _run(check_password_hash, password_hash, password)
@@ -0,0 +1,160 @@
+"""
+Set-based deletion of clients and their weight history.
+
+Deleting through the ORM cascade loaded every WeightEntry into the session
+and deleted them one row at a time. Here the rows go with plain DELETE
+statements keyed on client_id instead, in chunks of PURGE_CHUNK_SIZE so no
+single transaction holds the write lock for long.
+
+Clients with up to PURGE_SYNC_MAX_ENTRIES entries are removed inside the
+request. Larger ones are tombstoned (client.deleted_at is set, which hides
+them from every read) and their rows are reclaimed by a background thread in
+the worker that deleted them. Tombstones left behind by a worker that died
+mid-purge are picked up the next time any worker starts its purge thread, or
+by `flask --app app purge-deleted-clients`, which also removes entries left
+without a client by older versions.
+"""
+import os
+import queue
+import threading
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, select
+from models import db, Client, ClientStats, WeightEntry
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def delete_entries_chunk(client_id, chunk_size):
+    """Delete up to chunk_size of a client's entries; returns how many went"""
+    chunk = select(WeightEntry.id).where(WeightEntry.client_id == client_id).limit(chunk_size)
+    result = db.session.execute(delete(WeightEntry).where(WeightEntry.id.in_(chunk.scalar_subquery())))
+    return result.rowcount
+
+
+def delete_client_rows(client_id):
+    """
+    Delete a client, its stats row and all of its entries in the current
+    transaction; returns how many entries went
+    """
+    deleted = db.session.execute(delete(WeightEntry).where(WeightEntry.client_id == client_id)).rowcount
+    db.session.execute(delete(ClientStats).where(ClientStats.client_id == client_id))
+    db.session.execute(delete(Client).where(Client.id == client_id))
+    return deleted
+
+
+def delete_orphan_entries():
+    """Delete entries whose client row no longer exists (left by writes that raced a purge); returns how many"""
+    return db.session.execute(
+        delete(WeightEntry).where(WeightEntry.client_id.notin_(select(Client.id)))
+    ).rowcount
+
+
+def tombstone(client):
+    """Hide a client from reads until its rows are purged"""
+    client.deleted_at = datetime.utcnow()
+    # Free the unique email straight away so the address can be registered again
+    client.email = f'deleted-{client.id}-{client.email}'[:120]
+
+
+def is_tombstoned(client_id):
+    return db.session.query(Client.id).filter(Client.id == client_id, Client.deleted_at.isnot(None)) \
+        .with_for_update().first() is not None
+
+
+def purge_client(client_id, chunk_size=None):
+    """Reclaim a tombstoned client's rows chunk by chunk, committing each; returns entries deleted"""
+    chunk_size = chunk_size or current_app.config.get('PURGE_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    total = 0
+    while True:
+        # Checked in every chunk's transaction: once another purge has removed the
+        # row, SQLite may hand its id to a new client whose rows must stay
+        if not is_tombstoned(client_id):
+            db.session.rollback()
+            return total
+        deleted = delete_entries_chunk(client_id, chunk_size)
+        db.session.commit()
+        total += deleted
+        if deleted < chunk_size:
+            break
+    # Sweep the entries again together with the client row: anything written
+    # between the chunks goes with it, and once the row is gone the check each
+    # write makes inside its transaction keeps new ones out
+    if is_tombstoned(client_id):
+        total += delete_client_rows(client_id)
+    db.session.commit()
+    return total
+
+
+def tombstoned_clients():
+    return [row[0] for row in db.session.query(Client.id).filter(Client.deleted_at.isnot(None))]
+
+
+class PurgeWorker:
+    """One daemon thread per process that purges tombstoned clients in the background"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def schedule(self, app, client_id):
+        self._ensure_started(app)
+        self._queue.put(client_id)
+
+    def _ensure_started(self, app):
+        # Started lazily so each forked gunicorn worker gets its own thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue()
+            threading.Thread(target=self._run, args=(app,), daemon=True, name='client-purge').start()
+
+    def _run(self, app):
+        with app.app_context():
+            # Pick up tombstones a previous process didn't finish
+            try:
+                for client_id in tombstoned_clients():
+                    self._queue.put(client_id)
+            except Exception as e:
+                app.logger.error(f"Error listing clients to purge: {str(e)}")
+            finally:
+                db.session.remove()
+
+        while True:
+            client_id = self._queue.get()
+            with app.app_context():
+                try:
+                    entries = purge_client(client_id)
+                    app.logger.info(f"Purged client {client_id} ({entries} entries)")
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Error purging client {client_id}: {str(e)}")
+                finally:
+                    db.session.remove()
+
+
+worker = PurgeWorker()
+
+
+def schedule(client_id):
+    """Purge a tombstoned client in the background"""
+    worker.schedule(current_app._get_current_object(), client_id)
+
+
+@click.command('purge-deleted-clients')
+@with_appcontext
+def purge_deleted_clients_command():
+    """Purge every tombstoned client now"""
+    client_ids = tombstoned_clients()
+    for client_id in client_ids:
+        entries = purge_client(client_id)
+        click.echo(f'Purged client {client_id} ({entries} entries)')
+    click.echo(f'{len(client_ids)} client(s) purged')
+    orphans = delete_orphan_entries()
+    db.session.commit()
+    if orphans:
+        click.echo(f'Removed {orphans} entries of clients that no longer exist')
@@ -2,9 +2,17 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User
 from werkzeug.security import generate_password_hash, check_password_hash
+from password_hashing import hash_password, verify_password, needs_rehash, HashingBusy
+import identity_cache
 
 auth_bp = Blueprint('auth', __name__)
 
+def hashing_busy_response():
+    """Fast rejection while the password hashing pool is saturated"""
+    response = jsonify({'error': 'Server busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
@@ -23,7 +31,7 @@ def register():
 
         # Create new user
         user = User(username=data['username'], email=data['email'])
-        user.set_password(data['password'])
+        user.password_hash = hash_password(data['password'])
 
         db.session.add(user)
         db.session.commit()
@@ -35,6 +43,8 @@ def register():
             'message': 'User registered successfully',
             'user': user.to_dict()
         }), 201
+    except HashingBusy:
+        return hashing_busy_response()
     except Exception as e:
         # Log the error
         current_app.logger.error(f"Registration error: {str(e)}")
@@ -60,8 +70,17 @@ def login():
     user = User.query.filter_by(username=data['username']).first()
 
     # Check if user exists and password is correct
-    if user is None or not user.check_password(data['password']):
-        return jsonify({'error': 'Invalid username or password'}), 401
+    try:
+        if user is None or not verify_password(user.password_hash, data['password']):
+            return jsonify({'error': 'Invalid username or password'}), 401
+
+        # Upgrade hashes made with an older cost setting while we have the plain password
+        if needs_rehash(user.password_hash):
+            user.password_hash = hash_password(data['password'])
+            db.session.commit()
+            identity_cache.forget_user(user)
+    except HashingBusy:
+        return hashing_busy_response()
 
     # Log the user in
     login_user(user)
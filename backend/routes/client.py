@@ -1,20 +1,77 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
-from models import db, Client, User
+from models import db, Client, ClientStats, User, WeightEntry
+from sqlalchemy import func, and_
+import identity_cache
+import cohort
+import client_search
+import purge
+import changelog
+import series_cache
+import sparklines
+from client_stats import rebuild_client
+from versions import Validators, bump, bump_client
+from serialization import json_response, fetch_rows, rows_to_dicts, CLIENT_FIELDS
+from db_routing import read_only
+from coalesce import coalesced
+from datetime import datetime, timedelta
 
 client_bp = Blueprint('client', __name__)
 
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+DEFAULT_SEARCH_PER_PAGE = 20
+MAX_SEARCH_PER_PAGE = 100
+CHANGE_WINDOW_DAYS = 30
+CLIENT_COLUMNS = (Client.id, Client.name, Client.email, Client.created_at, Client.user_id, Client.goal_weight)
+CLIENT_SORT_KEYS = ('name', 'email', 'created_at', 'latest_weight', 'latest_date', 'entry_count', 'change_30d')
+
 # For testing purposes only - remove in production
 def get_test_user():
     """Get or create a test user for development purposes"""
-    test_user = User.query.filter_by(username="testuser").first()
+    test_user = identity_cache.get_user_by_username("testuser")
     if not test_user:
         test_user = User(username="testuser", email="test@example.com")
         test_user.set_password("password123")
         db.session.add(test_user)
         db.session.commit()
+        identity_cache.remember_user(test_user)
     return test_user
 
+def client_list_query(user_id, with_stats):
+    """
+    Build one SELECT returning the user's clients, the total row count and,
+    optionally, per-client stats. The latest weigh-in and entry count come
+    from the client_stats aggregates; only the 30-day change reads
+    weight_entry, limited to the window by the (client_id, date) index.
+    """
+    columns = {'total': func.count().over().label('total')}
+    query = db.session.query(*CLIENT_COLUMNS).filter(Client.user_id == user_id, Client.deleted_at.is_(None))
+
+    if with_stats:
+        owned = db.session.query(Client.id).filter(Client.user_id == user_id, Client.deleted_at.is_(None))
+
+        # Earliest entry inside the change window
+        cutoff = datetime.now().date() - timedelta(days=CHANGE_WINDOW_DAYS)
+        baseline = db.session.query(
+            WeightEntry.client_id.label('client_id'),
+            WeightEntry.weight.label('weight'),
+            func.row_number().over(
+                partition_by=WeightEntry.client_id,
+                order_by=(WeightEntry.date, WeightEntry.id)
+            ).label('rn')
+        ).filter(WeightEntry.client_id.in_(owned), WeightEntry.date >= cutoff).subquery()
+
+        query = query.outerjoin(ClientStats, ClientStats.client_id == Client.id) \
+            .outerjoin(baseline, and_(baseline.c.client_id == Client.id, baseline.c.rn == 1))
+
+        columns['latest_weight'] = ClientStats.last_weight.label('latest_weight')
+        columns['latest_date'] = ClientStats.last_date.label('latest_date')
+        columns['entry_count'] = func.coalesce(ClientStats.entry_count, 0).label('entry_count')
+        columns['change_30d'] = (ClientStats.last_weight - baseline.c.weight).label('change_30d')
+
+    return query.add_columns(*columns.values()), columns
+
 # Add a new client
 @client_bp.route('', methods=['POST'])
 # @login_required  # Temporarily disabled for testing
@@ -30,13 +87,26 @@ def add_client():
         if existing_client:
             return jsonify({'error': 'Email already registered'}), 409
 
+        goal_weight = data.get('goal_weight')
+        if goal_weight is not None:
+            try:
+                goal_weight = float(goal_weight)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'goal_weight must be a number'}), 400
+
         # For testing: use test user instead of current_user
         test_user = get_test_user()
 
         # Create new client
-        new_client = Client(name=data['name'], email=data['email'], user_id=test_user.id)
+        new_client = Client(name=data['name'], email=data['email'], user_id=test_user.id, goal_weight=goal_weight)
         db.session.add(new_client)
+        db.session.flush()
+        # Start its (empty) aggregate row here so reads never have to
+        rebuild_client(new_client.id)
+        changelog.record(test_user.id, changelog.CLIENT, new_client.id)
+        bump('user', test_user.id)
         db.session.commit()
+        identity_cache.client_created(new_client)
 
         return jsonify({'message': 'Client added successfully', 'client': new_client.to_dict()}), 201
     except Exception as e:
@@ -48,33 +118,219 @@ def add_client():
 # Get all clients
 @client_bp.route('', methods=['GET'])
 # @login_required  # Temporarily disabled for testing
+@read_only
+@coalesced(owner=lambda: get_test_user().id)
 def get_all_clients():
     try:
         # For testing: use test user instead of current_user
         test_user = get_test_user()
 
-        # Only show clients belonging to the test user
-        clients = Client.query.filter_by(user_id=test_user.id).all()
-        return jsonify([client.to_dict() for client in clients])
+        # The 30-day change moves with the calendar, so the date is part of the validator
+        validators = Validators('user', test_user.id, extra=(datetime.now().date(),))
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        with_stats = request.args.get('include') == 'stats'
+        paginated = with_stats or 'page' in request.args or 'per_page' in request.args
+
+        sort = request.args.get('sort', 'created_at' if paginated else None)
+        if sort and sort not in CLIENT_SORT_KEYS:
+            return jsonify({'error': f"sort must be one of {', '.join(CLIENT_SORT_KEYS)}"}), 400
+        descending = request.args.get('order', 'asc') == 'desc'
+
+        if not paginated and not sort:
+            # Only show clients belonging to the test user
+            clients = fetch_rows(db.session.query(*CLIENT_COLUMNS)
+                                 .filter(Client.user_id == test_user.id, Client.deleted_at.is_(None)))
+            return validators.apply(json_response(rows_to_dicts(clients, CLIENT_FIELDS)))
+
+        try:
+            page = max(int(request.args.get('page', 1)), 1)
+            per_page = min(max(int(request.args.get('per_page', DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+        except ValueError:
+            return jsonify({'error': 'page and per_page must be integers'}), 400
+
+        # Sorting by a stats column needs the stats joins even if they are not returned
+        needs_stats = with_stats or sort not in ('name', 'email', 'created_at')
+        query, columns = client_list_query(test_user.id, needs_stats)
+
+        sort_column = columns[sort] if sort in columns else getattr(Client, sort)
+        # Clients without entries sort last in either direction
+        query = query.order_by(sort_column.is_(None), sort_column.desc() if descending else sort_column, Client.id)
+
+        if not paginated:
+            rows = [row[:len(CLIENT_FIELDS)] for row in query.all()]
+            return validators.apply(json_response(rows_to_dicts(rows, CLIENT_FIELDS)))
+
+        rows = query.limit(per_page).offset((page - 1) * per_page).all()
+        # The window count rides along on every row; only an empty page needs a separate count
+        total = rows[0].total if rows else query.order_by(None).count()
+
+        results = []
+        for row in rows:
+            client = dict(zip(CLIENT_FIELDS, row))
+            if with_stats:
+                client['stats'] = {
+                    'latest_weight': row.latest_weight,
+                    'latest_date': row.latest_date.isoformat() if row.latest_date else None,
+                    'entry_count': row.entry_count,
+                    'change_30d': round(row.change_30d, 2) if row.change_30d is not None else None
+                }
+            results.append(client)
+
+        return validators.apply(json_response({
+            'clients': results,
+            'total': total,
+            'page': page,
+            'per_page': per_page
+        }))
     except Exception as e:
         # Log the error
         current_app.logger.error(f"Error getting clients: {str(e)}")
         # Return a more helpful error message
         return jsonify({'error': f'Failed to get clients: {str(e)}'}), 500
 
+# Search the user's clients by name or email, best matches first
+@client_bp.route('/search', methods=['GET'])
+# @login_required  # Temporarily disabled for testing
+@read_only
+@coalesced(owner=lambda: get_test_user().id)
+def search_clients():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', DEFAULT_SEARCH_PER_PAGE)), 1), MAX_SEARCH_PER_PAGE)
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+
+    try:
+        # For testing: use test user instead of current_user
+        test_user = get_test_user()
+
+        validators = Validators('user', test_user.id)
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        rows, has_more, fuzzy = client_search.search(CLIENT_COLUMNS, test_user.id, query, page, per_page)
+        return validators.apply(json_response({
+            'clients': rows_to_dicts(rows, CLIENT_FIELDS),
+            'page': page,
+            'per_page': per_page,
+            'has_more': has_more,
+            'fuzzy': fuzzy
+        }))
+    except Exception as e:
+        current_app.logger.error(f"Error searching clients: {str(e)}")
+        return jsonify({'error': f'Failed to search clients: {str(e)}'}), 500
+
+# Get trend and forecast analytics for all of the user's clients in one pass
+@client_bp.route('/analytics', methods=['GET'])
+# @login_required  # Temporarily disabled for testing
+@read_only
+@coalesced(owner=lambda: get_test_user().id)
+def get_clients_analytics():
+    # numpy is only needed here; importing it on first use keeps it off the worker boot path
+    import analytics
+
+    try:
+        days, halflife, _ = analytics.parse_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # For testing: use test user instead of current_user
+        test_user = get_test_user()
+
+        today = datetime.now().date()
+        validators = Validators('user', test_user.id, extra=(today, days, halflife))
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        clients = fetch_rows(db.session.query(Client.id, Client.name, Client.goal_weight)
+                             .filter(Client.user_id == test_user.id, Client.deleted_at.is_(None))
+                             .order_by(Client.id))
+        ids, x, y = analytics.load_user(test_user.id, analytics.window_start(days, today))
+        result = analytics.compute(ids, x, y, halflife, goals={row.id: row.goal_weight for row in clients})
+        by_client = {summary['client_id']: summary for summary in analytics.summaries(result)}
+
+        results = []
+        for row in clients:
+            # Clients without entries in the window still get a row
+            summary = by_client.get(row.id) or analytics.empty_summary(row.id, row.goal_weight)
+            results.append(dict(summary, name=row.name))
+
+        return validators.apply(json_response({
+            'days': days,
+            'halflife': halflife,
+            'clients': results
+        }))
+    except Exception as e:
+        current_app.logger.error(f"Error computing client analytics: {str(e)}")
+        return jsonify({'error': f'Failed to compute analytics: {str(e)}'}), 500
+
+# Get top movers, weekly-rate percentiles and inactive clients across all of the user's clients
+@client_bp.route('/cohort', methods=['GET'])
+# @login_required  # Temporarily disabled for testing
+@read_only
+@coalesced(owner=lambda: get_test_user().id)
+def get_clients_cohort():
+    try:
+        days, inactive_days, limit = cohort.parse_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # For testing: use test user instead of current_user
+        test_user = get_test_user()
+
+        today = datetime.now().date()
+        validators = Validators('user', test_user.id, extra=(today,))
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        since = today - timedelta(days=days - 1)
+        gainers, losers = cohort.movers(test_user.id, since, limit)
+        inactive, inactive_total = cohort.inactive(test_user.id, inactive_days, today)
+
+        return validators.apply(json_response({
+            'days': days,
+            'since': since.isoformat(),
+            'gainers': gainers,
+            'losers': losers,
+            'weekly_rate_bands': cohort.weekly_rate_bands(test_user.id, since),
+            'inactive_days': inactive_days,
+            'inactive': inactive,
+            'inactive_total': inactive_total
+        }))
+    except Exception as e:
+        current_app.logger.error(f"Error computing cohort analytics: {str(e)}")
+        return jsonify({'error': f'Failed to compute cohort analytics: {str(e)}'}), 500
+
 # Get a single client
 @client_bp.route('/<int:client_id>', methods=['GET'])
 # @login_required  # Temporarily disabled for testing
+@read_only
+@coalesced(owner=lambda: get_test_user().id)
 def get_client(client_id):
     try:
-        client = Client.query.get_or_404(client_id)
         # For testing: use test user instead of current_user
         test_user = get_test_user()
 
-        # Check if the client belongs to the test user
-        if client.user_id != test_user.id:
+        # Check if the client exists and belongs to the test user
+        owner_id = identity_cache.owner_of(client_id)
+        if owner_id is identity_cache.NOT_FOUND:
+            return jsonify({'error': 'Client not found'}), 404
+        if owner_id != test_user.id:
             return jsonify({'error': 'Unauthorized access'}), 403
-        return jsonify(client.to_dict())
+
+        validators = Validators('client', client_id)
+        if validators.not_modified():
+            return validators.not_modified_response()
+
+        client = db.session.get(Client, client_id)
+        return validators.apply(jsonify(client.to_dict()))
     except Exception as e:
         # Log the error
         current_app.logger.error(f"Error getting client {client_id}: {str(e)}")
@@ -86,15 +342,34 @@ def get_client(client_id):
 # @login_required  # Temporarily disabled for testing
 def delete_client(client_id):
     try:
-        client = Client.query.get_or_404(client_id)
+        client = db.session.get(Client, client_id)
+        if client is None or client.deleted_at is not None:
+            return jsonify({'error': 'Client not found'}), 404
         # For testing: use test user instead of current_user
         test_user = get_test_user()
 
         # Check if the client belongs to the test user
         if client.user_id != test_user.id:
             return jsonify({'error': 'Unauthorized access'}), 403
-        db.session.delete(client)
+
+        # Set-based deletes; large histories are tombstoned now and purged in the background
+        entry_count = db.session.query(func.count(WeightEntry.id)).filter(WeightEntry.client_id == client_id).scalar()
+        background = entry_count > current_app.config.get('PURGE_SYNC_MAX_ENTRIES', 10000)
+        if background:
+            purge.tombstone(client)
+        else:
+            purge.delete_client_rows(client_id)
+        changelog.record(test_user.id, changelog.CLIENT, client_id, changelog.DELETE)
+        bump_client(client_id, test_user.id)
         db.session.commit()
+        identity_cache.client_deleted(client_id)
+        series_cache.cache.invalidate(client_id)
+        sparklines.forget(client_id)
+
+        if background:
+            purge.schedule(client_id)
+            return jsonify({'message': 'Client deleted successfully', 'purge': 'scheduled',
+                            'entries': entry_count}), 202
         return jsonify({'message': 'Client deleted successfully'})
     except Exception as e:
         # Log the error
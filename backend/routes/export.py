@@ -0,0 +1,34 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_login import login_required, current_user
+from datetime import datetime
+from export import generate_export
+from db_routing import read_only
+
+export_bp = Blueprint('export', __name__)
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Stream all of the current user's clients and weight entries
+@export_bp.route('', methods=['GET'])
+@login_required
+@read_only
+def export_account():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in CONTENT_TYPES:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+
+    compress = request.args.get('gzip') in ('1', 'true', 'yes')
+    filename = f"weight-export-{datetime.now().strftime('%Y%m%d')}.{fmt}"
+
+    # A .gz file, not a Content-Encoding: clients would otherwise unpack it
+    # on the fly and save plain text under the .gz name
+    mimetype = 'application/gzip' if compress else CONTENT_TYPES[fmt]
+    if compress:
+        filename += '.gz'
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+
+    body = generate_export(current_user.id, fmt, compress)
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
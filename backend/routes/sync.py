@@ -0,0 +1,68 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user
+from models import db, Client, WeightEntry
+from serialization import json_response, fetch_rows, rows_to_dicts, ENTRY_FIELDS, CLIENT_FIELDS
+from routes.client import CLIENT_COLUMNS
+from db_routing import read_only
+import changelog
+
+sync_bp = Blueprint('sync', __name__)
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+
+# Get the clients and entries changed since a cursor, with deletions as ids
+@sync_bp.route('', methods=['GET'])
+@login_required
+@read_only
+def sync_changes():
+    try:
+        since = int(request.args['since']) if request.args.get('since') else None
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+
+    try:
+        # No cursor, or one older than the compacted log: reload everything, then sync from here
+        if since is None or since < changelog.watermark():
+            return json_response({'reset': True, 'cursor': str(changelog.head(current_user.id)),
+                                  'has_more': False})
+
+        latest, cursor, has_more = changelog.read_page(current_user.id, since, limit)
+        wanted = {changelog.CLIENT: [], changelog.ENTRY: []}
+        deleted = {changelog.CLIENT: set(), changelog.ENTRY: set()}
+        for (entity, entity_id), op in latest.items():
+            (wanted[entity].append if op == changelog.UPSERT else deleted[entity].add)(entity_id)
+
+        clients = []
+        if wanted[changelog.CLIENT]:
+            clients = rows_to_dicts(fetch_rows(
+                db.session.query(*CLIENT_COLUMNS).filter(Client.id.in_(wanted[changelog.CLIENT]),
+                                                         Client.user_id == current_user.id,
+                                                         Client.deleted_at.is_(None))
+            ), CLIENT_FIELDS)
+        entries = []
+        if wanted[changelog.ENTRY]:
+            entries = rows_to_dicts(fetch_rows(
+                db.session.query(WeightEntry.id, WeightEntry.weight, WeightEntry.date, WeightEntry.client_id)
+                .join(Client, Client.id == WeightEntry.client_id)
+                .filter(WeightEntry.id.in_(wanted[changelog.ENTRY]), Client.user_id == current_user.id,
+                        Client.deleted_at.is_(None))
+            ), ENTRY_FIELDS)
+
+        # Written in this page but gone by now: a later page has the delete, report it already
+        deleted[changelog.CLIENT].update(set(wanted[changelog.CLIENT]) - {client['id'] for client in clients})
+        deleted[changelog.ENTRY].update(set(wanted[changelog.ENTRY]) - {entry['id'] for entry in entries})
+
+        return json_response({
+            'reset': False,
+            'clients': clients,
+            'entries': entries,
+            'deleted_clients': sorted(deleted[changelog.CLIENT]),
+            'deleted_entries': sorted(deleted[changelog.ENTRY]),
+            'cursor': str(cursor),
+            'has_more': has_more
+        })
+    except Exception as e:
+        current_app.logger.error(f"Error reading changes for sync: {str(e)}")
+        return jsonify({'error': f'Failed to read changes: {str(e)}'}), 500
@@ -1,27 +1,144 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
 from flask_login import login_required, current_user
-from models import db, WeightEntry, Client
+from models import db, Client, WeightEntry, DataVersion
 from datetime import datetime
+from bulk_import import detect_format, import_stream
+from client_stats import apply_change, get_stats
+from identity_cache import owner_of, client_deleted, NOT_FOUND
+from versions import Validators, bump_client
+import series_cache
+import sparklines
+import daily_entries
+import changelog
+import write_behind
+from idempotency import idempotent
+from sqlalchemy import and_, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from serialization import json_response
+from db_routing import read_only
+from coalesce import coalesced
+import base64
 
 weight_bp = Blueprint('weight', __name__)
 
-# Add a weight entry
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+DEFAULT_SERIES_POINTS = 200
+MAX_SERIES_POINTS = 2000
+MAX_BATCH_CLIENTS = 100
+MAX_SPARKLINE_CLIENTS = 500
+MAX_SPARKLINE_WIDTH = 600
+MAX_SPARKLINE_HEIGHT = 200
+
+def client_access_error(client_id):
+    """Return an error response unless the current user owns the client"""
+    owner_id = owner_of(client_id)
+    if owner_id is NOT_FOUND:
+        return jsonify({'error': 'Client not found'}), 404
+    if owner_id != current_user.id:
+        return jsonify({'error': 'Unauthorized access'}), 403
+    return None
+
+def insert_owned_entry(client_id, date, weight):
+    """
+    Insert an entry if the client is live and the current user's; returns its id,
+    or None. The check is part of the INSERT, so a stale ownership cache costs
+    no extra query and can't let a write through.
+    """
+    owned = select(Client.id, literal(date, WeightEntry.date.type), literal(weight, WeightEntry.weight.type)) \
+        .where(Client.id == client_id, Client.user_id == current_user.id, Client.deleted_at.is_(None))
+    return db.session.execute(
+        insert(WeightEntry).from_select(['client_id', 'date', 'weight'], owned).returning(WeightEntry.id)
+    ).scalar()
+
+def owned_entry_or_error(entry_id):
+    """
+    Load an entry for a write together with its client's owner, in the write's
+    transaction; returns (entry, None) or (None, error response)
+    """
+    entry, owner_id = db.session.query(WeightEntry, Client.user_id) \
+        .join(Client, Client.id == WeightEntry.client_id) \
+        .filter(WeightEntry.id == entry_id, Client.deleted_at.is_(None)).first_or_404()
+    if owner_id != current_user.id:
+        return None, (jsonify({'error': 'Unauthorized access'}), 403)
+    return entry, None
+
+def parse_client_ids(args):
+    """Read client_ids=1,2,3 (or repeated) into a de-duplicated list, in request order"""
+    return list(dict.fromkeys(
+        int(part) for value in args.getlist('client_ids') for part in value.split(',') if part.strip()
+    ))
+
+def owned_versions(client_ids):
+    """
+    Check the current user owns all the clients with one query.
+    Returns ({client id: data version}, None) or (None, error response).
+    """
+    rows = db.session.query(Client.id, Client.user_id, DataVersion.version) \
+        .outerjoin(DataVersion, and_(DataVersion.scope == 'client', DataVersion.key == Client.id)) \
+        .filter(Client.id.in_(client_ids), Client.deleted_at.is_(None)).all()
+    missing = set(client_ids) - {row.id for row in rows}
+    if missing:
+        return None, (jsonify({'error': 'Client not found', 'client_ids': sorted(missing)}), 404)
+    if any(row.user_id != current_user.id for row in rows):
+        return None, (jsonify({'error': 'Unauthorized access'}), 403)
+    return {row.id: row.version or 0 for row in rows}, None
+
+def parse_sparkline_size(args):
+    width = int(args.get('width', sparklines.DEFAULT_WIDTH))
+    height = int(args.get('height', sparklines.DEFAULT_HEIGHT))
+    return min(max(width, 16), MAX_SPARKLINE_WIDTH), min(max(height, 8), MAX_SPARKLINE_HEIGHT)
+
+def parse_date_range(args):
+    """Read optional from/to (YYYY-MM-DD) query parameters"""
+    date_from = args.get('from')
+    date_to = args.get('to')
+    if date_from:
+        date_from = datetime.strptime(date_from, '%Y-%m-%d').date()
+    if date_to:
+        date_to = datetime.strptime(date_to, '%Y-%m-%d').date()
+    return date_from or None, date_to or None
+
+def encode_cursor(date, entry_id):
+    """Encode the (date, id) of the last row of a page as an opaque cursor"""
+    raw = f"{date.isoformat()}|{entry_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor back into (date, id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        date_part, id_part = raw.split('|')
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), int(id_part)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+# Add a weight entry (replaces the day's entry in one-entry-per-day mode)
 @weight_bp.route('', methods=['POST'])
 @login_required
+@idempotent
 def add_weight_entry():
     data = request.get_json()
 
     if not data or 'weight' not in data or 'client_id' not in data:
         return jsonify({'error': 'Weight and client_id are required'}), 400
 
-    # Check if client exists
-    client = Client.query.get(data['client_id'])
-    if not client:
-        return jsonify({'error': 'Client not found'}), 404
+    try:
+        client_id = int(data['client_id'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid client_id'}), 400
 
-    # Check if the client belongs to the current user
-    if client.user_id != current_user.id:
-        return jsonify({'error': 'Unauthorized access'}), 403
+    # Check the client exists and belongs to the current user (the write
+    # itself checks again inside its transaction)
+    error = client_access_error(client_id)
+    if error:
+        return error
+
+    try:
+        weight = float(data['weight'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid weight'}), 400
 
     # Parse date if provided, otherwise use today's date
     date = datetime.now().date()
@@ -31,48 +148,383 @@ def add_weight_entry():
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
+    if write_behind.enabled():
+        # Queue the row for the next grouped insert instead of committing it here
+        try:
+            queued = write_behind.submit(current_user.id, {'client_id': client_id, 'date': date, 'weight': weight},
+                                         upsert=daily_entries.enabled())
+        except write_behind.QueueFull as e:
+            return jsonify({'error': f'{str(e)}, please retry'}), 503, {'Retry-After': '1'}
+        entry = {'weight': weight, 'date': date.isoformat(), 'client_id': client_id}
+        wait = request.args.get('wait', '1' if current_app.config.get('WRITE_BEHIND_WAIT') else '0') == '1'
+        if not wait:
+            return jsonify({'message': 'Weight entry queued', 'entry': entry}), 202
+        # Don't sit on this request's transaction (on SQLite, the write lock) while the flusher needs it
+        db.session.rollback()
+        try:
+            entry['id'] = queued.result(timeout=current_app.config.get('WRITE_BEHIND_WAIT_TIMEOUT', 10))
+        except Exception as e:
+            current_app.logger.error(f"Error waiting for queued weight entry: {str(e)}")
+            return jsonify({'error': f'Failed to add weight entry: {str(e)}'}), 500
+        return jsonify({'message': 'Weight entry added', 'entry': entry}), 201
+
+    if daily_entries.enabled():
+        written = daily_entries.upsert_entry(client_id, current_user.id, date, weight)
+        if written is None:
+            db.session.rollback()
+            client_deleted(client_id)
+            return jsonify({'error': 'Client not found'}), 404
+        entry_id, previous = written
+        apply_change(client_id, removed=(date, previous) if previous is not None else None, added=(date, weight))
+        changelog.record(current_user.id, changelog.ENTRY, entry_id)
+        version = bump_client(client_id, current_user.id)
+        db.session.commit()
+        entry = {'id': entry_id, 'weight': weight, 'date': date.isoformat(), 'client_id': client_id}
+        if previous is not None:
+            series_cache.entry_changed(client_id, version, entry_id, date, date, weight)
+            return jsonify({'message': 'Weight entry updated', 'entry': entry}), 200
+        series_cache.entry_added(client_id, version, entry_id, date, weight)
+        return jsonify({'message': 'Weight entry added', 'entry': entry}), 201
+
     # Create new weight entry
-    entry = WeightEntry(
-        weight=data['weight'],
-        date=date,
-        client_id=data['client_id']
-    )
+    entry_id = insert_owned_entry(client_id, date, weight)
+    if entry_id is None:
+        # Deleted (or re-created for someone else) since this worker cached its owner
+        db.session.rollback()
+        client_deleted(client_id)
+        return jsonify({'error': 'Client not found'}), 404
 
-    db.session.add(entry)
+    apply_change(client_id, added=(date, weight))
+    changelog.record(current_user.id, changelog.ENTRY, entry_id)
+    version = bump_client(client_id, current_user.id)
     db.session.commit()
+    series_cache.entry_added(client_id, version, entry_id, date, weight)
+
+    entry = {'id': entry_id, 'weight': weight, 'date': date.isoformat(), 'client_id': client_id}
+    return jsonify({'message': 'Weight entry added', 'entry': entry}), 201
+
+# Bulk import weight entries from a CSV or NDJSON body
+@weight_bp.route('/bulk', methods=['POST'])
+@login_required
+def bulk_import_weight_entries():
+    fmt = detect_format(request.content_type, request.args.get('format'))
+    if not fmt:
+        return jsonify({'error': 'Unsupported format. Send text/csv or application/x-ndjson'}), 415
+
+    try:
+        chunk_size = current_app.config.get('BULK_IMPORT_CHUNK_SIZE', 5000)
+        result = import_stream(request.stream, fmt, current_user.id, chunk_size=chunk_size,
+                               upsert=daily_entries.enabled())
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error importing weight entries: {str(e)}")
+        return jsonify({'error': f'Bulk import failed: {str(e)}'}), 400
 
-    return jsonify({'message': 'Weight entry added', 'entry': entry.to_dict()}), 201
+    result['message'] = 'Bulk import finished'
+    return jsonify(result), 200
 
 # Get all weight entries for a client
 @weight_bp.route('/client/<int:client_id>', methods=['GET'])
 @login_required
+@read_only
+@coalesced()
 def get_client_weight_entries(client_id):
-    # Check if client exists
-    client = Client.query.get_or_404(client_id)
+    # Check the client exists and belongs to the current user
+    error = client_access_error(client_id)
+    if error:
+        return error
 
-    # Check if the client belongs to the current user
-    if client.user_id != current_user.id:
-        return jsonify({'error': 'Unauthorized access'}), 403
+    # Answer repeat reads from the client's version counter alone
+    validators = Validators('client', client_id)
+    if validators.not_modified():
+        return validators.not_modified_response()
+
+    try:
+        date_from, date_to = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+    # Served from this worker's array cache of the client's series, checked
+    # against the version the validators just read
+    series = series_cache.get_series(client_id, validators.version)
+    lo, hi = series.bounds(date_from, date_to)
+
+    # Without limit/cursor keep returning the plain list the frontend expects
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return validators.apply(json_response(series.entry_dicts(lo, hi)))
+
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        # Keyset: everything strictly after (date, id) of the last row seen
+        lo = series.after(lo, hi, cursor_date.toordinal(), cursor_id)
+
+    end = min(lo + limit, hi)
+    has_more = end < hi
+    entries = series.entry_dicts(lo, end)
+    next_cursor = encode_cursor(datetime.fromordinal(series.days[end - 1]).date(), series.ids[end - 1]) \
+        if has_more else None
+
+    return validators.apply(json_response({
+        'entries': entries,
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }))
+
+# Get a downsampled, chart-ready weight series for a client
+@weight_bp.route('/client/<int:client_id>/series', methods=['GET'])
+@login_required
+@read_only
+@coalesced()
+def get_client_weight_series(client_id):
+    error = client_access_error(client_id)
+    if error:
+        return error
+
+    # Answer repeat reads from the client's version counter alone
+    validators = Validators('client', client_id)
+    if validators.not_modified():
+        return validators.not_modified_response()
+
+    try:
+        date_from, date_to = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
-    # Get all entries ordered by date
-    entries = WeightEntry.query.filter_by(client_id=client_id).order_by(WeightEntry.date).all()
-    return jsonify([entry.to_dict() for entry in entries])
+    method = request.args.get('method', 'lttb')
+    if method not in ('lttb', 'minmax'):
+        return jsonify({'error': 'method must be lttb or minmax'}), 400
+
+    unit = request.args.get('unit', 'kg')
+    if unit not in ('kg', 'lbs'):
+        return jsonify({'error': 'unit must be kg or lbs'}), 400
+
+    try:
+        points = min(max(int(request.args.get('points', DEFAULT_SERIES_POINTS)), 3), MAX_SERIES_POINTS)
+    except ValueError:
+        return jsonify({'error': 'points must be an integer'}), 400
+
+    series = series_cache.get_series(client_id, validators.version)
+    lo, hi = series.bounds(date_from, date_to)
+
+    # numpy is only needed here; importing it on first use keeps it off the worker boot path
+    from downsample import lttb, bucket_min_mean_max, cached_series_arrays, to_unit
+    x, y = cached_series_arrays(series, lo, hi)
+
+    if method == 'lttb':
+        keep = lttb(x, y, points)
+        weights = to_unit(y[keep], unit)
+        series = [
+            {'date': datetime.fromordinal(int(day)).date().isoformat(), 'weight': float(weight)}
+            for day, weight in zip(x[keep], weights)
+        ]
+    else:
+        x_start = date_from.toordinal() if date_from else None
+        x_end = date_to.toordinal() if date_to else None
+        starts, mins, means, maxs, counts = bucket_min_mean_max(x, y, points, x_start, x_end)
+        mins, means, maxs = to_unit(mins, unit), to_unit(means, unit), to_unit(maxs, unit)
+        series = [
+            {
+                'date': datetime.fromordinal(int(day)).date().isoformat(),
+                'min': float(lo),
+                'mean': float(avg),
+                'max': float(hi),
+                'count': int(n)
+            }
+            for day, lo, avg, hi, n in zip(starts, mins, means, maxs, counts)
+        ]
+
+    return validators.apply(json_response({
+        'client_id': client_id,
+        'method': method,
+        'unit': unit,
+        'total_entries': len(x),
+        'points': series
+    }))
+
+# Get the weight entries of several clients in one request
+@weight_bp.route('/batch', methods=['GET'])
+@login_required
+@read_only
+@coalesced()
+def get_weight_entries_batch():
+    try:
+        client_ids = parse_client_ids(request.args)
+    except ValueError:
+        return jsonify({'error': 'client_ids must be a comma-separated list of integers'}), 400
+    if not client_ids:
+        return jsonify({'error': 'client_ids is required'}), 400
+    if len(client_ids) > MAX_BATCH_CLIENTS:
+        return jsonify({'error': f'At most {MAX_BATCH_CLIENTS} clients per request'}), 400
+
+    try:
+        date_from, date_to = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+
+    try:
+        # Ownership and data versions of every requested client in one query
+        versions, error = owned_versions(client_ids)
+        if error:
+            return error
+
+        # Cached series where the version still matches, the rest with one ordered query
+        found = series_cache.get_many(versions)
+        clients = []
+        for client_id in client_ids:
+            series = found[client_id]
+            clients.append({'client_id': client_id, 'entries': series.entry_dicts(*series.bounds(date_from, date_to))})
+        return json_response({'clients': clients})
+    except Exception as e:
+        current_app.logger.error(f"Error getting weight entries for clients {client_ids}: {str(e)}")
+        return jsonify({'error': f'Failed to get weight entries: {str(e)}'}), 500
+
+# Get a client's weight trend as a small SVG image
+@weight_bp.route('/client/<int:client_id>/sparkline.svg', methods=['GET'])
+@login_required
+@read_only
+@coalesced()
+def get_client_sparkline(client_id):
+    error = client_access_error(client_id)
+    if error:
+        return error
+
+    try:
+        width, height = parse_sparkline_size(request.args)
+    except ValueError:
+        return jsonify({'error': 'width and height must be integers'}), 400
+
+    # Answer repeat reads from the client's version counter alone
+    validators = Validators('client', client_id)
+    if validators.not_modified():
+        return validators.not_modified_response()
+
+    svg = sparklines.get_many({client_id: validators.version}, width, height)[client_id]
+    return validators.apply(Response(svg, mimetype='image/svg+xml'))
+
+# Get the sparklines of a page of clients in one response
+@weight_bp.route('/sparklines', methods=['GET'])
+@login_required
+@read_only
+@coalesced()
+def get_sparklines():
+    try:
+        client_ids = parse_client_ids(request.args)
+        width, height = parse_sparkline_size(request.args)
+    except ValueError:
+        return jsonify({'error': 'client_ids, width and height must be integers'}), 400
+    if not client_ids:
+        return jsonify({'error': 'client_ids is required'}), 400
+    if len(client_ids) > MAX_SPARKLINE_CLIENTS:
+        return jsonify({'error': f'At most {MAX_SPARKLINE_CLIENTS} clients per request'}), 400
+
+    # Any write to one of the user's clients moves the user's version too
+    validators = Validators('user', current_user.id)
+    if validators.not_modified():
+        return validators.not_modified_response()
+
+    try:
+        versions, error = owned_versions(client_ids)
+        if error:
+            return error
+
+        # Cached images cost nothing more; only changed clients load their series and render
+        svgs = sparklines.get_many(versions, width, height)
+        return validators.apply(json_response({
+            'width': width,
+            'height': height,
+            'sparklines': [{'client_id': client_id, 'svg': svgs[client_id].decode()} for client_id in client_ids]
+        }))
+    except Exception as e:
+        current_app.logger.error(f"Error rendering sparklines for clients {client_ids}: {str(e)}")
+        return jsonify({'error': f'Failed to render sparklines: {str(e)}'}), 500
+
+# Get summary stats for a client from its aggregate row
+@weight_bp.route('/client/<int:client_id>/summary', methods=['GET'])
+@login_required
+@read_only
+@coalesced()
+def get_client_weight_summary(client_id):
+    error = client_access_error(client_id)
+    if error:
+        return error
+
+    # Answer repeat reads from the client's version counter alone
+    validators = Validators('client', client_id)
+    if validators.not_modified():
+        return validators.not_modified_response()
+
+    return validators.apply(jsonify(get_stats(client_id).to_dict()))
+
+# Get smoothing, rolling averages, trend, goal forecast and plateau status for a client
+@weight_bp.route('/client/<int:client_id>/analytics', methods=['GET'])
+@login_required
+@read_only
+@coalesced()
+def get_client_weight_analytics(client_id):
+    error = client_access_error(client_id)
+    if error:
+        return error
+
+    # numpy is only needed here; see get_client_weight_series
+    import analytics
+
+    try:
+        days, halflife, goal = analytics.parse_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The window ends today, so the date is part of the validator
+    today = datetime.now().date()
+    validators = Validators('client', client_id, extra=(today, days, halflife, goal))
+    if validators.not_modified():
+        return validators.not_modified_response()
+
+    try:
+        if goal is None:
+            goal = db.session.query(Client.goal_weight).filter(Client.id == client_id).scalar()
+
+        ids, x, y = analytics.load_client(client_id, analytics.window_start(days, today))
+        summary = analytics.summaries(analytics.compute(ids, x, y, halflife, goals={client_id: goal}))
+        points, weekly = analytics.client_series(x, y, halflife)
+
+        return validators.apply(json_response({
+            'client_id': client_id,
+            'days': days,
+            'halflife': halflife,
+            'summary': summary[0] if summary else analytics.empty_summary(client_id, goal),
+            'points': points,
+            'weekly': weekly
+        }))
+    except Exception as e:
+        current_app.logger.error(f"Error computing analytics for client {client_id}: {str(e)}")
+        return jsonify({'error': f'Failed to compute analytics: {str(e)}'}), 500
 
 # Update a weight entry
 @weight_bp.route('/<int:entry_id>', methods=['PUT'])
 @login_required
 def update_weight_entry(entry_id):
-    entry = WeightEntry.query.get_or_404(entry_id)
-
-    # Check if the entry belongs to a client owned by the current user
-    client = Client.query.get(entry.client_id)
-    if client.user_id != current_user.id:
-        return jsonify({'error': 'Unauthorized access'}), 403
+    # Check if the entry belongs to a live client owned by the current user
+    entry, error = owned_entry_or_error(entry_id)
+    if error:
+        return error
 
     data = request.get_json()
+    previous = (entry.date, entry.weight)
 
     if 'weight' in data:
-        entry.weight = data['weight']
+        try:
+            entry.weight = float(data['weight'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid weight'}), 400
 
     if 'date' in data:
         try:
@@ -80,20 +532,35 @@ def update_weight_entry(entry_id):
         except ValueError:
             return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
 
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # One-entry-per-day mode: the new date already has an entry
+        db.session.rollback()
+        return jsonify({'error': 'An entry for that date already exists'}), 409
+    client_id, current = entry.client_id, (entry.date, entry.weight)
+    apply_change(client_id, removed=previous, added=current)
+    changelog.record(current_user.id, changelog.ENTRY, entry_id)
+    version = bump_client(client_id, current_user.id)
     db.session.commit()
+    series_cache.entry_changed(client_id, version, entry_id, previous[0], *current)
     return jsonify({'message': 'Weight entry updated', 'entry': entry.to_dict()})
 
 # Delete a weight entry
 @weight_bp.route('/<int:entry_id>', methods=['DELETE'])
 @login_required
 def delete_weight_entry(entry_id):
-    entry = WeightEntry.query.get_or_404(entry_id)
-
-    # Check if the entry belongs to a client owned by the current user
-    client = Client.query.get(entry.client_id)
-    if client.user_id != current_user.id:
-        return jsonify({'error': 'Unauthorized access'}), 403
+    # Check if the entry belongs to a live client owned by the current user
+    entry, error = owned_entry_or_error(entry_id)
+    if error:
+        return error
 
+    client_id, previous = entry.client_id, (entry.date, entry.weight)
     db.session.delete(entry)
+    db.session.flush()
+    apply_change(client_id, removed=previous)
+    changelog.record(current_user.id, changelog.ENTRY, entry_id, changelog.DELETE)
+    version = bump_client(client_id, current_user.id)
     db.session.commit()
+    series_cache.entry_removed(client_id, version, entry_id, previous[0])
     return jsonify({'message': 'Weight entry deleted'})
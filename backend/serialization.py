@@ -0,0 +1,110 @@
+"""
+Response serialization for the list endpoints.
+
+Listings are built from plain column tuples instead of ORM objects, encoded
+with orjson when it is installed (stdlib json otherwise), and large
+responses are compressed with brotli or gzip depending on Accept-Encoding.
+"""
+import gzip
+import json
+from datetime import date, datetime
+from flask import Response, request
+from models import db
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional speedup
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'image/svg+xml')
+
+# Column order for the tuple-based serializers below
+ENTRY_FIELDS = ('id', 'weight', 'date', 'client_id')
+CLIENT_FIELDS = ('id', 'name', 'email', 'created_at', 'user_id', 'goal_weight')
+
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    """Encode data as JSON bytes; dates become ISO strings"""
+    if orjson is not None:
+        # orjson encodes date/datetime natively and skips the isoformat() calls
+        return orjson.dumps(data)
+    return json.dumps(data, default=_default, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """A drop-in replacement for jsonify() using the fastest available encoder"""
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def fetch_rows(query):
+    """Run a column query on the session's connection, skipping ORM result processing"""
+    return db.session.connection().execute(query.statement).all()
+
+
+def fetch_raw(query):
+    """
+    Like fetch_rows, but return the driver's own tuples without building Row
+    objects. Only for columns the driver already returns as the wanted Python
+    type (integers, floats, strings); dates should be cast to strings.
+    """
+    result = db.session.connection().execute(query.statement)
+    try:
+        return result.cursor.fetchall()
+    finally:
+        result.close()
+
+
+def rows_to_dicts(rows, fields):
+    """Turn query result tuples into dicts keyed by `fields`, without ORM objects"""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def _compress(body, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level)
+
+
+def _pick_encoding(accept_encoding):
+    if brotli is not None and 'br' in accept_encoding:
+        return 'br'
+    if 'gzip' in accept_encoding:
+        return 'gzip'
+    return None
+
+
+def init_app(app):
+    """Compress large responses after each request"""
+
+    @app.after_request
+    def compress_response(response):
+        min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+        if (min_size is None or response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        encoding = _pick_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+
+        response.set_data(_compress(body, encoding, app.config.get('COMPRESS_LEVEL', 6)))
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,263 @@
+"""
+Per-worker cache of hot clients' weight series in compact array form.
+
+Each cached client is three parallel arrays sorted by (day, id): entry ids
+('q', 8 bytes), day ordinals ('i', 4 bytes) and weights ('d', 8 bytes), so an
+entry costs 20 bytes instead of the few hundred of a WeightEntry object or a
+dict. The cache is an LRU bounded by the total bytes of those arrays.
+
+Every cached series remembers the client's data version (versions.py). Read
+routes already fetch that version for their ETag and only use the cached copy
+when it matches, so writes made by other workers simply cause a reload. This
+worker's own single-entry writes patch the cached series in place of a reload
+when the version moved by exactly their own bump.
+
+Series are never mutated after they are published; a patch builds new arrays
+and swaps them in, so readers can use a series without holding the lock.
+"""
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date
+from sqlalchemy import String, cast
+from models import db, WeightEntry
+from serialization import fetch_raw
+
+# Rough fixed cost of one cached client (objects, dict slot) on top of its arrays
+SERIES_OVERHEAD_BYTES = 400
+
+
+class ClientSeries:
+    """One client's entries as parallel arrays sorted by (day, id)"""
+
+    __slots__ = ('client_id', 'version', 'ids', 'days', 'weights')
+
+    def __init__(self, client_id, version, ids, days, weights):
+        self.client_id = client_id
+        self.version = version
+        self.ids = ids
+        self.days = days
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return (SERIES_OVERHEAD_BYTES + self.ids.itemsize * len(self.ids)
+                + self.days.itemsize * len(self.days) + self.weights.itemsize * len(self.weights))
+
+    def bounds(self, date_from=None, date_to=None):
+        """Index range [lo, hi) of entries inside the optional date range"""
+        lo = bisect_left(self.days, date_from.toordinal()) if date_from else 0
+        hi = bisect_right(self.days, date_to.toordinal()) if date_to else len(self.days)
+        return lo, max(lo, hi)
+
+    def after(self, lo, hi, day, entry_id):
+        """First index in [lo, hi) strictly after (day, entry_id)"""
+        i = max(lo, bisect_left(self.days, day, lo, hi))
+        while i < hi and self.days[i] == day and self.ids[i] <= entry_id:
+            i += 1
+        return i
+
+    def entry_dicts(self, lo, hi):
+        """Rows in the same shape as serialization.ENTRY_FIELDS"""
+        client_id = self.client_id
+        iso = _iso_dates(self.days[lo:hi])
+        return [
+            {'id': entry_id, 'weight': weight, 'date': iso[day], 'client_id': client_id}
+            for entry_id, day, weight in zip(self.ids[lo:hi], self.days[lo:hi], self.weights[lo:hi])
+        ]
+
+    def _position(self, day, entry_id):
+        i = bisect_left(self.days, day)
+        while i < len(self.days) and self.days[i] == day and self.ids[i] < entry_id:
+            i += 1
+        return i
+
+    def with_entry(self, version, entry_id, day, weight):
+        i = self._position(day, entry_id)
+        if i < len(self.ids) and self.ids[i] == entry_id:
+            # Already loaded with the entry (the load raced with this write)
+            return ClientSeries(self.client_id, version, self.ids, self.days, self.weights)
+        ids, days, weights = array('q', self.ids), array('i', self.days), array('d', self.weights)
+        ids.insert(i, entry_id)
+        days.insert(i, day)
+        weights.insert(i, weight)
+        return ClientSeries(self.client_id, version, ids, days, weights)
+
+    def without_entry(self, version, entry_id, day):
+        i = self._position(day, entry_id)
+        if i >= len(self.ids) or self.ids[i] != entry_id:
+            return None
+        ids, days, weights = array('q', self.ids), array('i', self.days), array('d', self.weights)
+        del ids[i], days[i], weights[i]
+        return ClientSeries(self.client_id, version, ids, days, weights)
+
+
+def _iso_dates(days):
+    return {day: date.fromordinal(day).isoformat() for day in set(days)}
+
+
+class SeriesCache:
+    """A thread-safe LRU of ClientSeries bounded by total array bytes"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, client_id, version):
+        with self._lock:
+            series = self._data.get(client_id)
+            if series is not None and series.version == version:
+                self._data.move_to_end(client_id)
+                self.hits += 1
+                return series
+            self.misses += 1
+            return None
+
+    def put(self, series):
+        with self._lock:
+            self._put(series)
+
+    def _put(self, series):
+        old = self._data.pop(series.client_id, None)
+        if old is not None:
+            self.bytes -= old.nbytes
+        if series.nbytes > self.max_bytes:
+            return
+        self._data[series.client_id] = series
+        self.bytes += series.nbytes
+        while self.bytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def patch(self, client_id, version, change):
+        """Apply change(series) -> series if the cache is exactly one version behind, else drop it"""
+        with self._lock:
+            series = self._data.get(client_id)
+            if series is None:
+                return
+            patched = change(series) if series.version == version - 1 else None
+            if patched is None:
+                self.bytes -= self._data.pop(client_id).nbytes
+            else:
+                self._put(patched)
+
+    def invalidate(self, client_id):
+        with self._lock:
+            series = self._data.pop(client_id, None)
+            if series is not None:
+                self.bytes -= series.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'entries': sum(len(series) for series in self._data.values()),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+            }
+
+
+cache = SeriesCache()
+
+
+def init_app(app):
+    """Apply the cache size from the app config"""
+    cache.max_bytes = app.config.get('SERIES_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+
+def load(client_id, version):
+    """Read a client's full series from the database into arrays"""
+    rows = fetch_raw(
+        db.session.query(WeightEntry.id, cast(WeightEntry.date, String), WeightEntry.weight)
+        .filter(WeightEntry.client_id == client_id)
+        .order_by(WeightEntry.date, WeightEntry.id)
+    )
+    ordinals = {}
+    days = array('i', [
+        ordinals.get(row[1]) or ordinals.setdefault(row[1], date.fromisoformat(row[1]).toordinal())
+        for row in rows
+    ])
+    return ClientSeries(client_id, version,
+                        array('q', [row[0] for row in rows]), days, array('d', [row[2] for row in rows]))
+
+
+def load_many(versions):
+    """Read several clients' full series with one ordered query; versions maps client id -> version"""
+    rows = fetch_raw(
+        db.session.query(WeightEntry.client_id, WeightEntry.id, cast(WeightEntry.date, String), WeightEntry.weight)
+        .filter(WeightEntry.client_id.in_(list(versions)))
+        .order_by(WeightEntry.client_id, WeightEntry.date, WeightEntry.id)
+    )
+    loaded = {client_id: ClientSeries(client_id, version, array('q'), array('i'), array('d'))
+              for client_id, version in versions.items()}
+    ordinals = {}
+    series = None
+    for client_id, entry_id, day, weight in rows:
+        if series is None or series.client_id != client_id:
+            series = loaded[client_id]
+        series.ids.append(entry_id)
+        series.days.append(ordinals.get(day) or ordinals.setdefault(day, date.fromisoformat(day).toordinal()))
+        series.weights.append(weight)
+    return loaded
+
+
+def get_series(client_id, version):
+    """The client's series at `version`, from the cache or freshly loaded"""
+    series = cache.get(client_id, version)
+    if series is None:
+        series = load(client_id, version)
+        if cache.max_bytes:
+            cache.put(series)
+    return series
+
+
+def get_many(versions):
+    """{client id: series at its version}; cache misses are loaded together"""
+    found = {}
+    for client_id, version in versions.items():
+        series = cache.get(client_id, version)
+        if series is not None:
+            found[client_id] = series
+    missing = {client_id: version for client_id, version in versions.items() if client_id not in found}
+    if missing:
+        for series in load_many(missing).values():
+            if cache.max_bytes:
+                cache.put(series)
+            found[series.client_id] = series
+    return found
+
+
+def entry_added(client_id, version, entry_id, entry_date, weight):
+    cache.patch(client_id, version, lambda series: series.with_entry(version, entry_id, entry_date.toordinal(), weight))
+
+
+def entry_removed(client_id, version, entry_id, entry_date):
+    cache.patch(client_id, version, lambda series: series.without_entry(version, entry_id, entry_date.toordinal()))
+
+
+def entry_changed(client_id, version, entry_id, old_date, new_date, weight):
+    def change(series):
+        series = series.without_entry(version, entry_id, old_date.toordinal())
+        return series.with_entry(version, entry_id, new_date.toordinal(), weight) if series else None
+
+    cache.patch(client_id, version, change)
@@ -0,0 +1,223 @@
+"""
+Server-rendered SVG sparklines of clients' weight histories.
+
+A sparkline is the client's whole series reduced with LTTB to about one
+point per pixel and drawn as a single polyline, a few hundred bytes of SVG.
+Rendered images are cached under (client id, data version, size):
+
+- in memory, per worker, as an LRU bounded by total bytes
+  (SPARKLINE_CACHE_MAX_BYTES, 0 disables it);
+- optionally on disk in SPARKLINE_CACHE_DIR, shared by all workers and kept
+  across restarts. Writing a client's new version removes its older files.
+
+Because the version is part of the key, a write to a client makes the next
+read render afresh and nothing has to be invalidated. A page of cached
+sparklines costs only the query that reads the clients' versions.
+"""
+import glob
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import current_app
+import series_cache
+
+DEFAULT_WIDTH = 120
+DEFAULT_HEIGHT = 32
+STROKE = '#3b82f6'
+PADDING = 2
+
+
+class SparklineCache:
+    """A thread-safe LRU of rendered SVGs bounded by their total size"""
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            svg = self._data.get(key)
+            if svg is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+            return svg
+
+    def put(self, key, svg):
+        if len(svg) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._data[key] = svg
+            self.bytes += len(svg)
+            while self.bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def record_disk_hit(self):
+        with self._lock:
+            self.disk_hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses
+            }
+
+
+cache = SparklineCache()
+
+
+def init_app(app):
+    """Apply the cache size from the app config"""
+    cache.max_bytes = app.config.get('SPARKLINE_CACHE_MAX_BYTES', 4 * 1024 * 1024)
+
+
+def _disk_path(directory, client_id, version, width, height):
+    return os.path.join(directory, f'{client_id}-{version}-{width}x{height}.svg')
+
+
+def _read_disk(directory, key):
+    try:
+        with open(_disk_path(directory, *key), 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _file_version(path):
+    try:
+        return int(os.path.basename(path).split('-')[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        # Another worker cleaned it up first
+        pass
+
+
+def _write_disk(directory, key, svg):
+    client_id, version, width, height = key
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Write then rename, so other workers never read a partial file
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(svg)
+        os.replace(tmp, _disk_path(directory, *key))
+        # Remove only older versions, so a writer that is itself behind never removes a
+        # newer file; it drops its own instead, which the newer writer may have missed
+        files = {path: _file_version(path)
+                 for path in glob.glob(os.path.join(directory, f'{client_id}-*-{width}x{height}.svg'))}
+        newest = max((found for found in files.values() if found is not None), default=version)
+        for path, found in files.items():
+            if found is not None and found < newest:
+                _remove(path)
+    except OSError as e:
+        current_app.logger.warning(f"Error writing sparkline cache file for client {client_id}: {str(e)}")
+
+
+def lookup(client_id, version, width, height):
+    """The cached SVG for this client version and size, or None"""
+    key = (client_id, version, width, height)
+    svg = cache.get(key)
+    if svg is not None:
+        return svg
+    directory = current_app.config.get('SPARKLINE_CACHE_DIR')
+    if directory:
+        svg = _read_disk(directory, key)
+        if svg is not None:
+            cache.record_disk_hit()
+            if cache.max_bytes:
+                cache.put(key, svg)
+            return svg
+    cache.record_miss()
+    return None
+
+
+def store(client_id, version, width, height, svg):
+    key = (client_id, version, width, height)
+    if cache.max_bytes:
+        cache.put(key, svg)
+    directory = current_app.config.get('SPARKLINE_CACHE_DIR')
+    if directory:
+        _write_disk(directory, key, svg)
+
+
+def forget(client_id):
+    """Remove a deleted client's files from the disk tier (memory entries just age out)"""
+    directory = current_app.config.get('SPARKLINE_CACHE_DIR')
+    if not directory:
+        return
+    for path in glob.glob(os.path.join(directory, f'{client_id}-*.svg')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def render(series, width, height):
+    """SVG bytes for a series_cache.ClientSeries"""
+    head = (f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+            f'viewBox="0 0 {width} {height}">')
+    if len(series) < 2:
+        return (head + '</svg>').encode()
+
+    # numpy is only needed here; importing it on first use keeps it off the worker boot path
+    import numpy as np
+    from downsample import lttb, cached_series_arrays
+    x, y = cached_series_arrays(series, 0, len(series))
+    keep = lttb(x, y, width)
+    x, y = x[keep], y[keep]
+
+    x_span = float(x[-1] - x[0]) or 1.0
+    y_low, y_span = float(y.min()), float(y.max() - y.min())
+    inner_width, inner_height = width - 2 * PADDING, height - 2 * PADDING
+    xs = PADDING + (x - x[0]) / x_span * inner_width
+    # Heavier is higher; a flat series sits in the middle
+    ys = PADDING + (1 - (y - y_low) / y_span) * inner_height if y_span else np.full(len(xs), height / 2)
+    points = ' '.join(f'{px:.1f},{py:.1f}' for px, py in zip(xs, ys))
+    return (head
+            + f'<polyline fill="none" stroke="{STROKE}" stroke-width="1.5" stroke-linejoin="round" points="{points}"/>'
+            + f'<circle cx="{xs[-1]:.1f}" cy="{ys[-1]:.1f}" r="2" fill="{STROKE}"/></svg>').encode()
+
+
+def get_many(versions, width, height):
+    """{client id: SVG bytes}; versions maps client id -> data version"""
+    found = {}
+    for client_id, version in versions.items():
+        svg = lookup(client_id, version, width, height)
+        if svg is not None:
+            found[client_id] = svg
+    missing = {client_id: version for client_id, version in versions.items() if client_id not in found}
+    if missing:
+        for client_id, series in series_cache.get_many(missing).items():
+            svg = render(series, width, height)
+            store(client_id, series.version, width, height, svg)
+            found[client_id] = svg
+    return found
@@ -0,0 +1,87 @@
+"""
+Production profile for the SQLite fallback database.
+
+With SQLITE_TUNED on (the default) and a file-backed SQLite URL:
+- every connection runs in WAL mode with synchronous=NORMAL, a larger page
+  cache, memory-mapped reads and a busy timeout instead of failing fast;
+- the primary engine gets a bounded pool and starts transactions with
+  BEGIN IMMEDIATE, so writers queue on the busy timeout up front instead of
+  hitting "database is locked" when a read transaction tries to upgrade;
+- a second 'read' bind with its own pool opens connections with
+  query_only=ON; db_routing.RoutingSession sends @read_only routes there.
+
+PostgreSQL and in-memory SQLite are left alone.
+"""
+from functools import partial
+from sqlalchemy import event
+from db_routing import READ_BIND
+
+
+def is_enabled(app):
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    return (app.config.get('SQLITE_TUNED', True) and uri.startswith('sqlite:///')
+            and uri not in ('sqlite:///', 'sqlite:///:memory:'))
+
+
+def configure(app):
+    """Set pool options and the read bind; call before db.init_app()"""
+    if not is_enabled(app):
+        return False
+
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    busy_timeout = app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    connect_args = {'timeout': busy_timeout / 1000.0, 'check_same_thread': False}
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(
+        app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {},
+        pool_size=app.config.get('SQLITE_WRITE_POOL_SIZE', 4),
+        max_overflow=0,
+        pool_timeout=busy_timeout / 1000.0,
+        connect_args=connect_args
+    )
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds[READ_BIND] = {
+        'url': uri,
+        'pool_size': app.config.get('SQLITE_READ_POOL_SIZE', 8),
+        'max_overflow': 0,
+        'pool_timeout': busy_timeout / 1000.0,
+        'connect_args': connect_args
+    }
+    app.config['SQLALCHEMY_BINDS'] = binds
+    return True
+
+
+def _on_connect(pragmas, read_only, dbapi_connection, connection_record):
+    # Let SQLAlchemy's begin event issue BEGIN instead of the sqlite3 module
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas:
+        cursor.execute(f'PRAGMA {name}={value}')
+    if read_only:
+        cursor.execute('PRAGMA query_only=ON')
+    cursor.close()
+
+
+def _on_begin(statement, conn):
+    conn.exec_driver_sql(statement)
+
+
+def install(app, db):
+    """Attach the pragma and transaction hooks to the app's engines; call after db.init_app()"""
+    if not is_enabled(app):
+        return
+
+    pragmas = (
+        ('journal_mode', 'WAL'),
+        ('synchronous', app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        # Negative cache_size is in KiB rather than pages
+        ('cache_size', -app.config.get('SQLITE_CACHE_SIZE_KB', 65536)),
+        ('mmap_size', app.config.get('SQLITE_MMAP_SIZE', 268435456)),
+        ('temp_store', 'MEMORY'),
+    )
+    with app.app_context():
+        for key, engine in db.engines.items():
+            read_only = key == READ_BIND
+            event.listen(engine, 'connect', partial(_on_connect, pragmas, read_only))
+            event.listen(engine, 'begin', partial(_on_begin, 'BEGIN' if read_only else 'BEGIN IMMEDIATE'))
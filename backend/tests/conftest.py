@@ -0,0 +1,164 @@
+"""
+Shared fixtures for the backend tests.
+
+Every test gets a fresh app on its own copy of a SQLite database that is
+migrated once per session. Password hashing runs on the request thread at a
+low cost, and the per-worker caches and background helpers start empty.
+"""
+import itertools
+import os
+import shutil
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+
+BASE_URL = 'https://localhost'
+PASSWORD = 'pw'
+
+_emails = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def migrated_db(tmp_path_factory):
+    """Path of a database with every migration applied"""
+    from sqlalchemy import create_engine
+    import migrations
+
+    path = str(tmp_path_factory.mktemp('template') / 'template.db')
+    engine = create_engine('sqlite:///' + path)
+    migrations.upgrade(engine, echo=lambda message: None)
+    engine.dispose()
+    return path
+
+
+@pytest.fixture
+def app(migrated_db, tmp_path, monkeypatch):
+    import client_search
+    import coalesce
+    import identity_cache
+    import purge
+    import series_cache
+    import sparklines
+    import write_behind
+    from app import create_app
+    from models import db
+
+    path = str(tmp_path / 'test.db')
+    shutil.copy(migrated_db, path)
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', 'sqlite:///' + path)
+    monkeypatch.setattr(Config, 'HASH_POOL_WORKERS', 0)
+    monkeypatch.setattr(Config, 'PASSWORD_HASH_ITERATIONS', 1000)
+
+    # Module-level state lives as long as the worker process; start each test clean
+    for cache in identity_cache.CACHES:
+        cache.clear()
+    series_cache.cache.clear()
+    sparklines.cache.clear()
+    client_search._backends.clear()
+    monkeypatch.setattr(coalesce, 'flights', coalesce.SingleFlight())
+    monkeypatch.setattr(write_behind, 'writer', write_behind.WriteBehind())
+    monkeypatch.setattr(purge, 'worker', purge.PurgeWorker())
+
+    app = create_app()
+    yield app
+
+    write_behind.shutdown()
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def make_http(app):
+    http = app.test_client()
+    # The session cookie is Secure-only
+    http.environ_base['wsgi.url_scheme'] = 'https'
+    return http
+
+
+def register(http, username):
+    """Register (or log in again) a user on a test client; returns the user id"""
+    response = http.post('/api/auth/register', base_url=BASE_URL,
+                         json={'username': username, 'email': f'{username}@example.com', 'password': PASSWORD})
+    if response.status_code == 409:
+        response = http.post('/api/auth/login', base_url=BASE_URL, json={'username': username, 'password': PASSWORD})
+    assert response.status_code in (200, 201), response.get_json()
+    return response.get_json()['user']['id']
+
+
+@pytest.fixture
+def client(app):
+    """A test client logged in as 'coach'"""
+    http = make_http(app)
+    http.user_id = register(http, 'coach')
+    return http
+
+
+@pytest.fixture
+def login_as(app):
+    """Factory for test clients logged in as other users"""
+
+    def login(username):
+        http = make_http(app)
+        http.user_id = register(http, username)
+        return http
+
+    return login
+
+
+@pytest.fixture
+def anonymous(app):
+    return make_http(app)
+
+
+@pytest.fixture
+def make_client(app):
+    """Factory that creates a client row for a user and returns its id"""
+    from models import db, Client
+
+    def make(user_id, name='Client', email=None, goal_weight=None):
+        with app.app_context():
+            client = Client(name=name, email=email or f'client{next(_emails)}@example.com',
+                            user_id=user_id, goal_weight=goal_weight)
+            db.session.add(client)
+            db.session.commit()
+            return client.id
+
+    return make
+
+
+@pytest.fixture
+def add_entries(app):
+    """Factory that writes (date, weight) rows for a client directly, keeping stats and versions in step"""
+    from models import db, Client, WeightEntry
+    from client_stats import rebuild_client
+    from versions import bump_client
+
+    def add(client_id, rows):
+        with app.app_context():
+            values = [{'client_id': client_id, 'date': date.fromisoformat(day) if isinstance(day, str) else day,
+                       'weight': weight} for day, weight in rows]
+            if values:
+                db.session.execute(WeightEntry.__table__.insert(), values)
+            rebuild_client(client_id)
+            bump_client(client_id, db.session.get(Client, client_id).user_id)
+            db.session.commit()
+
+    return add
+
+
+@pytest.fixture
+def test_user_id(app):
+    """Id of the 'testuser' account the client routes run as"""
+    from models import db
+    from routes.client import get_test_user
+
+    with app.app_context():
+        user_id = get_test_user().id
+        db.session.commit()
+        return user_id
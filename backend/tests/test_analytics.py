@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+
+import pytest
+
+from conftest import BASE_URL
+
+
+@pytest.fixture
+def losing(client, make_client, add_entries):
+    """A client losing 0.1 kg a day for 60 days up to today"""
+    today = date.today()
+    own = make_client(client.user_id, goal_weight=80.05)
+    add_entries(own, [(today - timedelta(days=59 - day), 90 - 0.1 * day) for day in range(60)])
+    return own
+
+
+def test_client_trend_rates_and_forecast(client, losing):
+    today = date.today()
+    body = client.get(f'/api/weight/client/{losing}/analytics', base_url=BASE_URL).get_json()
+    summary = body['summary']
+    assert summary['entries'] == 60 and summary['latest_date'] == today.isoformat()
+    assert summary['latest_weight'] == pytest.approx(84.1)
+    assert summary['weekly_rate'] == pytest.approx(-0.7)
+    assert summary['average_7d'] == pytest.approx(84.4)
+    assert not summary['plateau'] and not summary['goal_reached']
+    assert summary['projected_goal_date'] == (today + timedelta(days=41)).isoformat()
+    assert len(body['points']) == 60
+    assert body['points'][-1]['date'] == today.isoformat()
+    assert len(body['weekly']) >= 8
+
+    # A goal passed in the query overrides the stored one
+    reached = client.get(f'/api/weight/client/{losing}/analytics?goal=85', base_url=BASE_URL).get_json()
+    assert reached['summary']['goal_reached'] is True
+
+
+@pytest.mark.parametrize('halflife', [1, 0.25])
+def test_short_halflife_over_a_long_window_stays_defined(client, make_client, add_entries, halflife):
+    today = date.today()
+    own = make_client(client.user_id)
+    add_entries(own, [(today - timedelta(days=364 - day), 90 - 0.01 * day) for day in range(365)])
+
+    body = client.get(f'/api/weight/client/{own}/analytics?days=365&halflife={halflife}',
+                      base_url=BASE_URL).get_json()
+    smoothed = [point['ewma'] for point in body['points']]
+    assert len(smoothed) == 365 and None not in smoothed
+    assert smoothed[0] == pytest.approx(90)
+    # A steady 0.01/day loss leaves the smoothed value a/(1-a) days' loss behind, a = 2^(-1/halflife)
+    decay = 2 ** (-1 / halflife)
+    assert smoothed[-1] - body['summary']['latest_weight'] == pytest.approx(0.01 * decay / (1 - decay), abs=0.002)
+    assert body['summary']['ewma'] == pytest.approx(smoothed[-1], abs=0.001)
+
+
+def test_window_and_empty_clients(client, losing, make_client):
+    recent = client.get(f'/api/weight/client/{losing}/analytics?days=7', base_url=BASE_URL).get_json()
+    assert recent['days'] == 7 and recent['summary']['entries'] == 7
+
+    empty = make_client(client.user_id)
+    body = client.get(f'/api/weight/client/{empty}/analytics', base_url=BASE_URL).get_json()
+    assert body['summary']['entries'] == 0 and body['points'] == [] and body['weekly'] == []
+
+
+def test_all_clients_in_one_pass(anonymous, make_client, add_entries, test_user_id):
+    today = date.today()
+    flat = make_client(test_user_id, name='Flat')
+    idle = make_client(test_user_id, name='Idle')
+    add_entries(flat, [(today - timedelta(days=day), 70 + (0.01 if day % 2 else -0.01)) for day in range(30)])
+
+    body = anonymous.get('/api/clients/analytics', base_url=BASE_URL).get_json()
+    by_name = {row['name']: row for row in body['clients']}
+    assert by_name['Flat']['client_id'] == flat and by_name['Flat']['plateau'] is True
+    assert by_name['Idle']['client_id'] == idle and by_name['Idle']['entries'] == 0
+
+
+def test_invalid_parameters_are_rejected(client, losing, anonymous):
+    for query in ('days=0', 'days=100000', 'halflife=-1', 'goal=heavy'):
+        assert client.get(f'/api/weight/client/{losing}/analytics?{query}', base_url=BASE_URL).status_code == 400
+    assert anonymous.get('/api/clients/analytics?days=x', base_url=BASE_URL).status_code == 400
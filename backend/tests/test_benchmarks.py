@@ -0,0 +1,34 @@
+import random
+from datetime import date
+
+from benchmarks.common import percentile, summarize
+from benchmarks.datagen import entry_dates, entry_weights, generate
+
+
+def test_generate_creates_the_requested_dataset(app):
+    from models import db, Client, ClientStats, User, WeightEntry
+
+    created = generate(app, users=2, clients_per_user=3, entries_per_client=20, end=date(2024, 6, 30))
+    assert created['users'] == ['testuser', 'bench1']
+    assert created['clients'] == 6
+    with app.app_context():
+        assert db.session.query(User).filter(User.username.in_(created['users'])).count() == 2
+        assert db.session.query(Client).count() == 6
+        assert db.session.query(WeightEntry).count() == created['entries']
+        assert db.session.query(ClientStats).count() == 6
+        assert db.session.query(db.func.max(WeightEntry.date)).scalar() <= date(2024, 6, 30)
+
+
+def test_the_same_seed_gives_the_same_histories():
+    first, second = random.Random(7), random.Random(7)
+    dates = entry_dates(first, 200, date(2024, 6, 30))
+    assert dates == entry_dates(second, 200, date(2024, 6, 30))
+    assert entry_weights(first, 50) == entry_weights(second, 50)
+    assert dates == sorted(set(dates)) and dates[-1] == date(2024, 6, 30)
+
+
+def test_summaries_use_nearest_rank_percentiles():
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50, 95, 99)
+    assert percentile([], 50) == 0.0
+    assert summarize([0.001, 0.002, 0.003]) == {'count': 3, 'p50': 2.0, 'p95': 3.0, 'p99': 3.0, 'max': 3.0}
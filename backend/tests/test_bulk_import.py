@@ -0,0 +1,74 @@
+from models import WeightEntry
+from conftest import BASE_URL
+
+
+def post_bulk(http, body, content_type, query=''):
+    return http.post(f'/api/weight/bulk{query}', data=body, content_type=content_type, base_url=BASE_URL)
+
+
+def test_csv_rows_are_imported_and_bad_rows_reported(app, client, make_client, login_as):
+    own = make_client(client.user_id)
+    other = make_client(login_as('other').user_id)
+    body = ('client_id,weight,date\n'
+            f'{own},70.5,2024-01-01\n'
+            f'{own},71,2024-01-02\n'
+            f'{own},heavy,2024-01-03\n'
+            f'{other},60,2024-01-01\n'
+            f'{own},72,01/04/2024\n')
+
+    result = post_bulk(client, body, 'text/csv').get_json()
+
+    assert result['inserted'] == 2
+    assert result['failed'] == 3
+    assert [(error['row'], error['error']) for error in result['errors']] == [
+        (4, 'Invalid weight'),
+        (5, 'Client not found or unauthorized'),
+        (6, 'Invalid date format. Use YYYY-MM-DD'),
+    ]
+    entries = client.get(f'/api/weight/client/{own}', base_url=BASE_URL).get_json()
+    assert [(entry['date'], entry['weight']) for entry in entries] == [('2024-01-01', 70.5), ('2024-01-02', 71.0)]
+
+
+def test_ndjson_skips_blank_lines_and_reports_invalid_json(client, make_client):
+    own = make_client(client.user_id)
+    body = f'{{"client_id": {own}, "weight": 80, "date": "2024-02-01"}}\n\nnot json\n{{"weight": 81}}\n'
+
+    result = post_bulk(client, body, 'application/x-ndjson').get_json()
+
+    assert result['inserted'] == 1
+    assert [(error['row'], error['error']) for error in result['errors']] == [
+        (3, 'Row is not a valid JSON object'),
+        (4, 'Weight and client_id are required'),
+    ]
+
+
+def test_rows_span_several_chunks(app, client, make_client):
+    app.config['BULK_IMPORT_CHUNK_SIZE'] = 3
+    own = make_client(client.user_id)
+    body = 'client_id,weight,date\n' + ''.join(f'{own},{70 + day},2024-03-{day:02d}\n' for day in range(1, 11))
+
+    result = post_bulk(client, body, 'text/csv').get_json()
+
+    assert result == {'inserted': 10, 'failed': 0, 'errors': [], 'errors_truncated': False,
+                      'message': 'Bulk import finished'}
+    with app.app_context():
+        assert WeightEntry.query.filter_by(client_id=own).count() == 10
+    summary = client.get(f'/api/weight/client/{own}/summary', base_url=BASE_URL).get_json()
+    assert summary['entry_count'] == 10
+    assert summary['current_weight'] == 80.0
+
+
+def test_format_can_be_forced_with_a_query_parameter(client, make_client):
+    own = make_client(client.user_id)
+    response = post_bulk(client, f'client_id,weight\n{own},70\n', 'text/plain', '?format=csv')
+    assert response.get_json()['inserted'] == 1
+
+
+def test_unsupported_format_is_rejected(client):
+    response = post_bulk(client, '<xml/>', 'application/xml')
+    assert response.status_code == 415
+
+
+def test_requires_login(anonymous):
+    response = post_bulk(anonymous, 'client_id,weight\n1,70\n', 'text/csv')
+    assert response.status_code == 401
@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+
+from conftest import BASE_URL
+
+
+def clients(http, **query):
+    return http.get('/api/clients', query_string=query, base_url=BASE_URL)
+
+
+def test_plain_list_keeps_its_shape(anonymous, make_client, test_user_id, login_as):
+    make_client(test_user_id, name='Ann')
+    make_client(test_user_id, name='Bob')
+    make_client(login_as('other').user_id, name='Not mine')
+
+    body = clients(anonymous).get_json()
+    assert isinstance(body, list)
+    assert sorted(client['name'] for client in body) == ['Ann', 'Bob']
+    assert set(body[0]) >= {'id', 'name', 'email', 'created_at', 'goal_weight', 'user_id'}
+
+
+def test_stats_are_computed_in_the_list_query(anonymous, make_client, add_entries, test_user_id):
+    today = date.today()
+    ann = make_client(test_user_id, name='Ann')
+    bob = make_client(test_user_id, name='Bob')
+    add_entries(ann, [(today - timedelta(days=60), 90), (today - timedelta(days=20), 85), (today, 82.5)])
+
+    body = clients(anonymous, include='stats').get_json()
+    assert body['total'] == 2 and body['page'] == 1
+    stats = {client['id']: client['stats'] for client in body['clients']}
+    assert stats[ann] == {'latest_weight': 82.5, 'latest_date': today.isoformat(), 'entry_count': 3, 'change_30d': -2.5}
+    assert stats[bob] == {'latest_weight': None, 'latest_date': None, 'entry_count': 0, 'change_30d': None}
+
+
+def test_stats_come_from_the_aggregates_not_the_whole_history(app, anonymous, make_client, add_entries,
+                                                              test_user_id):
+    from sqlalchemy import event
+    from models import db, ClientStats
+
+    today = date.today()
+    ann = make_client(test_user_id, name='Ann')
+    add_entries(ann, [(today - timedelta(days=400), 95), (today - timedelta(days=10), 84), (today, 83)])
+    with app.app_context():
+        # Aggregates are the only source of the latest weigh-in and count
+        db.session.get(ClientStats, ann).entry_count = 1234
+        db.session.commit()
+        engine = db.engines['read']
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, sql, *rest: statements.append(sql))
+    body = clients(anonymous, include='stats').get_json()
+    assert body['clients'][0]['stats'] == {'latest_weight': 83, 'latest_date': today.isoformat(), 'entry_count': 1234,
+                                           'change_30d': -1.0}
+    # weight_entry is read only inside the change window
+    listing = [sql for sql in statements if 'weight_entry' in sql]
+    assert len(listing) == 1 and 'weight_entry.date >=' in listing[0]
+
+
+def test_sorting_and_pages(anonymous, make_client, add_entries, test_user_id):
+    ids = {}
+    for name, weight in (('Cleo', 70), ('Ann', 90), ('Bob', 80), ('Dan', None)):
+        ids[name] = make_client(test_user_id, name=name)
+        if weight is not None:
+            add_entries(ids[name], [('2024-01-01', weight)])
+
+    by_name = clients(anonymous, sort='name', per_page=3).get_json()
+    assert [client['name'] for client in by_name['clients']] == ['Ann', 'Bob', 'Cleo']
+    assert by_name['total'] == 4
+    second = clients(anonymous, sort='name', per_page=3, page=2).get_json()
+    assert [client['name'] for client in second['clients']] == ['Dan']
+    beyond = clients(anonymous, sort='name', per_page=3, page=5).get_json()
+    assert beyond['clients'] == [] and beyond['total'] == 4
+
+    # Clients without entries sort last in either direction
+    heaviest = clients(anonymous, sort='latest_weight', order='desc').get_json()
+    assert [client['name'] for client in heaviest] == ['Ann', 'Bob', 'Cleo', 'Dan']
+    lightest = clients(anonymous, sort='latest_weight').get_json()
+    assert [client['name'] for client in lightest] == ['Cleo', 'Bob', 'Ann', 'Dan']
+
+
+def test_invalid_parameters_are_rejected(anonymous):
+    assert clients(anonymous, sort='password').status_code == 400
+    assert clients(anonymous, page='first').status_code == 400
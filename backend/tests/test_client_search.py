@@ -0,0 +1,99 @@
+import pytest
+
+import client_search
+
+from conftest import BASE_URL
+
+PEOPLE = (('John Smith', 'jsmith@gmail.com'), ('Johanna Doe', 'jd@x.org'), ('Mary Johnson', 'mary@johnson.net'),
+          ('Bob Stone', 'bob@stone.io'), ('Ann Li', 'ann.li@x.org'), ('100% Guy', 'pct@x.org'))
+
+
+@pytest.fixture
+def people(anonymous):
+    return {name: anonymous.post('/api/clients', json={'name': name, 'email': email}, base_url=BASE_URL)
+            .get_json()['client']['id'] for name, email in PEOPLE}
+
+
+def search(http, q, **query):
+    response = http.get('/api/clients/search', query_string=dict(query, q=q), base_url=BASE_URL)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def names(body):
+    return [client['name'] for client in body['clients']]
+
+
+def test_terms_match_anywhere_in_name_or_email(anonymous, people):
+    # Name prefix matches first, then the best ranked
+    assert names(search(anonymous, 'john')) == ['John Smith', 'Mary Johnson']
+    assert names(search(anonymous, 'JOHN   smi')) == ['John Smith']
+    assert names(search(anonymous, 'gmail')) == ['John Smith']
+    assert names(search(anonymous, '100%')) == ['100% Guy']
+    assert search(anonymous, 'zzzzz')['clients'] == []
+    # Query syntax is matched literally
+    assert search(anonymous, 'a"b OR c*')['clients'] == []
+
+
+def test_short_terms_match_word_prefixes(anonymous, people):
+    assert names(search(anonymous, 'jo')) == ['Johanna Doe', 'John Smith', 'Mary Johnson']
+    assert names(search(anonymous, 'li')) == ['Ann Li']
+
+
+def test_typos_fall_back_to_fuzzy_matches(anonymous, people):
+    body = search(anonymous, 'jhon smith')
+    assert names(body) == ['John Smith'] and body['fuzzy'] is True
+    assert names(search(anonymous, 'stoen')) == ['Bob Stone']
+
+
+def test_pages(anonymous, people):
+    first = search(anonymous, 'john', per_page=1)
+    second = search(anonymous, 'john', per_page=1, page=2)
+    assert names(first) == ['John Smith'] and first['has_more'] is True
+    assert names(second) == ['Mary Johnson'] and second['has_more'] is False
+    assert search(anonymous, 'john', per_page=1, page=3)['clients'] == []
+
+
+def test_the_index_follows_renames_and_deletes(app, anonymous, people):
+    import purge
+    from models import db, Client
+
+    anonymous.delete(f"/api/clients/{people['Bob Stone']}", base_url=BASE_URL)
+    assert search(anonymous, 'stone')['clients'] == []
+    with app.app_context():
+        purge.tombstone(db.session.get(Client, people['John Smith']))
+        db.session.get(Client, people['Johanna Doe']).name = 'Renamed Person'
+        db.session.commit()
+    assert names(search(anonymous, 'john')) == ['Mary Johnson']
+    assert search(anonymous, 'gmail')['clients'] == []
+    assert names(search(anonymous, 'renamed')) == ['Renamed Person']
+    assert search(anonymous, 'johanna')['clients'] == []
+
+
+def test_other_users_clients_are_not_found(anonymous, people, make_client, login_as):
+    make_client(login_as('other').user_id, name='John Other')
+    assert 'John Other' not in names(search(anonymous, 'john'))
+
+
+def test_scans_give_the_same_answers_without_an_index(app, anonymous, people):
+    from models import db
+
+    with app.app_context():
+        client_search._backends[db.engine] = 'like'
+    assert names(search(anonymous, 'john')) == ['John Smith', 'Mary Johnson']
+    assert names(search(anonymous, 'gmail')) == ['John Smith']
+    assert names(search(anonymous, 'jo')) == ['Johanna Doe', 'John Smith', 'Mary Johnson']
+
+
+def test_invalid_parameters_are_rejected(anonymous):
+    assert anonymous.get('/api/clients/search', base_url=BASE_URL).status_code == 400
+    assert anonymous.get('/api/clients/search?q=x&page=a', base_url=BASE_URL).status_code == 400
+
+
+def test_similarity_matches_pg_trgm():
+    assert client_search.trigrams('Jo') == {'  j', ' jo', 'jo '}
+    assert client_search.similarity('word', 'word') == 1.0
+    assert client_search.similarity('word', 'two words') == pytest.approx(4 / 11)
+    assert client_search.word_similarity('stoen', 'Bob Stone') >= client_search.SIMILARITY_THRESHOLD
+    assert client_search.word_similarity('zzzzz', 'Bob Stone') == 0.0
+    assert client_search.normalize('  JOHN \t Smi ') == 'john smi'
@@ -0,0 +1,96 @@
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from conftest import BASE_URL
+
+COUNTERS = ('entry_count', 'weight_sum', 'first_date', 'first_weight', 'last_date', 'last_weight',
+            'min_weight', 'max_weight', 'window_7_sum', 'window_7_count', 'window_30_sum', 'window_30_count')
+
+
+def snapshot(stats):
+    return {name: round(value, 6) if isinstance(value, float) else value
+            for name, value in ((name, getattr(stats, name)) for name in COUNTERS)}
+
+
+def test_summary_of_a_client_without_a_stats_row_does_not_write(app, client, make_client, add_entries):
+    from models import db, ClientStats
+
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 80), ('2024-01-10', 78), ('2024-01-20', 76)])
+    with app.app_context():
+        db.session.query(ClientStats).filter_by(client_id=own).delete()
+        db.session.commit()
+
+    summary = client.get(f'/api/weight/client/{own}/summary', base_url=BASE_URL).get_json()
+    assert summary['entry_count'] == 3
+    assert summary['starting_weight'] == 80 and summary['current_weight'] == 76
+    assert summary['total_change'] == -4
+    assert summary['average_7d'] == 76 and summary['average_30d'] == 78
+    with app.app_context():
+        assert db.session.get(ClientStats, own) is None
+
+
+def test_apply_change_matches_a_rebuild(app, make_client, test_user_id):
+    from models import db, ClientStats, WeightEntry
+    from client_stats import apply_change, rebuild_client, _build, _rows_query
+
+    own = make_client(test_user_id)
+    rng = random.Random(4)
+    base = date(2024, 1, 1)
+    with app.app_context():
+        rebuild_client(own)
+        for step in range(400):
+            entries = WeightEntry.query.filter_by(client_id=own).all()
+            op = rng.random()
+            if op < 0.6 or not entries:
+                last = max((entry.date for entry in entries), default=base)
+                day = rng.choice([base + timedelta(days=rng.randint(0, 90)), last + timedelta(days=rng.randint(0, 3))])
+                entry = WeightEntry(client_id=own, date=day, weight=round(rng.uniform(60, 90), 1))
+                db.session.add(entry)
+                db.session.flush()
+                apply_change(own, added=(entry.date, entry.weight))
+            elif op < 0.8:
+                entry = rng.choice(entries)
+                previous = (entry.date, entry.weight)
+                db.session.delete(entry)
+                db.session.flush()
+                apply_change(own, removed=previous)
+            else:
+                entry = rng.choice(entries)
+                previous = (entry.date, entry.weight)
+                entry.weight = round(rng.uniform(60, 90), 1)
+                if rng.random() < 0.5:
+                    entry.date = base + timedelta(days=rng.randint(0, 95))
+                db.session.flush()
+                apply_change(own, removed=previous, added=(entry.date, entry.weight))
+            db.session.flush()
+
+            built = list(_build(_rows_query().filter(WeightEntry.client_id == own)))
+            if built:
+                assert snapshot(db.session.get(ClientStats, own)) == snapshot(built[0]), step
+            else:
+                assert db.session.get(ClientStats, own).entry_count == 0, step
+        db.session.rollback()
+
+
+def test_an_insert_inside_the_range_needs_no_select(app, make_client, add_entries, test_user_id):
+    from models import db, ClientStats, WeightEntry
+    from client_stats import apply_change
+
+    own = make_client(test_user_id)
+    add_entries(own, [('2024-01-01', 80), ('2024-01-15', 75), ('2024-02-01', 70)])
+    with app.app_context():
+        entry = WeightEntry(client_id=own, date=date(2024, 1, 20), weight=74)
+        db.session.add(entry)
+        db.session.flush()
+        stats = db.session.get(ClientStats, own)  # held, or the identity map lets it go
+
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda conn, cursor, sql, *rest: statements.append(sql))
+        apply_change(own, added=(entry.date, entry.weight))
+        db.session.flush()
+        assert not [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+        assert len(statements) == 1 and stats.entry_count == 4
+        db.session.rollback()
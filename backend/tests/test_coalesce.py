@@ -0,0 +1,195 @@
+import threading
+import time
+
+from flask import Response
+
+import coalesce
+import series_cache
+from coalesce import SingleFlight
+
+from conftest import BASE_URL, make_http, register
+
+READERS = 4
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def run_together(flights, key, compute, callers, timeout=5):
+    """Run `callers` calls of the same key, the first one held until the others are waiting on it"""
+    results = [None] * callers
+    release = threading.Event()
+
+    def leader_compute():
+        release.wait(5)
+        return compute()
+
+    def call(i, fn):
+        results[i] = flights.run(key, fn, timeout)
+
+    threads = [threading.Thread(target=call, args=(0, leader_compute))]
+    threads[0].start()
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+    threads += [threading.Thread(target=call, args=(i, compute)) for i in range(1, callers)]
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flights.stats()['followers'] == callers - 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_waiting_callers_share_the_first_callers_result():
+    flights = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'response', 'copy'
+
+    assert run_together(flights, ('user', '/a'), compute, 4) == ['response', 'copy', 'copy', 'copy']
+    assert len(calls) == 1
+    assert flights.stats() == {'in_flight': 0, 'leaders': 1, 'followers': 3, 'fallbacks': 0, 'invalidated': 0}
+
+
+def test_waiting_callers_compute_themselves_without_a_shareable_result():
+    flights = SingleFlight()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'response', None
+
+    assert run_together(flights, ('user', '/a'), compute, 3) == ['response'] * 3
+    assert len(calls) == 3 and flights.stats()['fallbacks'] == 2
+
+
+def test_waiting_callers_give_up_after_the_timeout():
+    flights = SingleFlight()
+    release = threading.Event()
+    thread = threading.Thread(target=flights.run, args=('key', lambda: (release.wait(5), 'copy'), 5))
+    thread.start()
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+    assert flights.run('key', lambda: ('own', None), 0.01) == 'own'
+    release.set()
+    thread.join()
+    assert flights.stats()['fallbacks'] == 1
+
+
+def test_invalidating_an_owner_starts_their_next_request_afresh():
+    flights = SingleFlight()
+    release = threading.Event()
+    thread = threading.Thread(target=flights.run, args=((1, '/a'), lambda: (release.wait(5), 'copy'), 5))
+    thread.start()
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+
+    flights.invalidate(2)
+    assert flights.stats()['in_flight'] == 1
+    flights.invalidate(1)
+    assert flights.stats()['in_flight'] == 0 and flights.stats()['invalidated'] == 1
+    assert flights.run((1, '/a'), lambda: ('fresh', 'copy'), 5) == 'fresh'
+    release.set()
+    thread.join()
+    assert flights.stats()['leaders'] == 2
+
+
+def test_committed_version_bumps_invalidate_the_users_keys(app):
+    from models import db
+    from versions import bump
+
+    flights = coalesce.flights
+    release = threading.Event()
+    thread = threading.Thread(target=flights.run, args=((7, '/a'), lambda: (release.wait(5), 'copy'), 5))
+    thread.start()
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+
+    with app.app_context():
+        bump('user', 7)
+        db.session.rollback()
+        assert flights.stats()['in_flight'] == 1
+        bump('user', 7)
+        db.session.commit()
+    assert flights.stats()['in_flight'] == 0
+    release.set()
+    thread.join()
+
+
+def test_only_complete_responses_are_shared(app):
+    with app.test_request_context():
+        body, status, headers = coalesce._copy(Response('{}', status=201, mimetype='application/json'))
+        assert (body, status) == (b'{}', '201 CREATED') and ('Content-Type', 'application/json') in headers
+        assert coalesce._copy(Response('boom', status=500)) is None
+        assert coalesce._copy(Response(iter([b'a', b'b']))) is None
+
+
+def test_identical_concurrent_reads_run_the_view_once(app, client, make_client, add_entries, monkeypatch):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-02', 71)])
+    readers = [make_http(app) for _ in range(READERS)]
+    for http in readers:
+        register(http, 'coach')
+        # The first request after logging in loads the user in a write transaction, which would queue
+        # the readers behind the held one before they reach the view
+        http.get(f'/api/weight/client/{own}/summary', base_url=BASE_URL)
+
+    loads = []
+    real = series_cache.get_series
+    before = coalesce.stats()
+
+    def held_get_series(*args):
+        # Keep the first request running until the others are waiting on it
+        loads.append(args)
+        wait_for(lambda: coalesce.stats()['followers'] == before['followers'] + READERS - 1)
+        return real(*args)
+
+    monkeypatch.setattr(series_cache, 'get_series', held_get_series)
+    responses = [None] * READERS
+
+    def read(i):
+        # The same query in a different parameter order is the same request
+        query = '?from=2024-01-01&to=2024-02-01' if i % 2 else '?to=2024-02-01&from=2024-01-01'
+        responses[i] = readers[i].get(f'/api/weight/client/{own}{query}', base_url=BASE_URL)
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(READERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.get_data() for response in responses}) == 1
+    assert len({response.headers['ETag'] for response in responses}) == 1
+    after = coalesce.stats()
+    assert after['leaders'] - before['leaders'] == 1 and after['fallbacks'] == before['fallbacks']
+
+
+def test_reads_run_alone_when_coalescing_is_off(app, client, make_client):
+    own = make_client(client.user_id)
+    app.config['COALESCE_READS'] = False
+    assert client.get(f'/api/weight/client/{own}', base_url=BASE_URL).status_code == 200
+    assert coalesce.stats()['leaders'] == 0
+    app.config['COALESCE_READS'] = True
+    assert client.get(f'/api/weight/client/{own}', base_url=BASE_URL).status_code == 200
+    assert coalesce.stats()['leaders'] == 1
+
+
+def test_writes_through_the_api_invalidate_pending_reads(client, make_client):
+    own = make_client(client.user_id)
+    flights = coalesce.flights
+    release = threading.Event()
+    thread = threading.Thread(target=flights.run,
+                              args=((client.user_id, '/api/weight/client'), lambda: (release.wait(5), 'copy'), 5))
+    thread.start()
+    wait_for(lambda: flights.stats()['in_flight'] == 1)
+
+    created = client.post('/api/weight', json={'client_id': own, 'weight': 70, 'date': '2024-01-01'}, base_url=BASE_URL)
+    assert created.status_code == 201
+    assert flights.stats()['in_flight'] == 0 and flights.stats()['invalidated'] == 1
+    release.set()
+    thread.join()
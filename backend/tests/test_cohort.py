@@ -0,0 +1,66 @@
+from datetime import date, timedelta
+
+from conftest import BASE_URL
+
+
+def days_ago(days):
+    return date.today() - timedelta(days=days)
+
+
+def cohort(http, **query):
+    return http.get('/api/clients/cohort', query_string=query, base_url=BASE_URL)
+
+
+def test_movers_bands_and_inactive_clients(anonymous, make_client, add_entries, test_user_id):
+    ids = {name: make_client(test_user_id, name=name) for name in ('Gain', 'LossA', 'LossB', 'Single', 'Silent', 'Lapsed')}
+    add_entries(ids['Gain'], [(days_ago(14), 60.2 + 0.1), (days_ago(7), 61.5), (days_ago(0), 63.3)])
+    # Same change: both share rank 1
+    add_entries(ids['LossA'], [(days_ago(14), 80.0), (days_ago(0), 78.0)])
+    add_entries(ids['LossB'], [(days_ago(21), 90.0), (days_ago(0), 88.0)])
+    add_entries(ids['Single'], [(days_ago(1), 60.0)])
+    add_entries(ids['Lapsed'], [(days_ago(60), 65.0), (days_ago(20), 64.0)])
+
+    body = cohort(anonymous).get_json()
+    assert body['since'] == days_ago(29).isoformat()
+
+    gain, = body['gainers']
+    assert (gain['rank'], gain['client_id'], gain['entries']) == (1, ids['Gain'], 3)
+    # Rounded like the other figures, even when the stored floats are not exact
+    assert (gain['first_weight'], gain['last_weight'], gain['change']) == (60.3, 63.3, 3.0)
+    assert gain['weekly_rate'] == 1.5
+    assert [(loser['rank'], loser['name']) for loser in body['losers']] == [(1, 'LossA'), (1, 'LossB')]
+
+    bands = body['weekly_rate_bands']
+    # Lapsed has a single weigh-in in the window, Single has one at all
+    assert bands['clients'] == 3
+    assert bands['min'] == -1.0 and bands['max'] == 1.5 and bands['p50'] == round(-2 * 7 / 21, 3)
+
+    inactive = {row['name']: row for row in body['inactive']}
+    assert set(inactive) == {'Silent', 'Lapsed'} and body['inactive_total'] == 2
+    assert body['inactive'][0]['name'] == 'Silent' and inactive['Silent']['days_since'] is None
+    assert inactive['Lapsed']['days_since'] == 20 and inactive['Lapsed']['last_date'] == days_ago(20).isoformat()
+
+
+def test_limit_and_window(anonymous, make_client, add_entries, test_user_id):
+    for step in range(5):
+        own = make_client(test_user_id, name=f'C{step}')
+        add_entries(own, [(days_ago(10), 70), (days_ago(0), 70 - step - 1)])
+    old = make_client(test_user_id, name='Old')
+    add_entries(old, [(days_ago(300), 100), (days_ago(200), 50)])
+
+    body = cohort(anonymous, limit=2).get_json()
+    assert [loser['name'] for loser in body['losers']] == ['C4', 'C3']
+    assert body['gainers'] == []
+    year = cohort(anonymous, days=365, limit=1).get_json()
+    assert [loser['name'] for loser in year['losers']] == ['Old']
+
+
+def test_empty_cohort(anonymous):
+    body = cohort(anonymous).get_json()
+    assert body['gainers'] == [] and body['losers'] == [] and body['inactive'] == []
+    assert body['weekly_rate_bands']['clients'] == 0 and body['weekly_rate_bands']['p50'] is None
+
+
+def test_invalid_parameters_are_rejected(anonymous):
+    for query in ({'days': 0}, {'inactive_days': 'x'}, {'limit': 101}):
+        assert cohort(anonymous, **query).status_code == 400
@@ -0,0 +1,54 @@
+from conftest import BASE_URL
+
+
+def test_unchanged_history_answers_304(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70)])
+    url = f'/api/weight/client/{own}'
+
+    first = client.get(url, base_url=BASE_URL)
+    etag = first.headers['ETag']
+    assert etag.startswith('W/') and first.headers['Cache-Control'] == 'private, no-cache'
+    assert first.headers['Last-Modified']
+
+    cached = client.get(url, headers={'If-None-Match': etag}, base_url=BASE_URL)
+    assert cached.status_code == 304 and cached.get_data() == b''
+    assert cached.headers['ETag'] == etag
+    since = client.get(url, headers={'If-Modified-Since': first.headers['Last-Modified']}, base_url=BASE_URL)
+    assert since.status_code == 304
+
+
+def test_a_write_changes_the_etag(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70)])
+    url = f'/api/weight/client/{own}/summary'
+    etag = client.get(url, base_url=BASE_URL).headers['ETag']
+
+    assert client.post('/api/weight', json={'client_id': own, 'weight': 69, 'date': '2024-01-02'},
+                       base_url=BASE_URL).status_code == 201
+    fresh = client.get(url, headers={'If-None-Match': etag}, base_url=BASE_URL)
+    assert fresh.status_code == 200
+    assert fresh.headers['ETag'] != etag and fresh.get_json()['current_weight'] == 69
+
+
+def test_query_parameters_are_part_of_the_etag(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-02-01', 71)])
+    url = f'/api/weight/client/{own}'
+
+    january = client.get(url, query_string={'from': '2024-01-01', 'to': '2024-01-31'}, base_url=BASE_URL).headers['ETag']
+    reordered = client.get(f'{url}?to=2024-01-31&from=2024-01-01', base_url=BASE_URL).headers['ETag']
+    everything = client.get(url, base_url=BASE_URL).headers['ETag']
+    assert january == reordered
+    assert january != everything
+    other_range = client.get(url, query_string={'from': '2024-02-01'}, headers={'If-None-Match': january}, base_url=BASE_URL)
+    assert other_range.status_code == 200
+
+
+def test_client_list_etag_follows_the_user_counter(anonymous):
+    etag = anonymous.get('/api/clients', base_url=BASE_URL).headers['ETag']
+    assert anonymous.get('/api/clients', headers={'If-None-Match': etag}, base_url=BASE_URL).status_code == 304
+
+    created = anonymous.post('/api/clients', json={'name': 'New', 'email': 'new@example.com'}, base_url=BASE_URL)
+    assert created.status_code == 201
+    assert anonymous.get('/api/clients', headers={'If-None-Match': etag}, base_url=BASE_URL).status_code == 200
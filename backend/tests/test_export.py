@@ -0,0 +1,77 @@
+import csv
+import gzip
+import io
+import json
+
+from conftest import BASE_URL
+
+
+def export(http, **query):
+    return http.get('/api/export', query_string=query, base_url=BASE_URL)
+
+
+def test_csv_export_lists_every_entry_and_empty_clients(client, make_client, add_entries, login_as):
+    busy = make_client(client.user_id, name='Busy, B.')
+    idle = make_client(client.user_id, name='Idle')
+    add_entries(busy, [('2024-01-02', 71), ('2024-01-01', 70.5)])
+    make_client(login_as('other').user_id, name='Not mine')
+
+    response = export(client)
+    assert response.mimetype == 'text/csv'
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Content-Disposition'].endswith('.csv"')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ['client_id', 'client_name', 'client_email', 'entry_id', 'date', 'weight']
+    assert [(row[1], row[4], row[5]) for row in rows[1:]] == [
+        ('Busy, B.', '2024-01-01', '70.5'), ('Busy, B.', '2024-01-02', '71.0'), ('Idle', '', '')]
+    assert [int(row[0]) for row in rows[1:]] == [busy, busy, idle]
+
+
+def test_gzip_export_is_a_gz_file_not_an_encoding(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70)])
+
+    response = export(client, format='ndjson', gzip=1)
+    assert response.mimetype == 'application/gzip'
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Content-Disposition'].endswith('.ndjson.gz"')
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert len(lines) == 1
+    row = json.loads(lines[0])
+    assert (row['client_id'], row['client_name'], row['date'], row['weight']) == (own, 'Client', '2024-01-01', 70.0)
+
+
+def test_large_exports_are_streamed_in_chunks(app, test_user_id, make_client, add_entries):
+    import export as export_module
+
+    own = make_client(test_user_id)
+    add_entries(own, [(f'2024-01-{day:02d}', 70) for day in range(1, 29)])
+    with app.app_context():
+        chunks = list(export_module.generate_export(test_user_id, 'csv'))
+    assert len(chunks) == 1
+    # A smaller chunk size splits the same rows without changing the bytes
+    export_module.CHUNK_SIZE, original = 100, export_module.CHUNK_SIZE
+    try:
+        with app.app_context():
+            small = list(export_module.generate_export(test_user_id, 'csv'))
+    finally:
+        export_module.CHUNK_SIZE = original
+    assert len(small) > 5 and b''.join(small) == chunks[0]
+
+
+def test_errors(client, anonymous):
+    assert export(client, format='xml').status_code == 400
+    assert export(anonymous).status_code == 401
+
+
+def test_cli_writes_a_gzip_file(app, client, make_client, add_entries, tmp_path):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70)])
+    output = tmp_path / 'out.csv.gz'
+
+    result = app.test_cli_runner().invoke(args=['export-data', '--username', 'coach', '--gzip', '--output', str(output)])
+    assert result.exit_code == 0, result.output
+    assert gzip.decompress(output.read_bytes()).decode().count('\n') == 2
+
+    missing = app.test_cli_runner().invoke(args=['export-data', '--username', 'nobody'])
+    assert missing.exit_code != 0 and 'No user named nobody' in missing.output
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import BASE_URL
+
+
+def post(http, body, key=None):
+    headers = {'Idempotency-Key': key} if key else {}
+    return http.post('/api/weight', json=body, headers=headers, base_url=BASE_URL)
+
+
+def entry_count(app, client_id):
+    from models import db, WeightEntry
+
+    with app.app_context():
+        return db.session.query(WeightEntry).filter_by(client_id=client_id).count()
+
+
+def test_a_retry_replays_the_first_response(app, client, make_client):
+    own = make_client(client.user_id)
+    body = {'client_id': own, 'weight': 70, 'date': '2024-01-01'}
+
+    first = post(client, body, key='scale-1')
+    retry = post(client, body, key='scale-1')
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true' and 'Idempotent-Replayed' not in first.headers
+    assert entry_count(app, own) == 1
+
+    # Without a key every request writes
+    post(client, body)
+    post(client, body)
+    assert entry_count(app, own) == 3
+
+
+def test_reusing_a_key_for_another_request_is_rejected(app, client, make_client):
+    own = make_client(client.user_id)
+    post(client, {'client_id': own, 'weight': 70, 'date': '2024-01-01'}, key='k')
+    response = post(client, {'client_id': own, 'weight': 71, 'date': '2024-01-01'}, key='k')
+    assert response.status_code == 422
+    assert entry_count(app, own) == 1
+    assert post(client, {'client_id': own, 'weight': 70}, key='x' * 256).status_code == 400
+
+
+def test_a_retry_while_the_first_attempt_runs_gets_409(app, client, make_client):
+    import idempotency
+    from models import db, IdempotencyKey
+
+    own = make_client(client.user_id)
+    body = {'client_id': own, 'weight': 70, 'date': '2024-01-01'}
+    # Reserve the key as the first attempt would before its view has finished
+    with app.test_request_context('/api/weight', method='POST', json=body):
+        fingerprint = idempotency._fingerprint()
+    with app.app_context():
+        db.session.add(IdempotencyKey(user_id=client.user_id, key='busy', fingerprint=fingerprint))
+        db.session.commit()
+
+    assert post(client, body, key='busy').status_code == 409
+    assert entry_count(app, own) == 0
+
+
+def test_keys_are_per_user_and_expire(app, client, make_client, login_as):
+    from models import db, IdempotencyKey
+
+    own = make_client(client.user_id)
+    other = login_as('other')
+    theirs = make_client(other.user_id)
+    post(client, {'client_id': own, 'weight': 70, 'date': '2024-01-01'}, key='same')
+    assert post(other, {'client_id': theirs, 'weight': 70, 'date': '2024-01-01'}, key='same').status_code == 201
+    assert entry_count(app, theirs) == 1
+
+    with app.app_context():
+        db.session.query(IdempotencyKey).update({'created_at': datetime.utcnow() - timedelta(days=2)})
+        db.session.commit()
+    retry = post(client, {'client_id': own, 'weight': 70, 'date': '2024-01-01'}, key='same')
+    assert retry.status_code == 201 and 'Idempotent-Replayed' not in retry.headers
+    assert entry_count(app, own) == 2
+
+
+@pytest.mark.parametrize('lost_races, status, written', [(1, 201, 1), (3, 409, 0)])
+def test_a_reservation_whose_rival_vanished_is_retried(app, client, make_client, monkeypatch,
+                                                       lost_races, status, written):
+    from sqlalchemy.exc import IntegrityError
+    from models import db
+
+    own = make_client(client.user_id)
+    commit = db.session.commit
+    races = iter(range(lost_races))
+
+    def contested_commit():
+        # Another attempt inserted the key first, and its row was swept before this one looked
+        if next(races, None) is not None:
+            raise IntegrityError('INSERT INTO idempotency_key', {}, Exception('UNIQUE constraint failed'))
+        commit()
+
+    monkeypatch.setattr(db.session, 'commit', contested_commit)
+    body = {'client_id': own, 'weight': 70, 'date': '2024-01-01'}
+    response = post(client, body, key='raced')
+    assert response.status_code == status
+    assert entry_count(app, own) == written
+    if status == 201:
+        # The key was reserved after all, so a retry is still answered once
+        assert post(client, body, key='raced').headers['Idempotent-Replayed'] == 'true'
+        assert entry_count(app, own) == 1
+
+
+def test_server_errors_are_not_stored(app, client, make_client, monkeypatch):
+    import routes.weight
+
+    own = make_client(client.user_id)
+    body = {'client_id': own, 'weight': 70, 'date': '2024-01-01'}
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(routes.weight, 'apply_change', fail)
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    assert post(client, body, key='retry-me').status_code == 500
+    monkeypatch.undo()
+    assert post(client, body, key='retry-me').status_code == 201
+    assert entry_count(app, own) == 1
+
+
+@pytest.fixture
+def one_per_day(app):
+    result = app.test_cli_runner().invoke(args=['dedup-weight-entries', '--unique-index'])
+    assert result.exit_code == 0, result.output
+    app.config['ONE_ENTRY_PER_DAY'] = True
+
+
+def test_one_entry_per_day_replaces_the_days_weight(app, client, make_client, one_per_day):
+    own = make_client(client.user_id)
+    first = post(client, {'client_id': own, 'weight': 70, 'date': '2024-01-01'})
+    second = post(client, {'client_id': own, 'weight': 69.5, 'date': '2024-01-01'})
+    assert first.status_code == 201 and second.status_code == 200
+    assert second.get_json()['entry']['id'] == first.get_json()['entry']['id']
+
+    summary = client.get(f'/api/weight/client/{own}/summary', base_url=BASE_URL).get_json()
+    assert summary['entry_count'] == 1 and summary['current_weight'] == 69.5 and summary['max_weight'] == 69.5
+
+    bulk = client.post('/api/weight/bulk', base_url=BASE_URL, content_type='text/csv',
+                       data=f'client_id,weight,date\n{own},69,2024-01-01\n{own},68,2024-01-01\n{own},67,2024-01-02\n')
+    assert bulk.status_code == 200, bulk.get_json()
+    entries = client.get(f'/api/weight/client/{own}', base_url=BASE_URL).get_json()
+    assert [(entry['date'], entry['weight']) for entry in entries] == [('2024-01-01', 68), ('2024-01-02', 67)]
+
+
+def test_dedup_command_keeps_the_latest_entry(app, client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-01', 71), ('2024-01-02', 72)])
+    runner = app.test_cli_runner()
+
+    dry = runner.invoke(args=['dedup-weight-entries', '--dry-run'])
+    assert '1 duplicate entries across 1 clients' in dry.output
+    assert entry_count(app, own) == 3
+
+    result = runner.invoke(args=['dedup-weight-entries', '--unique-index'])
+    assert 'Removed 1 entries' in result.output and 'Created unique index' in result.output
+    summary = client.get(f'/api/weight/client/{own}/summary', base_url=BASE_URL).get_json()
+    assert summary['entry_count'] == 2 and summary['starting_weight'] == 71
@@ -0,0 +1,111 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+from conftest import BASE_URL
+
+
+@pytest.fixture
+def statements(app):
+    from models import db
+
+    seen = []
+    with app.app_context():
+        engine = db.engine
+
+    def record(conn, cursor, sql, *rest):
+        seen.append(sql)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    yield seen
+    event.remove(engine, 'before_cursor_execute', record)
+
+
+def test_repeat_reads_skip_the_user_and_owner_lookups(client, make_client, statements):
+    own = make_client(client.user_id)
+    client.get(f'/api/weight/client/{own}', base_url=BASE_URL)
+
+    statements.clear()
+    response = client.get(f'/api/weight/client/{own}', base_url=BASE_URL)
+    assert response.status_code == 200
+    assert not [sql for sql in statements if 'FROM user' in sql or 'FROM client\n' in sql]
+
+
+def test_ttl_cache_evicts_and_expires(monkeypatch):
+    import identity_cache
+
+    cache = identity_cache.TTLCache('test', maxsize=2, ttl=10)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    assert cache.get(1) == 'a'
+    cache.set(3, 'c')
+    assert cache.get(2) is None and cache.get(1) == 'a'
+
+    now = identity_cache.time.monotonic()
+    monkeypatch.setattr(identity_cache.time, 'monotonic', lambda: now + 11)
+    assert cache.get(1) is None
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['hits'] == 2 and stats['misses'] == 2
+
+
+def test_repeat_writes_skip_the_owner_lookup(client, make_client, statements):
+    own = make_client(client.user_id)
+    client.post('/api/weight', json={'client_id': own, 'weight': 70, 'date': '2024-01-01'}, base_url=BASE_URL)
+
+    statements.clear()
+    response = client.post('/api/weight', json={'client_id': own, 'weight': 71, 'date': '2024-01-02'}, base_url=BASE_URL)
+    assert response.status_code == 201
+    assert response.get_json()['entry'] == {'id': response.get_json()['entry']['id'], 'weight': 71.0,
+                                            'date': '2024-01-02', 'client_id': own}
+    assert not [sql for sql in statements if sql.startswith('SELECT') and re.search(r'FROM (user|client)\b', sql)]
+
+
+@pytest.mark.parametrize('one_entry_per_day', [False, True])
+def test_writes_recheck_a_client_deleted_behind_the_cache(app, client, make_client, add_entries, one_entry_per_day):
+    import identity_cache
+    import purge
+    from models import db, Client, WeightEntry
+
+    if one_entry_per_day:
+        app.test_cli_runner().invoke(args=['dedup-weight-entries', '--unique-index'])
+        app.config['ONE_ENTRY_PER_DAY'] = True
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70)])
+    entry_id = client.get(f'/api/weight/client/{own}', base_url=BASE_URL).get_json()[0]['id']
+    assert identity_cache.owner_cache.get(own) == client.user_id
+
+    # Another worker deletes the client; this worker's cache still has the owner
+    with app.app_context():
+        purge.tombstone(db.session.get(Client, own))
+        db.session.commit()
+
+    response = client.post('/api/weight', json={'client_id': own, 'weight': 71, 'date': '2024-01-02'}, base_url=BASE_URL)
+    assert response.status_code == 404
+    assert identity_cache.owner_cache.get(own) is None
+    identity_cache.owner_cache.set(own, client.user_id)
+    assert client.put(f'/api/weight/{entry_id}', json={'weight': 72}, base_url=BASE_URL).status_code == 404
+    assert client.delete(f'/api/weight/{entry_id}', base_url=BASE_URL).status_code == 404
+    with app.app_context():
+        assert [entry.weight for entry in WeightEntry.query.filter_by(client_id=own)] == [70]
+
+
+def test_a_reused_client_id_is_not_writable_by_its_old_owner(app, client, login_as, make_client):
+    import identity_cache
+    import purge
+    from models import db
+
+    own = make_client(client.user_id)
+    client.get(f'/api/weight/client/{own}', base_url=BASE_URL)
+
+    # Another worker purges the client and SQLite hands its id to someone else's new client
+    with app.app_context():
+        purge.delete_client_rows(own)
+        db.session.commit()
+    assert make_client(login_as('other').user_id) == own
+    identity_cache.owner_cache.set(own, client.user_id)
+
+    response = client.post('/api/weight', json={'client_id': own, 'weight': 71, 'date': '2024-01-02'}, base_url=BASE_URL)
+    assert response.status_code == 404
+    with app.app_context():
+        assert db.session.execute(db.text('SELECT count(*) FROM weight_entry')).scalar() == 0
@@ -0,0 +1,79 @@
+import copy
+import logging
+import re
+import time
+
+import pytest
+from flask import g
+from sqlalchemy.exc import OperationalError
+
+from conftest import BASE_URL
+
+
+def metric(text, name, **labels):
+    """Value of one sample in a /metrics page, or 0 if it isn't there yet"""
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf'^{re.escape(name)}{{{re.escape(label_text)}}} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0
+
+
+def test_requests_are_timed_and_counted(client, make_client):
+    own = make_client(client.user_id)
+    rule = '/api/weight/client/<int:client_id>'
+    labels = {'endpoint': rule, 'method': 'GET', 'status': '200'}
+    before = client.get('/metrics', base_url=BASE_URL).get_data(as_text=True)
+
+    response = client.get(f'/api/weight/client/{own}', base_url=BASE_URL)
+    assert re.fullmatch(r'app;dur=\d+\.\d, db;dur=\d+\.\d', response.headers['Server-Timing'])
+
+    page = client.get('/metrics', base_url=BASE_URL)
+    assert page.mimetype == 'text/plain'
+    after = page.get_data(as_text=True)
+    for name in ('http_request_duration_seconds_count', 'http_request_sql_statements_count', 'http_response_size_bytes_count'):
+        assert metric(after, name, **labels) == metric(before, name, **labels) + 1
+    assert metric(after, 'http_request_sql_statements_sum', **labels) > metric(before, 'http_request_sql_statements_sum', **labels)
+    assert 'identity_cache_requests_total{cache="users",result="hit"}' in after
+    assert 'write_behind_queued 0' in after
+
+
+def test_a_failing_statement_leaves_nothing_behind(app):
+    from models import db
+
+    with app.test_request_context('/'):
+        app.preprocess_request()
+        connection = db.session.connection()
+        info = copy.deepcopy(dict(connection.info))
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql('SELECT * FROM no_such_table')
+        # Nothing accumulates on the pooled connection for statements that raised
+        assert dict(connection.info) == info
+
+        time.sleep(0.05)
+        count, sql_time = g.sql_count, g.sql_time
+        connection.exec_driver_sql('SELECT 1')
+        assert g.sql_count == count + 1
+        assert g.sql_time - sql_time < 0.05
+        db.session.rollback()
+
+
+def test_slow_requests_are_logged_with_their_sql(app, client, make_client, caplog):
+    own = make_client(client.user_id)
+    app.config['SLOW_REQUEST_MS'] = 0.0001
+    with caplog.at_level(logging.WARNING, logger=app.logger.name):
+        client.get(f'/api/weight/client/{own}', base_url=BASE_URL)
+    message = next(record.getMessage() for record in caplog.records if 'Slow request' in record.getMessage())
+    assert f'GET /api/weight/client/{own}' in message and 'SELECT' in message
+
+
+def test_histogram_buckets_are_cumulative():
+    from instrumentation import Histogram
+
+    histogram = Histogram('test_seconds', 'Test', ('endpoint',), (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(('x',), value)
+    lines = histogram.render()
+    assert 'test_seconds_bucket{endpoint="x",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{endpoint="x",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{endpoint="x",le="+Inf"} 4' in lines
+    assert 'test_seconds_sum{endpoint="x"} 6.050000' in lines
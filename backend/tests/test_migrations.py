@@ -0,0 +1,92 @@
+import pytest
+from sqlalchemy import create_engine, create_mock_engine, inspect, text
+
+import migrations
+
+
+def quiet(message):
+    pass
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine('sqlite:///' + str(tmp_path / 'schema.db'))
+    yield engine
+    engine.dispose()
+
+
+def test_upgrade_applies_each_step_once(engine):
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    assert migrations.current_version(engine) is None
+
+    assert migrations.upgrade(engine, echo=quiet) == versions
+    assert migrations.current_version(engine) == migrations.latest_version()
+    assert migrations.upgrade(engine, echo=quiet) == []
+
+
+def test_steps_can_be_re_run_on_a_migrated_database(engine):
+    migrations.upgrade(engine, echo=quiet)
+    for version, name, step in migrations.MIGRATIONS:
+        with engine.begin() as conn:
+            step(conn)
+
+
+def test_upgrade_stops_at_the_target(engine):
+    assert migrations.upgrade(engine, target=3, echo=quiet) == [1, 2, 3]
+    assert migrations.current_version(engine) == 3
+    assert 'client_stats' not in inspect(engine).get_table_names()
+    assert migrations.upgrade(engine, echo=quiet)[0] == 4
+
+
+def test_a_hand_made_legacy_database_is_brought_up_to_date(engine):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(64) NOT NULL UNIQUE, '
+                          'email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(128), created_at DATETIME)'))
+        conn.execute(text('CREATE TABLE client (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, '
+                          'email VARCHAR(120) NOT NULL UNIQUE, created_at DATETIME)'))
+        conn.execute(text('CREATE TABLE weight_entry (id INTEGER PRIMARY KEY, weight FLOAT NOT NULL, '
+                          'date DATE NOT NULL, client_id INTEGER NOT NULL REFERENCES client(id))'))
+        conn.execute(text("INSERT INTO client (name, email) VALUES ('Old', 'old@example.com')"))
+
+    migrations.upgrade(engine, echo=quiet)
+    columns = {column['name'] for column in inspect(engine).get_columns('client')}
+    assert {'user_id', 'goal_weight', 'deleted_at'} <= columns
+    assert 'ix_weight_entry_client_id_date' in {index['name'] for index in inspect(engine).get_indexes('weight_entry')}
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT name FROM client')).scalar() == 'Old'
+
+
+def test_added_columns_use_postgres_types(monkeypatch):
+    statements = []
+    conn = create_mock_engine('postgresql://', lambda sql, *args, **kwargs: statements.append(str(sql)))
+    monkeypatch.setattr(migrations, 'has_column', lambda conn, table, column: False)
+
+    for step in (migrations.add_client_goal_weight, migrations.add_client_deleted_at):
+        step(conn)
+    assert statements == ['ALTER TABLE client ADD COLUMN goal_weight FLOAT',
+                          'ALTER TABLE client ADD COLUMN deleted_at TIMESTAMP WITHOUT TIME ZONE']
+
+
+def test_duplicate_versions_are_rejected():
+    with pytest.raises(ValueError):
+        migrations.migration(1, 'again')(lambda conn: None)
+
+
+def test_cli_reports_and_applies_pending_steps(app):
+    from models import db
+
+    runner = app.test_cli_runner()
+    status = runner.invoke(args=['db-status'])
+    assert f'Schema version: {migrations.latest_version()}' in status.output
+    assert '[pending]' not in status.output
+    assert 'Schema is current' in runner.invoke(args=['db-upgrade']).output
+
+    # Forget the later steps; they run again over the existing tables
+    with app.app_context():
+        db.session.execute(migrations.schema_migrations.delete().where(migrations.schema_migrations.c.version > 5))
+        db.session.commit()
+    assert '     6 client.goal_weight [pending]' in runner.invoke(args=['db-status']).output
+    result = runner.invoke(args=['db-upgrade', '--target', '7'])
+    assert result.exit_code == 0, result.output
+    assert 'Applying migration 6: client.goal_weight' in result.output
+    assert 'schema is at version 7' in result.output
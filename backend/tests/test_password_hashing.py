@@ -0,0 +1,94 @@
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from werkzeug.security import check_password_hash
+
+from conftest import BASE_URL, PASSWORD, make_http, register
+
+
+@pytest.fixture
+def hashing(app, monkeypatch):
+    import password_hashing
+
+    monkeypatch.setattr(password_hashing, '_executor', None)
+    monkeypatch.setattr(password_hashing, '_slots', None)
+    yield password_hashing
+    if password_hashing._executor is not None:
+        password_hashing._executor.shutdown(wait=True)
+
+
+def login(http, username, password=PASSWORD):
+    return http.post('/api/auth/login', json={'username': username, 'password': password}, base_url=BASE_URL)
+
+
+def test_login_checks_and_upgrades_the_hash(app, anonymous, hashing):
+    from models import db, User
+
+    register(anonymous, 'coach')
+    assert login(make_http(app), 'coach', 'wrong').status_code == 401
+
+    app.config['PASSWORD_HASH_ITERATIONS'] = 2000
+    assert login(make_http(app), 'coach').status_code == 200
+    with app.app_context():
+        assert db.session.query(User.password_hash).filter_by(username='coach').scalar().startswith('pbkdf2:sha256:2000$')
+
+
+def test_full_queue_answers_503(app, anonymous, hashing):
+    app.config['HASH_QUEUE_LIMIT'] = 1
+    register(anonymous, 'coach')
+    with app.app_context():
+        _, slots = hashing._pool()
+    slots.acquire()
+    try:
+        response = login(make_http(app), 'coach')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        register_response = make_http(app).post('/api/auth/register', base_url=BASE_URL,
+                                                json={'username': 'new', 'email': 'new@example.com', 'password': 'x'})
+        assert register_response.status_code == 503
+    finally:
+        slots.release()
+    assert login(make_http(app), 'coach').status_code == 200
+
+
+class BrokenExecutor:
+    def __init__(self):
+        self.shut_down = threading.Event()
+
+    def submit(self, func, *args):
+        raise BrokenProcessPool('a worker died')
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down.set()
+
+
+def test_broken_pool_is_replaced(app, hashing, monkeypatch):
+    broken = BrokenExecutor()
+    app.config['HASH_POOL_WORKERS'] = 1
+    monkeypatch.setattr(hashing, '_executor', broken)
+
+    with app.app_context():
+        with pytest.raises(hashing.HashingBusy):
+            hashing.hash_password('secret')
+        assert broken.shut_down.is_set()
+        assert hashing._executor is None
+
+        # The next call starts a fresh pool, and the failed call gave its slot back
+        hashed = hashing.hash_password('secret')
+        assert hashing._executor is not None and hashing._executor is not broken
+        assert check_password_hash(hashed, 'secret')
+        assert hashing._slots._value == app.config['HASH_QUEUE_LIMIT']
+
+
+def test_set_password_goes_through_the_pool(app, hashing, monkeypatch):
+    from models import User
+
+    calls = []
+    real_run = hashing._run
+    monkeypatch.setattr(hashing, '_run', lambda func, *args: calls.append(func.__name__) or real_run(func, *args))
+    with app.app_context():
+        user = User(username='u', email='u@example.com')
+        user.set_password('secret')
+        assert user.check_password('secret') and not user.check_password('other')
+    assert calls == ['generate_password_hash', 'check_password_hash', 'check_password_hash']
@@ -0,0 +1,121 @@
+import sqlite3
+import time
+from datetime import date
+
+from config import Config
+from conftest import BASE_URL
+
+
+def counts(app, client_id):
+    from models import db, Client, ClientStats, WeightEntry
+
+    with app.app_context():
+        return (db.session.query(Client).filter_by(id=client_id).count(),
+                db.session.query(ClientStats).filter_by(client_id=client_id).count(),
+                db.session.query(WeightEntry).filter_by(client_id=client_id).count())
+
+
+def test_small_clients_are_deleted_in_the_request(app, anonymous, make_client, add_entries, test_user_id):
+    own = make_client(test_user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-02', 71)])
+
+    response = anonymous.delete(f'/api/clients/{own}', base_url=BASE_URL)
+    assert response.status_code == 200
+    assert counts(app, own) == (0, 0, 0)
+    assert anonymous.delete(f'/api/clients/{own}', base_url=BASE_URL).status_code == 404
+
+
+def test_large_clients_are_hidden_then_purged_in_the_background(app, anonymous, make_client, add_entries, test_user_id):
+    import purge
+    from models import db, Client
+
+    app.config['PURGE_SYNC_MAX_ENTRIES'] = 2
+    app.config['PURGE_CHUNK_SIZE'] = 2
+    own = make_client(test_user_id, email='big@example.com')
+    add_entries(own, [(date(2024, 1, day), 70) for day in range(1, 8)])
+
+    response = anonymous.delete(f'/api/clients/{own}', base_url=BASE_URL)
+    assert response.status_code == 202
+    assert response.get_json()['purge'] == 'scheduled' and response.get_json()['entries'] == 7
+    assert own not in [client['id'] for client in anonymous.get('/api/clients', base_url=BASE_URL).get_json()]
+
+    with app.app_context():
+        tombstones = db.session.query(Client).filter(Client.deleted_at.isnot(None))
+        deadline = time.monotonic() + 10
+        while tombstones.count() and time.monotonic() < deadline:
+            db.session.rollback()
+            time.sleep(0.05)
+        assert tombstones.count() == 0
+    assert counts(app, own) == (0, 0, 0)
+
+    # SQLite hands the freed id to the next client; a repeated purge of the old one must not touch it
+    reused = anonymous.post('/api/clients', json={'name': 'New', 'email': 'big@example.com'}, base_url=BASE_URL)
+    assert reused.get_json()['client']['id'] == own
+    with app.app_context():
+        assert purge.purge_client(own) == 0
+    assert counts(app, own) == (1, 1, 0)
+
+
+def test_tombstoning_frees_the_email(app, anonymous, make_client, test_user_id):
+    import purge
+    from models import db, Client
+
+    own = make_client(test_user_id, email='taken@example.com')
+    with app.app_context():
+        purge.tombstone(db.session.get(Client, own))
+        db.session.commit()
+    created = anonymous.post('/api/clients', json={'name': 'New', 'email': 'taken@example.com'}, base_url=BASE_URL)
+    assert created.status_code == 201
+
+
+def test_entries_written_during_a_purge_go_with_the_client(app, make_client, add_entries, test_user_id, monkeypatch):
+    import purge
+    from models import db, Client, WeightEntry
+
+    own = make_client(test_user_id)
+    add_entries(own, [(date(2024, 1, day), 70) for day in range(1, 6)])
+    real_chunk = purge.delete_entries_chunk
+    written = []
+
+    def chunk_then_write(client_id, chunk_size):
+        deleted = real_chunk(client_id, chunk_size)
+        if not written:
+            # A write that checked ownership before the tombstone landed
+            db.session.add(WeightEntry(client_id=client_id, weight=71, date=date(2024, 2, 1)))
+            written.append(True)
+        return deleted
+
+    monkeypatch.setattr(purge, 'delete_entries_chunk', chunk_then_write)
+    with app.app_context():
+        purge.tombstone(db.session.get(Client, own))
+        db.session.commit()
+        assert purge.purge_client(own, chunk_size=2) == 6
+    assert counts(app, own) == (0, 0, 0)
+
+
+def test_cli_purges_tombstones_and_orphaned_entries(app, make_client, add_entries, test_user_id):
+    import purge
+    from models import db, Client
+
+    own = make_client(test_user_id)
+    add_entries(own, [('2024-01-01', 70)])
+    with app.app_context():
+        purge.tombstone(db.session.get(Client, own))
+        db.session.commit()
+    # Left behind by an older version that purged without checking
+    raw = sqlite3.connect(Config.SQLALCHEMY_DATABASE_URI[len('sqlite:///'):])
+    raw.execute("INSERT INTO weight_entry (client_id, weight, date) VALUES (999999, 70, '2024-01-01')")
+    raw.commit()
+    raw.close()
+
+    result = app.test_cli_runner().invoke(args=['purge-deleted-clients'])
+    assert result.exit_code == 0, result.output
+    assert f'Purged client {own} (1 entries)' in result.output
+    assert '1 client(s) purged' in result.output
+    assert 'Removed 1 entries of clients that no longer exist' in result.output
+    assert counts(app, 999999)[2] == 0
+
+
+def test_other_users_clients_cannot_be_deleted(anonymous, make_client, login_as):
+    other = make_client(login_as('other').user_id)
+    assert anonymous.delete(f'/api/clients/{other}', base_url=BASE_URL).status_code == 403
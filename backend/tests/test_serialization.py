@@ -0,0 +1,53 @@
+import gzip
+import json
+from datetime import date, datetime
+
+import pytest
+
+from conftest import BASE_URL
+
+
+@pytest.fixture
+def history(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [(date(2024, 1, day), 70 + day / 10) for day in range(1, 29)])
+    return f'/api/weight/client/{own}'
+
+
+def test_large_lists_are_gzipped_when_accepted(client, history):
+    plain = client.get(history, base_url=BASE_URL)
+    assert 'Content-Encoding' not in plain.headers
+
+    compressed = client.get(history, headers={'Accept-Encoding': 'gzip, deflate'}, base_url=BASE_URL)
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert len(compressed.get_data()) < len(plain.get_data())
+    assert json.loads(gzip.decompress(compressed.get_data())) == plain.get_json()
+
+
+def test_small_and_error_responses_are_left_alone(app, client, history):
+    app.config['COMPRESS_MIN_SIZE'] = 10 ** 6
+    assert 'Content-Encoding' not in client.get(history, headers={'Accept-Encoding': 'gzip'}, base_url=BASE_URL).headers
+
+    app.config['COMPRESS_MIN_SIZE'] = 0
+    error = client.get(f'{history}?cursor=bad', headers={'Accept-Encoding': 'gzip'}, base_url=BASE_URL)
+    assert error.status_code == 400 and 'Content-Encoding' not in error.headers
+
+
+def test_dumps_encodes_dates_like_the_stdlib_fallback(monkeypatch):
+    import serialization
+
+    data = [{'id': 1, 'date': date(2024, 1, 2), 'created_at': datetime(2024, 1, 2, 3, 4, 5), 'weight': 70.5}]
+    fast = json.loads(serialization.dumps(data))
+    monkeypatch.setattr(serialization, 'orjson', None)
+    assert json.loads(serialization.dumps(data)) == fast
+    assert fast[0]['date'] == '2024-01-02' and fast[0]['created_at'] == '2024-01-02T03:04:05'
+    with pytest.raises(TypeError):
+        serialization.dumps({'value': object()})
+
+
+def test_rows_to_dicts():
+    from serialization import rows_to_dicts, ENTRY_FIELDS
+
+    assert rows_to_dicts([(1, 70.5, '2024-01-01', 3)], ENTRY_FIELDS) == [
+        {'id': 1, 'weight': 70.5, 'date': '2024-01-01', 'client_id': 3}]
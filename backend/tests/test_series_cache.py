@@ -0,0 +1,93 @@
+from array import array
+from datetime import date
+
+import series_cache
+from series_cache import ClientSeries, SeriesCache
+
+from conftest import BASE_URL
+
+
+def history(http, client_id):
+    return http.get(f'/api/weight/client/{client_id}', base_url=BASE_URL).get_json()
+
+
+def test_repeat_reads_are_served_from_the_cache(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-02', 71)])
+
+    first = history(client, own)
+    before = series_cache.cache.stats()
+    assert history(client, own) == first
+    after = series_cache.cache.stats()
+    assert after['hits'] == before['hits'] + 1 and after['misses'] == before['misses']
+    assert after['entries'] == 2 and after['bytes'] > 0
+
+
+def test_this_workers_writes_patch_the_cached_series(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-03', 72)])
+    history(client, own)
+
+    created = client.post('/api/weight', json={'client_id': own, 'weight': 71, 'date': '2024-01-02'}, base_url=BASE_URL)
+    entry_id = created.get_json()['entry']['id']
+    client.put(f'/api/weight/{entry_id}', json={'date': '2024-01-04', 'weight': 73}, base_url=BASE_URL)
+    first_id = history(client, own)[0]['id']
+    client.delete(f'/api/weight/{first_id}', base_url=BASE_URL)
+
+    misses = series_cache.cache.stats()['misses']
+    assert [(entry['date'], entry['weight']) for entry in history(client, own)] == [('2024-01-03', 72), ('2024-01-04', 73)]
+    assert series_cache.cache.stats()['misses'] == misses
+
+
+def test_changes_from_elsewhere_cause_a_reload(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70)])
+    history(client, own)
+
+    # Written without going through this worker's routes, as another worker would
+    add_entries(own, [('2024-01-02', 71)])
+    misses = series_cache.cache.stats()['misses']
+    assert [entry['weight'] for entry in history(client, own)] == [70, 71]
+    assert series_cache.cache.stats()['misses'] == misses + 1
+
+
+def series(client_id, version, entries):
+    return ClientSeries(client_id, version, array('q', [entry_id for entry_id, _, _ in entries]),
+                        array('i', [day.toordinal() for _, day, _ in entries]), array('d', [weight for _, _, weight in entries]))
+
+
+def test_cache_is_bounded_by_bytes():
+    one = series(1, 1, [(1, date(2024, 1, 1), 70)])
+    cache = SeriesCache(max_bytes=one.nbytes * 2)
+    cache.put(one)
+    cache.put(series(2, 1, [(2, date(2024, 1, 1), 70)]))
+    assert cache.get(1, 1) is one
+    cache.put(series(3, 1, [(3, date(2024, 1, 1), 70)]))
+    assert cache.get(2, 1) is None and cache.get(1, 1) is one
+    assert cache.stats()['evictions'] == 1 and cache.bytes == one.nbytes * 2
+
+    # Too big to cache at all
+    cache.put(series(4, 1, [(i, date(2024, 1, 1), 70) for i in range(100)]))
+    assert cache.get(4, 1) is None
+
+
+def test_patches_only_apply_one_version_ahead(monkeypatch):
+    cache = SeriesCache()
+    cache.put(series(1, 5, [(1, date(2024, 1, 1), 70), (3, date(2024, 1, 3), 72)]))
+    monkeypatch.setattr(series_cache, 'cache', cache)
+
+    series_cache.entry_added(1, 6, 2, date(2024, 1, 2), 71)
+    patched = cache.get(1, 6)
+    assert list(patched.ids) == [1, 2, 3] and list(patched.weights) == [70, 71, 72]
+    # A version in between was written elsewhere: drop the series rather than guess
+    series_cache.entry_removed(1, 8, 1, date(2024, 1, 1))
+    assert cache.get(1, 8) is None and cache.stats()['size'] == 0
+
+
+def test_keyset_position_within_a_day():
+    day = date(2024, 1, 1).toordinal()
+    entries = series(1, 1, [(1, date(2024, 1, 1), 70), (4, date(2024, 1, 1), 71), (2, date(2024, 1, 2), 72)])
+    lo, hi = entries.bounds(date(2024, 1, 1), date(2024, 1, 1))
+    assert (lo, hi) == (0, 2)
+    assert entries.after(0, 3, day, 1) == 1
+    assert entries.after(0, 3, day, 4) == 2
@@ -0,0 +1,118 @@
+import os
+
+import sparklines
+
+from conftest import BASE_URL
+
+
+def sparkline(http, client_id, headers=None, **query):
+    return http.get(f'/api/weight/client/{client_id}/sparkline.svg', query_string=query, headers=headers,
+                    base_url=BASE_URL)
+
+
+def test_a_client_sparkline_is_an_svg_polyline(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-02', 72), ('2024-01-03', 71)])
+
+    response = sparkline(client, own, width=60, height=20)
+    assert response.status_code == 200 and response.mimetype == 'image/svg+xml'
+    svg = response.get_data(as_text=True)
+    assert 'width="60" height="20"' in svg and svg.count('<polyline') == 1
+    # The heaviest day is the highest point
+    assert '30.0,2.0' in svg
+
+    assert sparkline(client, own, width=60, height=20,
+                     headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    # Sizes are clamped
+    assert 'width="600" height="8"' in sparkline(client, own, width=10000, height=1).get_data(as_text=True)
+
+
+def test_rendered_sparklines_are_reused_until_the_client_changes(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-02', 72)])
+
+    first = sparkline(client, own).get_data()
+    before = sparklines.cache.stats()
+    assert sparkline(client, own).get_data() == first
+    after = sparklines.cache.stats()
+    assert after['hits'] == before['hits'] + 1 and after['misses'] == before['misses']
+
+    add_entries(own, [('2024-01-03', 60)])
+    assert sparkline(client, own).get_data() != first
+    assert sparklines.cache.stats()['misses'] == after['misses'] + 1
+
+
+def test_many_sparklines_in_one_request(client, make_client, add_entries):
+    ann, bob = make_client(client.user_id), make_client(client.user_id)
+    add_entries(ann, [('2024-01-01', 70), ('2024-01-02', 72)])
+
+    response = client.get('/api/weight/sparklines', query_string={'client_ids': f'{bob},{ann},{bob}', 'width': 40},
+                          base_url=BASE_URL)
+    body = response.get_json()
+    assert [row['client_id'] for row in body['sparklines']] == [bob, ann]
+    assert body['width'] == 40 and '<polyline' in body['sparklines'][1]['svg']
+    assert '<polyline' not in body['sparklines'][0]['svg']
+    assert client.get('/api/weight/sparklines', query_string={'client_ids': f'{bob},{ann},{bob}', 'width': 40},
+                      headers={'If-None-Match': response.headers['ETag']}, base_url=BASE_URL).status_code == 304
+
+
+def test_invalid_requests_are_rejected(client, login_as, make_client, anonymous):
+    own = make_client(client.user_id)
+    other = make_client(login_as('other').user_id)
+
+    assert sparkline(client, own, width='wide').status_code == 400
+    assert sparkline(client, other).status_code == 403
+    assert sparkline(client, 999999).status_code == 404
+    assert sparkline(anonymous, own).status_code == 401
+    for query in ({}, {'client_ids': 'a'}, {'client_ids': ','.join(map(str, range(1, 502)))}):
+        assert client.get('/api/weight/sparklines', query_string=query, base_url=BASE_URL).status_code == 400
+    assert client.get('/api/weight/sparklines', query_string={'client_ids': f'{own},{other}'},
+                      base_url=BASE_URL).status_code == 403
+
+
+def test_the_disk_tier_is_shared_and_keeps_only_the_newest_version(app, login_as, make_client, add_entries, tmp_path):
+    directory = str(tmp_path / 'sparklines')
+    app.config['SPARKLINE_CACHE_DIR'] = directory
+    # The client routes run as testuser
+    client = login_as('testuser')
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-02', 72)])
+
+    first = sparkline(client, own).get_data()
+    assert len(os.listdir(directory)) == 1
+    # Another worker, with nothing in memory, reads the file
+    sparklines.cache.clear()
+    disk_hits = sparklines.cache.stats()['disk_hits']
+    assert sparkline(client, own).get_data() == first
+    assert sparklines.cache.stats()['disk_hits'] == disk_hits + 1
+
+    add_entries(own, [('2024-01-03', 71)])
+    sparkline(client, own)
+    files = os.listdir(directory)
+    assert len(files) == 1 and files[0] != f'{own}-0-120x32.svg'
+
+    client.delete(f'/api/clients/{own}', base_url=BASE_URL)
+    assert os.listdir(directory) == []
+
+
+def test_a_writer_that_is_behind_never_removes_newer_files(app, tmp_path):
+    directory = str(tmp_path / 'sparklines')
+    with app.app_context():
+        sparklines._write_disk(directory, (1, 5, 120, 32), b'<svg/>')
+        sparklines._write_disk(directory, (1, 3, 120, 32), b'<svg/>')
+        assert sorted(os.listdir(directory)) == ['1-5-120x32.svg']
+        sparklines._write_disk(directory, (1, 6, 120, 32), b'<svg/>')
+        sparklines._write_disk(directory, (11, 1, 120, 32), b'<svg/>')
+        sparklines._write_disk(directory, (1, 6, 60, 20), b'<svg/>')
+        assert sorted(os.listdir(directory)) == ['1-6-120x32.svg', '1-6-60x20.svg', '11-1-120x32.svg']
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    cache = sparklines.SparklineCache(max_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    cache.get('a')
+    cache.put('c', b'12345')
+    cache.put('d', b'x' * 11)
+    assert cache.get('b') is None and cache.get('d') is None
+    assert cache.get('a') == b'12345' and cache.stats()['bytes'] == 10
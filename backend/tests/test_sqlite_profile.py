@@ -0,0 +1,79 @@
+import pytest
+from flask import g
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from conftest import BASE_URL
+
+
+def pragma(connection, name):
+    return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+
+def test_connections_get_the_tuned_pragmas(app):
+    from models import db
+
+    with app.app_context():
+        write, read = db.engines[None], db.engines['read']
+        with write.connect() as connection:
+            assert pragma(connection, 'journal_mode') == 'wal'
+            assert pragma(connection, 'synchronous') == 1
+            assert pragma(connection, 'busy_timeout') == app.config['SQLITE_BUSY_TIMEOUT_MS']
+            assert pragma(connection, 'query_only') == 0
+        with read.connect() as connection:
+            assert pragma(connection, 'query_only') == 1
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql("DELETE FROM user")
+
+
+def test_writers_take_the_write_lock_up_front(app):
+    from models import db
+
+    statements = []
+    with app.app_context():
+        engine = db.engines[None]
+        event.listen(engine, 'before_cursor_execute', lambda conn, cursor, sql, *rest: statements.append(sql))
+        with engine.begin() as connection:
+            connection.exec_driver_sql('SELECT 1')
+    assert statements[0] == 'BEGIN IMMEDIATE'
+
+
+def test_read_only_routes_read_from_the_read_pool(app, client, make_client):
+    from models import db
+
+    own = make_client(client.user_id)
+    # The first request loads the logged-in user into the identity cache
+    client.get(f'/api/weight/client/{own}', base_url=BASE_URL)
+
+    seen = {'read': 0, 'write': 0}
+    with app.app_context():
+        for key, engine in (('read', db.engines['read']), ('write', db.engines[None])):
+            event.listen(engine, 'before_cursor_execute', lambda *args, key=key: seen.__setitem__(key, seen[key] + 1))
+
+    assert client.get(f'/api/weight/client/{own}?from=2024-01-01', base_url=BASE_URL).status_code == 200
+    assert seen['read'] > 0 and seen['write'] == 0
+
+
+def test_a_write_in_a_read_only_request_moves_to_the_primary(app, test_user_id):
+    from models import db, Client
+
+    with app.test_request_context('/'):
+        g.read_only = True
+        assert db.session.get_bind(clause=db.select(Client.id)) is db.engines['read']
+        db.session.add(Client(name='New', email='new@example.com', user_id=test_user_id))
+        db.session.flush()
+        assert g.read_only is False
+        assert db.session.get_bind(clause=db.select(Client.id)) is db.engines[None]
+        db.session.rollback()
+
+
+def test_profile_only_applies_to_sqlite_files(app):
+    import sqlite_profile
+
+    assert sqlite_profile.is_enabled(app)
+    for uri in ('sqlite:///:memory:', 'sqlite:///', 'postgresql://localhost/weights'):
+        app.config['SQLALCHEMY_DATABASE_URI'], original = uri, app.config['SQLALCHEMY_DATABASE_URI']
+        assert not sqlite_profile.is_enabled(app)
+        app.config['SQLALCHEMY_DATABASE_URI'] = original
+    app.config['SQLITE_TUNED'] = False
+    assert not sqlite_profile.is_enabled(app)
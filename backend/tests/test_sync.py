@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import BASE_URL
+
+
+def sync(http, **query):
+    return http.get('/api/sync', query_string=query, base_url=BASE_URL)
+
+
+def add(http, client_id, weight, day):
+    response = http.post('/api/weight', json={'client_id': client_id, 'weight': weight, 'date': day}, base_url=BASE_URL)
+    assert response.status_code == 201
+    return response.get_json()['entry']['id']
+
+
+@pytest.fixture
+def coach(login_as):
+    """Logged in as the account the client routes act for, so client writes show up in its log"""
+    return login_as('testuser')
+
+
+def test_first_sync_resets_then_follows_changes(coach):
+    start = sync(coach).get_json()
+    assert start['reset'] is True and start['has_more'] is False
+    cursor = start['cursor']
+
+    created = coach.post('/api/clients', json={'name': 'Ann', 'email': 'ann@example.com'}, base_url=BASE_URL)
+    client_id = created.get_json()['client']['id']
+    kept = add(coach, client_id, 70, '2024-01-01')
+    dropped = add(coach, client_id, 71, '2024-01-02')
+    coach.put(f'/api/weight/{kept}', json={'weight': 69.5}, base_url=BASE_URL)
+    coach.delete(f'/api/weight/{dropped}', base_url=BASE_URL)
+
+    page = sync(coach, since=cursor).get_json()
+    assert page['reset'] is False and page['has_more'] is False
+    assert [client['name'] for client in page['clients']] == ['Ann']
+    assert [(entry['id'], entry['weight']) for entry in page['entries']] == [(kept, 69.5)]
+    assert page['deleted_entries'] == [dropped] and page['deleted_clients'] == []
+
+    # Nothing new since the returned cursor
+    again = sync(coach, since=page['cursor']).get_json()
+    assert again['clients'] == [] and again['entries'] == [] and again['cursor'] == page['cursor']
+
+    coach.delete(f'/api/clients/{client_id}', base_url=BASE_URL)
+    gone = sync(coach, since=page['cursor']).get_json()
+    assert gone['deleted_clients'] == [client_id] and gone['entries'] == []
+
+
+def test_pages_follow_the_cursor(coach, client):
+    cursor = sync(coach).get_json()['cursor']
+    client_id = coach.post('/api/clients', json={'name': 'Ann', 'email': 'ann@example.com'}, base_url=BASE_URL).get_json()['client']['id']
+    entry_ids = [add(coach, client_id, 70 + day, f'2024-01-{day:02d}') for day in range(1, 6)]
+
+    seen = []
+    while True:
+        page = sync(coach, since=cursor, limit=2).get_json()
+        seen += [entry['id'] for entry in page['entries']]
+        cursor = page['cursor']
+        if not page['has_more']:
+            break
+    assert seen == entry_ids
+
+    # Another user's log is separate
+    assert sync(client, since=0).get_json()['entries'] == []
+
+
+def test_cursors_behind_retention_must_reset(app, coach):
+    from models import db, ChangeLog
+    import changelog
+
+    client_id = coach.post('/api/clients', json={'name': 'Ann', 'email': 'ann@example.com'}, base_url=BASE_URL).get_json()['client']['id']
+    first = add(coach, client_id, 70, '2024-01-01')
+    add(coach, client_id, 71, '2024-01-02')
+    coach.put(f'/api/weight/{first}', json={'weight': 72}, base_url=BASE_URL)
+
+    with app.app_context():
+        db.session.query(ChangeLog).update({'created_at': datetime.utcnow() - timedelta(days=30)})
+        db.session.commit()
+        # Superseded rows go, the entries' latest rows stay
+        assert changelog.compact(datetime.utcnow() - timedelta(days=7), datetime.utcnow() - timedelta(days=90)) == (1, 0)
+    assert len(sync(coach, since=0).get_json()['entries']) == 2
+
+    result = app.test_cli_runner().invoke(args=['compact-change-log'])
+    assert 'Removed 0 superseded and 0 expired' in result.output
+    app.config['SYNC_RETENTION_DAYS'] = 10
+    result = app.test_cli_runner().invoke(args=['compact-change-log'])
+    assert 'Removed 0 superseded and 3 expired' in result.output
+
+    stale = sync(coach, since=0).get_json()
+    assert stale['reset'] is True
+    assert sync(coach, since=stale['cursor']).get_json()['reset'] is False
+
+
+def test_invalid_parameters_are_rejected(client, anonymous):
+    assert sync(client, since='latest').status_code == 400
+    assert sync(client, limit='all').status_code == 400
+    assert sync(anonymous).status_code == 401
@@ -0,0 +1,58 @@
+from sqlalchemy import event
+
+import series_cache
+
+from conftest import BASE_URL
+
+
+def batch(http, **query):
+    return http.get('/api/weight/batch', query_string=query, base_url=BASE_URL)
+
+
+def test_several_clients_in_request_order(client, make_client, add_entries):
+    ann, bob, cid = (make_client(client.user_id) for _ in range(3))
+    add_entries(ann, [('2024-01-01', 70), ('2024-02-01', 69)])
+    add_entries(bob, [('2024-01-15', 80)])
+
+    body = batch(client, client_ids=f'{bob},{ann},{cid},{bob}').get_json()
+    assert [row['client_id'] for row in body['clients']] == [bob, ann, cid]
+    assert [entry['weight'] for entry in body['clients'][1]['entries']] == [70, 69]
+    assert body['clients'][2]['entries'] == []
+
+    january = batch(client, client_ids=[ann, bob], to='2024-01-31').get_json()
+    assert [len(row['entries']) for row in january['clients']] == [1, 1]
+
+
+def test_uncached_clients_load_in_one_query(app, client, make_client, add_entries):
+    from models import db
+
+    ids = [make_client(client.user_id) for _ in range(5)]
+    for own in ids:
+        add_entries(own, [('2024-01-01', 70), ('2024-01-02', 71)])
+    batch(client, client_ids=ids[0])
+    series_cache.cache.clear()
+    batch(client, client_ids=ids[0])
+
+    statements = []
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', lambda conn, cursor, sql, *rest: statements.append(sql))
+    body = batch(client, client_ids=','.join(map(str, ids))).get_json()
+    assert sum(len(row['entries']) for row in body['clients']) == 10
+    # One ownership/version query and one for the four clients that weren't cached
+    assert len([sql for sql in statements if 'FROM weight_entry' in sql]) == 1
+    assert len([sql for sql in statements if 'FROM client' in sql]) == 1
+    assert series_cache.cache.stats()['size'] == 5
+
+
+def test_errors(client, make_client, login_as):
+    own = make_client(client.user_id)
+    other = make_client(login_as('other').user_id)
+
+    missing = batch(client, client_ids=f'{own},999999')
+    assert missing.status_code == 404 and missing.get_json()['client_ids'] == [999999]
+    assert batch(client, client_ids=f'{own},{other}').status_code == 403
+    assert batch(client).status_code == 400
+    assert batch(client, client_ids='1,two').status_code == 400
+    assert batch(client, client_ids=','.join(str(i) for i in range(1, 102))).status_code == 400
+    assert batch(client, client_ids=own, **{'from': 'Monday'}).status_code == 400
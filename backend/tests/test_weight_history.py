@@ -0,0 +1,55 @@
+from datetime import date, timedelta
+
+from conftest import BASE_URL
+
+
+def history(http, client_id, **query):
+    return http.get(f'/api/weight/client/{client_id}', query_string=query, base_url=BASE_URL)
+
+
+def test_cursor_pages_cover_the_range_once_in_order(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    # Two entries a day, so pages break between entries of the same date
+    add_entries(own, [(date(2024, 1, 1) + timedelta(days=i // 2), 70 + i % 3) for i in range(300)])
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        query = {'limit': 40, 'from': '2024-02-01', 'to': '2024-03-31'}
+        if cursor:
+            query['cursor'] = cursor
+        page = history(client, own, **query).get_json()
+        seen += page['entries']
+        pages += 1
+        cursor = page['next_cursor']
+        assert page['has_more'] == (cursor is not None)
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert len(seen) == 2 * 60
+    assert len({entry['id'] for entry in seen}) == len(seen)
+    assert [(entry['date'], entry['id']) for entry in seen] == sorted((entry['date'], entry['id']) for entry in seen)
+    assert seen[0]['date'] == '2024-02-01' and seen[-1]['date'] == '2024-03-31'
+
+
+def test_without_limit_returns_the_plain_list(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70), ('2024-01-05', 71), ('2024-01-09', 72)])
+
+    everything = history(client, own).get_json()
+    assert [entry['weight'] for entry in everything] == [70, 71, 72]
+    in_range = history(client, own, **{'from': '2024-01-02', 'to': '2024-01-09'}).get_json()
+    assert [entry['date'] for entry in in_range] == ['2024-01-05', '2024-01-09']
+
+
+def test_invalid_parameters_are_rejected(client, make_client):
+    own = make_client(client.user_id)
+    assert history(client, own, cursor='not-a-cursor').status_code == 400
+    assert history(client, own, limit='ten').status_code == 400
+    assert history(client, own, **{'from': '01/02/2024'}).status_code == 400
+
+
+def test_other_users_clients_are_not_readable(client, make_client, login_as):
+    other = make_client(login_as('other').user_id)
+    assert history(client, other).status_code == 403
+    assert history(client, 999999).status_code == 404
@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+
+from conftest import BASE_URL
+
+
+def series(http, client_id, **query):
+    return http.get(f'/api/weight/client/{client_id}/series', query_string=query, base_url=BASE_URL)
+
+
+def test_lttb_keeps_the_endpoints_and_requested_point_count(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [(date(2020, 1, 1) + timedelta(days=i), 90 - i * 0.01) for i in range(1000)])
+
+    body = series(client, own, points=50).get_json()
+    assert body['method'] == 'lttb' and body['total_entries'] == 1000
+    assert len(body['points']) == 50
+    assert body['points'][0] == {'date': '2020-01-01', 'weight': 90.0}
+    assert body['points'][-1]['date'] == (date(2020, 1, 1) + timedelta(days=999)).isoformat()
+
+
+def test_minmax_buckets_in_pounds(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [(date(2021, 1, 1) + timedelta(days=i), 80 + i % 2) for i in range(365)])
+
+    body = series(client, own, points=12, method='minmax', unit='lbs', **{'from': '2021-01-01', 'to': '2021-12-31'}).get_json()
+    assert body['unit'] == 'lbs'
+    assert len(body['points']) == 12
+    assert sum(point['count'] for point in body['points']) == 365
+    first = body['points'][0]
+    assert first['date'] == '2021-01-01'
+    assert first['min'] < first['mean'] < first['max']
+    assert abs(first['max'] - 81 * 2.20462) < 0.1
+
+
+def test_empty_range_returns_no_points(client, make_client, add_entries):
+    own = make_client(client.user_id)
+    add_entries(own, [('2024-01-01', 70)])
+
+    for method in ('lttb', 'minmax'):
+        body = series(client, own, method=method, **{'from': '2030-01-01'}).get_json()
+        assert body['total_entries'] == 0 and body['points'] == []
+
+
+def test_invalid_parameters_are_rejected(client, make_client):
+    own = make_client(client.user_id)
+    assert series(client, own, method='mean').status_code == 400
+    assert series(client, own, unit='stone').status_code == 400
+    assert series(client, own, points='many').status_code == 400
+    assert series(client, own, to='yesterday').status_code == 400
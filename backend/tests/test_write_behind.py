@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from conftest import BASE_URL
+
+
+@pytest.fixture
+def queued(app):
+    app.config['WRITE_BEHIND'] = True
+    # Long enough that only a full group or shutdown writes
+    app.config['WRITE_BEHIND_INTERVAL_MS'] = 10000
+    return app
+
+
+def post(http, client_id, weight, day, **query):
+    return http.post('/api/weight', query_string=query, base_url=BASE_URL,
+                     json={'client_id': client_id, 'weight': weight, 'date': day})
+
+
+def entries(app, client_id):
+    from models import db, WeightEntry
+
+    with app.app_context():
+        return [weight for weight, in db.session.query(WeightEntry.weight).filter_by(client_id=client_id).order_by(WeightEntry.date)]
+
+
+def test_queued_rows_are_written_as_one_group_on_shutdown(queued, client, make_client):
+    import write_behind
+
+    own = make_client(client.user_id)
+    for day, weight in enumerate((70, 71, 72), start=1):
+        response = post(client, own, weight, f'2024-01-0{day}')
+        assert response.status_code == 202 and 'id' not in response.get_json()['entry']
+    assert entries(queued, own) == []
+
+    write_behind.shutdown()
+    assert entries(queued, own) == [70, 71, 72]
+    stats = write_behind.writer.stats()
+    assert (stats['written'], stats['batches'], stats['failed']) == (3, 1, 0)
+    summary = client.get(f'/api/weight/client/{own}/summary', base_url=BASE_URL).get_json()
+    assert summary['entry_count'] == 3 and summary['current_weight'] == 72
+
+    # A worker on its way out takes no more rows
+    assert post(client, own, 73, '2024-01-04').status_code == 503
+
+
+def test_waiting_requests_get_the_committed_id(queued, client, make_client):
+    queued.config['WRITE_BEHIND_INTERVAL_MS'] = 1
+    own = make_client(client.user_id)
+    response = post(client, own, 70, '2024-01-01', wait=1)
+    assert response.status_code == 201
+    entry_id = response.get_json()['entry']['id']
+    assert client.get(f'/api/weight/client/{own}', base_url=BASE_URL).get_json()[0]['id'] == entry_id
+
+
+def test_a_full_queue_answers_503(queued, client, make_client, monkeypatch):
+    import write_behind
+
+    queued.config['WRITE_BEHIND_QUEUE_SIZE'] = 1
+    queued.config['WRITE_BEHIND_MAX_ROWS'] = 1
+    release = threading.Event()
+    real_write = write_behind.writer._write
+    monkeypatch.setattr(write_behind.writer, '_write', lambda items: release.wait(10) and real_write(items))
+    own = make_client(client.user_id)
+
+    statuses = [post(client, own, 70 + day, f'2024-01-0{day}').status_code for day in range(1, 5)]
+    assert 503 in statuses and statuses.index(503) <= 2
+    assert write_behind.writer.stats()['rejected'] >= 1
+    release.set()
+    write_behind.shutdown()
+    assert len(entries(queued, own)) == statuses.count(202)
+
+
+def test_rows_for_a_client_deleted_before_the_flush_fail_alone(queued, client, make_client):
+    import identity_cache
+    import purge
+    import write_behind
+    from models import db, Client
+
+    kept = make_client(client.user_id)
+    deleted = make_client(client.user_id)
+    assert post(client, kept, 70, '2024-01-01').status_code == 202
+    assert post(client, deleted, 80, '2024-01-01').status_code == 202
+    with queued.app_context():
+        purge.tombstone(db.session.get(Client, deleted))
+        db.session.commit()
+
+    write_behind.shutdown()
+    assert entries(queued, kept) == [70] and entries(queued, deleted) == []
+    assert write_behind.writer.stats()['failed'] == 1
+    assert identity_cache.owner_cache.get(deleted) is None
+
+
+def test_a_waiting_request_sees_the_failure(queued, client, make_client):
+    import identity_cache
+    import purge
+    from models import db, Client
+
+    queued.config['WRITE_BEHIND_INTERVAL_MS'] = 1
+    own = make_client(client.user_id)
+    client.get(f'/api/weight/client/{own}', base_url=BASE_URL)
+    with queued.app_context():
+        purge.tombstone(db.session.get(Client, own))
+        db.session.commit()
+    # This worker's cache still says the client exists; the flush checks again
+    identity_cache.owner_cache.set(own, client.user_id)
+    assert post(client, own, 70, '2024-01-01', wait=1).status_code == 500
+    assert entries(queued, own) == []
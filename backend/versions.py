@@ -0,0 +1,86 @@
+"""
+Per-user and per-client version counters for conditional GETs.
+
+Write routes bump the counters in the same transaction as their change. Read
+routes build an ETag from the counter (plus the query string) and answer a
+matching If-None-Match / If-Modified-Since with 304 after one primary-key
+lookup, without touching the entries table or serializing anything.
+"""
+import hashlib
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import request, make_response
+from sqlalchemy.exc import IntegrityError
+from models import db, DataVersion
+import coalesce
+
+
+def bump(scope, key):
+    """Increment a counter, creating it on first write"""
+    now = datetime.utcnow()
+    if scope == 'user':
+        # Reads of this user's data that are still running predate the change
+        coalesce.touch(key)
+    updated = db.session.query(DataVersion).filter_by(scope=scope, key=key) \
+        .update({'version': DataVersion.version + 1, 'updated_at': now}, synchronize_session=False)
+    if updated:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(DataVersion(scope=scope, key=key, version=1, updated_at=now))
+    except IntegrityError:
+        # Another request created it first
+        db.session.query(DataVersion).filter_by(scope=scope, key=key) \
+            .update({'version': DataVersion.version + 1, 'updated_at': now}, synchronize_session=False)
+
+
+def version_of(scope, key):
+    """Current counter value (0 if never bumped)"""
+    return db.session.query(DataVersion.version).filter_by(scope=scope, key=key).scalar() or 0
+
+
+def bump_client(client_id, user_id):
+    """
+    A client's data changed; the owner's client list (with stats) changed too.
+    Returns the client's new version, read inside the same transaction.
+    """
+    bump('client', client_id)
+    if user_id is not None:
+        bump('user', user_id)
+    return version_of('client', client_id)
+
+
+class Validators:
+    """ETag / Last-Modified for one versioned resource and the current request"""
+
+    def __init__(self, scope, key, extra=()):
+        row = db.session.query(DataVersion.version, DataVersion.updated_at) \
+            .filter_by(scope=scope, key=key).first()
+        self.version, self.last_modified = row if row else (0, None)
+
+        # Different query parameters (in any order) are different representations of the resource
+        params = urlencode(sorted(request.args.items(multi=True)))
+        variant = hashlib.sha1(
+            '|'.join([request.path, params] + [str(part) for part in extra]).encode()
+        ).hexdigest()[:12]
+        self.etag = f'{scope}-{key}-v{self.version}-{variant}'
+
+    def not_modified(self):
+        """True if the client's cached copy is still current"""
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(self.etag)
+        if request.if_modified_since and self.last_modified:
+            return self.last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+        return False
+
+    def apply(self, response):
+        response = make_response(response)
+        response.set_etag(self.etag, weak=True)
+        if self.last_modified:
+            response.last_modified = self.last_modified
+        # Let browsers keep a copy but always revalidate it
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def not_modified_response(self):
+        return self.apply(('', 304))
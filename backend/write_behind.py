@@ -0,0 +1,199 @@
+"""
+Write-behind batching for single weight entries.
+
+With WRITE_BEHIND on, POST /api/weight validates the entry, puts it on a
+bounded per-worker queue and answers 202 straight away. A flusher thread
+drains the queue into grouped multi-row INSERTs (bulk_import.write_rows, so
+stats, the change log and data versions stay in step) and commits each group
+as one transaction. A group is written once it has WRITE_BEHIND_MAX_ROWS
+rows or its first row has waited WRITE_BEHIND_INTERVAL_MS, so a burst of
+readings costs one commit instead of one each.
+
+- Backpressure: past WRITE_BEHIND_QUEUE_SIZE queued rows, submit() raises
+  QueueFull and the route answers 503 with Retry-After.
+- Durability: with WRITE_BEHIND_WAIT (or ?wait=1 on the request) the route
+  waits for the commit of its group and answers 201 with the entry id.
+  Otherwise a worker crash can lose rows that were acknowledged but not
+  yet written.
+- Shutdown: gunicorn's worker_exit hook calls shutdown(), which stops
+  accepting rows and flushes what is queued.
+- A group that fails is retried row by row, so one bad row (say, for a
+  client deleted in the meantime) doesn't take the others down with it.
+"""
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from flask import current_app
+from models import db, Client
+from identity_cache import client_deleted
+
+_STOP = object()
+
+
+class QueueFull(Exception):
+    """Raised when the write-behind queue is at capacity"""
+
+
+class WriteBehind:
+    """A bounded queue of pending weight entries and the thread that flushes it"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._closed = False
+        self.written = 0
+        self.failed = 0
+        self.rejected = 0
+        self.batches = 0
+
+    def _ensure_started(self, app):
+        # Started lazily so each forked gunicorn worker gets its own queue and thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            config = app.config
+            self._queue = queue.Queue(maxsize=config.get('WRITE_BEHIND_QUEUE_SIZE', 10000))
+            self._closed = False
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(app, config.get('WRITE_BEHIND_MAX_ROWS', 500), config.get('WRITE_BEHIND_INTERVAL_MS', 50) / 1000),
+                daemon=True, name='write-behind'
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def submit(self, app, user_id, values, upsert=False):
+        """Queue one validated row; returns a Future resolved with its entry id once committed"""
+        self._ensure_started(app)
+        if self._closed:
+            raise QueueFull('Worker is shutting down')
+        future = Future()
+        try:
+            self._queue.put_nowait((user_id, values, upsert, future))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFull('Write queue is full')
+        return future
+
+    def _take(self, max_rows, interval):
+        """Block for the first row, then gather more until max_rows or the interval is up"""
+        batch = [self._queue.get()]
+        if batch[0] is _STOP:
+            return batch
+        deadline = time.monotonic() + interval
+        while len(batch) < max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _run(self, app, max_rows, interval):
+        while True:
+            batch = self._take(max_rows, interval)
+            stop = batch[-1] is _STOP
+            items = [item for item in batch if item is not _STOP]
+            if items:
+                with app.app_context():
+                    try:
+                        self._write(items)
+                    finally:
+                        db.session.remove()
+            if stop:
+                return
+
+    def _write(self, items):
+        from bulk_import import write_rows
+
+        try:
+            entry_ids = self._write_group(items, write_rows)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Write-behind group of {len(items)} failed, retrying row by row: {str(e)}")
+            for item in items:
+                try:
+                    entry_id, = self._write_group([item], write_rows)
+                except Exception as row_error:
+                    db.session.rollback()
+                    self.failed += 1
+                    current_app.logger.error(f"Error writing queued weight entry {item[1]}: {str(row_error)}")
+                    item[3].set_exception(row_error)
+                else:
+                    item[3].set_result(entry_id)
+            return
+        for item, entry_id in zip(items, entry_ids):
+            item[3].set_result(entry_id)
+
+    def _write_group(self, items, write_rows):
+        """Write items in one transaction (one statement per user and mode); returns ids in item order"""
+        # A client can be deleted between the request and the flush
+        wanted = {(user_id, values['client_id']) for user_id, values, _, _ in items}
+        live = set(
+            db.session.query(Client.user_id, Client.id)
+            .filter(Client.id.in_({client_id for _, client_id in wanted}), Client.deleted_at.is_(None))
+        )
+        missing = wanted - live
+        if missing:
+            for _, client_id in missing:
+                # This worker's cached owner let the request through; drop it
+                client_deleted(client_id)
+            raise LookupError(f'Client not found: {sorted(client_id for _, client_id in missing)}')
+
+        groups = defaultdict(list)
+        for index, (user_id, values, upsert, _) in enumerate(items):
+            groups[(user_id, upsert)].append(index)
+        entry_ids = [None] * len(items)
+        for (user_id, upsert), indexes in groups.items():
+            written = write_rows(user_id, [items[i][1] for i in indexes], upsert)
+            for i, entry_id in zip(indexes, written):
+                entry_ids[i] = entry_id
+        db.session.commit()
+        self.written += len(items)
+        self.batches += 1
+        return entry_ids
+
+    def shutdown(self, timeout=30):
+        """Stop accepting rows and wait for the queued ones to be written"""
+        with self._lock:
+            if self._pid != os.getpid() or self._closed:
+                return
+            self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'written': self.written,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'batches': self.batches
+        }
+
+
+writer = WriteBehind()
+
+
+def enabled():
+    return bool(current_app.config.get('WRITE_BEHIND'))
+
+
+def submit(user_id, values, upsert=False):
+    return writer.submit(current_app._get_current_object(), user_id, values, upsert)
+
+
+def shutdown(timeout=30):
+    writer.shutdown(timeout)
@@ -1,10 +1,11 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 // Use test API for all operations
-import { getClients, addClient, deleteClient } from '../services/test-api';
+import { getClients, addClient, deleteClient, getSparklines } from '../services/test-api';
 
 const ClientList = () => {
   const [clients, setClients] = useState([]);
+  const [sparklines, setSparklines] = useState({});
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [showForm, setShowForm] = useState(false);
@@ -20,6 +21,7 @@ const ClientList = () => {
       const response = await getClients();
       setClients(response.data);
       setError(null);
+      fetchSparklines(response.data);
     } catch (err) {
       setError('Error fetching clients. Please try again later.');
       console.error('Error fetching clients:', err);
@@ -28,6 +30,24 @@ const ClientList = () => {
     }
   };
 
+  // One request for the whole list; the server renders and caches the images
+  const fetchSparklines = async (clientList) => {
+    if (clientList.length === 0) {
+      return;
+    }
+    try {
+      const response = await getSparklines(clientList.map(client => client.id));
+      const byClient = {};
+      response.data.sparklines.forEach(({ client_id, svg }) => {
+        byClient[client_id] = `data:image/svg+xml;charset=utf-8,${encodeURIComponent(svg)}`;
+      });
+      setSparklines(byClient);
+    } catch (err) {
+      // The list is still usable without trends
+      console.error('Error fetching sparklines:', err);
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
 
@@ -153,6 +173,9 @@ const ClientList = () => {
                       <p className="text-sm text-gray-500 truncate">{client.email}</p>
                     </div>
                     <div className="flex items-center">
+                      {sparklines[client.id] && (
+                        <img src={sparklines[client.id]} alt="Weight trend" width={120} height={32} className="mr-4" />
+                      )}
                       <button
                         onClick={(e) => handleDeleteClient(client.id, e)}
                         className="text-red-600 hover:text-red-900 mr-4"
@@ -20,15 +20,23 @@ export const logout = () => api.post('/auth/logout');
 export const getCurrentUser = () => api.get('/auth/user');
 
 // Client endpoints
-export const getClients = () => api.get('/clients');
+export const getClients = (params) => api.get('/clients', { params });
 export const getClient = (clientId) => api.get(`/clients/${clientId}`);
+export const getClientsAnalytics = (params) => api.get('/clients/analytics', { params });
+export const getClientsCohort = (params) => api.get('/clients/cohort', { params });
+export const searchClients = (q, params) => api.get('/clients/search', { params: { q, ...params } });
 export const addClient = (clientData) => api.post('/clients', clientData);
 export const deleteClient = (clientId) => api.delete(`/clients/${clientId}`);
 
 // Weight entry endpoints
-export const getWeightEntries = (clientId) => api.get(`/weight/client/${clientId}`);
+export const getWeightEntries = (clientId, params) => api.get(`/weight/client/${clientId}`, { params });
+export const getWeightSeries = (clientId, params) => api.get(`/weight/client/${clientId}/series`, { params });
+export const getWeightEntriesBatch = (clientIds, params) => api.get('/weight/batch', { params: { client_ids: clientIds.join(','), ...params } });
+export const getSparklines = (clientIds, params) => api.get('/weight/sparklines', { params: { client_ids: clientIds.join(','), ...params } });
+export const getWeightAnalytics = (clientId, params) => api.get(`/weight/client/${clientId}/analytics`, { params });
 export const addWeightEntry = (weightData) => api.post('/weight', weightData);
 export const updateWeightEntry = (entryId, weightData) => api.put(`/weight/${entryId}`, weightData);
 export const deleteWeightEntry = (entryId) => api.delete(`/weight/${entryId}`);
+export const getChanges = (since, params) => api.get('/sync', { params: { since, ...params } });
 
 export default api;
@@ -319,6 +319,41 @@ export const getWeightEntries = (clientId) => {
   return Promise.resolve({ data: entries });
 };
 
+// Get trend sparklines (SVG markup) for several clients, like GET /api/weight/sparklines
+export const getSparklines = (clientIds, { width = 120, height = 32 } = {}) => {
+  if (!currentUser) {
+    return Promise.reject({
+      response: {
+        status: 401,
+        data: { error: 'Authentication required' }
+      }
+    });
+  }
+
+  const sparklines = clientIds.map((clientId) => {
+    const entries = [...(mockWeightEntries[clientId] || [])].sort((a, b) => a.date.localeCompare(b.date));
+    let shape = '';
+    if (entries.length > 1) {
+      const xs = entries.map(e => new Date(e.date).getTime());
+      const ys = entries.map(e => e.weight);
+      const xSpan = (xs[xs.length - 1] - xs[0]) || 1;
+      const yLow = Math.min(...ys);
+      const ySpan = Math.max(...ys) - yLow;
+      const points = entries.map((e, i) => {
+        const x = 2 + (xs[i] - xs[0]) / xSpan * (width - 4);
+        const y = ySpan ? 2 + (1 - (ys[i] - yLow) / ySpan) * (height - 4) : height / 2;
+        return `${x.toFixed(1)},${y.toFixed(1)}`;
+      });
+      shape = `<polyline fill="none" stroke="#3b82f6" stroke-width="1.5" stroke-linejoin="round" points="${points.join(' ')}"/>`;
+    }
+    return {
+      client_id: clientId,
+      svg: `<svg xmlns="http://www.w3.org/2000/svg" width="${width}" height="${height}" viewBox="0 0 ${width} ${height}">${shape}</svg>`
+    };
+  });
+  return Promise.resolve({ data: { width, height, sparklines } });
+};
+
 // Add a weight entry
 export const addWeightEntry = (weightData) => {
   // Check if user is authenticated